@@ -0,0 +1,125 @@
+"""Compare the numpy backend with SoX: image parity and throughput
+
+Usage: python benchmarks/backend_parity.py [--sox-path PATH] [--files N] [--duration SECONDS]
+
+Synthesizes FLAC files, renders raw (axis-less, monochrome) spectrograms with
+both SoX and the numpy backend and reports how closely the pixel levels
+agree. Then times both backends on the same files with the current
+settings. Needs SoX, numpy, Pillow and soundfile.
+"""
+import os
+import sys
+import time
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from red_spectrogram.config import DEFAULT_SETTINGS, WINDOW_TYPES, default_config, find_sox_path
+from red_spectrogram.engine import SpectrogramEngine, parameters_from_config
+from red_spectrogram.numpy_backend import read_audio, spectrogram_levels
+
+from corpus import synthesize
+
+# Minimum correlation between SoX and numpy levels to consider them equivalent
+MIN_CORRELATION = 0.9
+
+
+def sox_raw_levels(sox_path, file_path, width, height, z_range, window_type, work_dir):
+    """Render a raw monochrome spectrogram with SoX and read it back as levels"""
+    output = os.path.join(work_dir, "sox_raw.png")
+    subprocess.run([sox_path, file_path, "-n", "remix", "1", "spectrogram", "-r", "-m",
+                    "-x", str(width), "-y", str(height), "-z", str(z_range), "-w", window_type,
+                    "-o", output], check=True, capture_output=True)
+    image = np.asarray(Image.open(output).convert("L"), dtype=np.float32) / 255
+    # SoX puts the highest frequency on the first row
+    return image[::-1]
+
+
+def compare(sox_path, file_path, work_dir):
+    """Compare SoX and numpy levels for every window type"""
+    width = int(DEFAULT_SETTINGS["width"])
+    height = int(DEFAULT_SETTINGS["height"])
+    z_range = int(DEFAULT_SETTINGS["z_range"])
+    samples, sample_rate, _ = read_audio(file_path)
+
+    report = {}
+    for window_type in WINDOW_TYPES:
+        expected = sox_raw_levels(sox_path, file_path, width, height, z_range, window_type, work_dir)
+        actual = spectrogram_levels(samples, sample_rate, width, height, z_range, window_type)
+
+        # SoX may drop or add a column at the end, compare the common area
+        columns = min(expected.shape[1], actual.shape[1])
+        rows = min(expected.shape[0], actual.shape[0])
+        expected = expected[:rows, :columns]
+        actual = actual[:rows, :columns]
+
+        report[window_type] = {
+            "correlation": round(float(np.corrcoef(expected.ravel(), actual.ravel())[0, 1]), 4),
+            "mean_abs_difference": round(float(np.abs(expected - actual).mean()), 4)
+        }
+    return report
+
+
+def throughput(backend, sox_path, files, output_folder, workers):
+    """Time a batch of full and zoomed spectrograms with one backend"""
+    params = parameters_from_config(default_config(output_folder, sox_path))
+    params.update({"normal": True, "zoom": True, "workers": workers, "backend": backend})
+
+    start = time.perf_counter()
+    results = SpectrogramEngine(params).run_batch(files)
+    elapsed = time.perf_counter() - start
+
+    failed = [result["error"] for result in results if result["status"] != "ok"]
+    return {
+        "seconds": round(elapsed, 3),
+        "files_per_second": round(len(files) / elapsed, 3),
+        "failed": len(failed),
+        "errors": failed[:3]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sox-path", default=None, help="path of the SoX executable")
+    parser.add_argument("--files", type=int, default=8, help="number of files for the throughput run")
+    parser.add_argument("--duration", type=float, default=120.0, help="duration of each test file in seconds")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="parallel jobs")
+    args = parser.parse_args()
+
+    sox_path = args.sox_path or find_sox_path()
+    if not os.path.exists(sox_path):
+        parser.error(f"SoX was not found: {sox_path}")
+
+    work_dir = tempfile.mkdtemp(prefix="red-spectrogram-parity-")
+    try:
+        files = []
+        for i in range(args.files):
+            path = os.path.join(work_dir, f"track{i:02d}.flac")
+            synthesize(path, args.duration, seed=i)
+            files.append(path)
+
+        parity = compare(sox_path, files[0], work_dir)
+        report = {
+            "parity": parity,
+            "throughput": {
+                backend: throughput(backend, sox_path, files, os.path.join(work_dir, backend), args.jobs)
+                for backend in ("sox", "numpy")
+            }
+        }
+        print(json.dumps(report, indent=2))
+
+        worst = min(result["correlation"] for result in parity.values())
+        return 0 if worst >= MIN_CORRELATION else 1
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
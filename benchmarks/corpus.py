@@ -0,0 +1,74 @@
+"""Synthetic FLAC corpus for the benchmarks
+
+The files mix tones, a sweep and low-passed noise so that spectrograms have
+realistic content, and cover the range of durations, sample rates, bit
+depths and channel counts found in a music library.
+"""
+import os
+
+import numpy as np
+import soundfile
+
+# (duration in seconds, sample rate, bit depth, channels)
+FULL_CORPUS = [
+    (30, 44100, 16, 1),
+    (240, 44100, 16, 2),
+    (240, 48000, 24, 2),
+    (240, 88200, 24, 2),
+    (240, 96000, 24, 2),
+    (240, 176400, 24, 2),
+    (240, 192000, 24, 2),
+    (1200, 44100, 16, 2),
+    (1200, 96000, 24, 2)
+]
+
+QUICK_CORPUS = [
+    (30, 44100, 16, 1),
+    (120, 44100, 16, 2),
+    (120, 96000, 24, 2)
+]
+
+SUBTYPES = {16: "PCM_16", 24: "PCM_24"}
+
+
+# Length of the blocks written at once, keeps memory flat for long files
+BLOCK_SECONDS = 10
+
+
+def synthesize(path, duration, sample_rate=44100, bits=16, channels=2, seed=0):
+    """Write a test FLAC with tones, a sweep, noise and a low-pass cutoff"""
+    rng = np.random.default_rng(seed)
+    total = int(duration * sample_rate)
+    block = BLOCK_SECONDS * sample_rate
+
+    with soundfile.SoundFile(path, "w", sample_rate, channels, subtype=SUBTYPES[bits], format="FLAC") as f:
+        for first in range(0, total, block):
+            t = np.arange(first, min(total, first + block)) / sample_rate
+            signal = 0.3 * np.sin(2 * np.pi * 440 * t)
+            signal += 0.2 * np.sin(2 * np.pi * (500 + 8000 * t / duration) * t)
+
+            # Crude low-pass at 16 kHz, like a transcoded file
+            spectrum = np.fft.rfft(rng.standard_normal(len(t)))
+            spectrum[int(16000 / (sample_rate / 2) * len(spectrum)):] = 0
+            signal += 0.05 * np.fft.irfft(spectrum, len(t))
+
+            f.write(np.stack([signal] * channels, axis=1).astype(np.float32))
+
+
+def corpus_name(duration, sample_rate, bits, channels):
+    """Get the file name of a corpus entry"""
+    return f"{duration}s_{sample_rate}hz_{bits}bit_{channels}ch.flac"
+
+
+def build_corpus(folder, entries=FULL_CORPUS):
+    """Create the corpus files that do not exist yet and return their paths"""
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+
+    for seed, (duration, sample_rate, bits, channels) in enumerate(entries):
+        path = os.path.join(folder, corpus_name(duration, sample_rate, bits, channels))
+        if not os.path.exists(path):
+            synthesize(path, duration, sample_rate, bits, channels, seed)
+        paths.append(path)
+
+    return paths
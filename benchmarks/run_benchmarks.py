@@ -0,0 +1,223 @@
+"""Reproducible benchmark suite for spectrogram generation
+
+Usage:
+    python benchmarks/run_benchmarks.py [--quick] [--backend sox|numpy] [-o results.json]
+    python benchmarks/run_benchmarks.py --baseline baseline.json [--tolerance 10]
+
+Synthesizes a FLAC corpus (durations, sample rates from 44.1 kHz to 192 kHz,
+16/24 bit, mono/stereo), then times:
+
+- the full and zoom paths across the width/height/z-range/window-type matrix
+  of the Settings tab,
+- batch throughput at several concurrency levels.
+
+Results are written as JSON. With --baseline, every case is compared with a
+previous run and the exit status is 1 if a case got slower than the tolerance.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import itertools
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from red_spectrogram import __version__
+from red_spectrogram.config import WINDOW_TYPES, default_config, find_sox_path
+from red_spectrogram.engine import SpectrogramEngine, parameters_from_config
+
+from corpus import FULL_CORPUS, QUICK_CORPUS, build_corpus
+
+# Settings tab matrix: (widths, heights, z ranges, window types)
+FULL_MATRIX = ([1000, 3000], [257, 513, 1025], [80, 120], WINDOW_TYPES)
+QUICK_MATRIX = ([3000], [513], [120], ["Kaiser", "Hann"])
+
+ZOOM_MATRIX = ([500], [1025], [120], ["Kaiser"])
+
+
+def make_params(backend, sox_path, output_folder, workers=1):
+    """Build the default parameters for one backend"""
+    params = parameters_from_config(default_config(output_folder, sox_path))
+    params.update({"backend": backend, "workers": workers, "incremental": False, "zoom_start": "0:10"})
+    return params
+
+
+def time_call(function, repeat):
+    """Run function repeat times and return the median wall time in seconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def bench_matrix(backend, sox_path, files, output_folder, matrix, zoom_matrix, repeat):
+    """Time the full and zoom paths for every file and parameter combination"""
+    cases = {}
+
+    for kind, (widths, heights, z_ranges, windows) in (("full", matrix), ("zoom", zoom_matrix)):
+        for width, height, z_range, window_type in itertools.product(widths, heights, z_ranges, windows):
+            params = make_params(backend, sox_path, output_folder)
+            prefix = "" if kind == "full" else "zoom_"
+            params.update({prefix + "width": width, prefix + "height": height,
+                           prefix + "z_range": z_range, prefix + "window_type": window_type})
+            engine = SpectrogramEngine(params)
+
+            for file_path in files:
+                file_name = os.path.basename(file_path)
+                if kind == "full":
+                    function = lambda: engine.generate_normal_spectrogram(file_path, file_name)
+                else:
+                    function = lambda: engine.generate_zoomed_spectrogram(file_path, file_name)
+
+                name = f"{backend}/{kind}/{file_name}/x{width}_y{height}_z{z_range}_{window_type}"
+                cases[name] = round(time_call(function, repeat), 4)
+                print(f"{name}: {cases[name]:.3f}s", file=sys.stderr)
+
+    return cases
+
+
+def batch_files(files, folder, copies):
+    """Link copies of the corpus under distinct names, a batch runs every path once"""
+    os.makedirs(folder, exist_ok=True)
+    batch = []
+    for copy in range(copies):
+        for file_path in files:
+            target = os.path.join(folder, f"copy{copy}_{os.path.basename(file_path)}")
+            if not os.path.exists(target):
+                try:
+                    os.link(file_path, target)
+                except OSError:
+                    shutil.copyfile(file_path, target)
+            batch.append(target)
+    return batch
+
+
+def bench_batch(backend, sox_path, files, output_folder, concurrency_levels, copies):
+    """Time a batch of full and zoomed spectrograms at several concurrency levels"""
+    batch = batch_files(files, os.path.join(os.path.dirname(output_folder), "batch"), copies)
+    cases = {}
+
+    for workers in concurrency_levels:
+        params = make_params(backend, sox_path, output_folder, workers)
+        params["zoom"] = True
+        engine = SpectrogramEngine(params)
+
+        start = time.perf_counter()
+        results = engine.run_batch(batch)
+        elapsed = time.perf_counter() - start
+
+        failed = sum(1 for result in results if result["status"] == "error")
+        name = f"{backend}/batch/workers{workers}"
+        cases[name] = {
+            "seconds": round(elapsed, 4),
+            "files_per_second": round(len(results) / elapsed, 3),
+            "failed": failed
+        }
+        print(f"{name}: {elapsed:.3f}s, {len(results) / elapsed:.2f} files/s", file=sys.stderr)
+
+    return cases
+
+
+def compare(results, baseline, tolerance):
+    """Compare the timings with a baseline, return the list of regressions"""
+    regressions = []
+
+    def seconds(value):
+        return value["seconds"] if isinstance(value, dict) else value
+
+    for section in ("cases", "batch"):
+        for name, value in results.get(section, {}).items():
+            if name not in baseline.get(section, {}):
+                continue
+            before = seconds(baseline[section][name])
+            after = seconds(value)
+            if before > 0 and (after - before) / before * 100 > tolerance:
+                regressions.append({"case": name, "baseline": before, "current": after,
+                                    "change_percent": round((after - before) / before * 100, 1)})
+
+    return regressions
+
+
+def concurrency_levels():
+    """Get the concurrency levels to test: powers of two up to the CPU count"""
+    cpus = os.cpu_count() or 1
+    levels = []
+    workers = 1
+    while workers < cpus:
+        levels.append(workers)
+        workers *= 2
+    levels.append(cpus)
+    return levels
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark spectrogram generation.")
+    parser.add_argument("--backend", action="append", choices=["sox", "numpy"], help="backend to benchmark (repeatable, default: all available)")
+    parser.add_argument("--sox-path", help="path of the SoX executable")
+    parser.add_argument("--quick", action="store_true", help="small corpus and parameter matrix")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case, the median is reported (default 3)")
+    parser.add_argument("--batch-copies", type=int, default=4, help="copies of the corpus in the batch test (default 4)")
+    parser.add_argument("--corpus-dir", help="keep the synthesized corpus in this folder and reuse it")
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare with the results of a previous run")
+    parser.add_argument("--tolerance", type=float, default=10.0, help="allowed slowdown in percent (default 10)")
+    args = parser.parse_args()
+
+    sox_path = args.sox_path or find_sox_path()
+    backends = args.backend or (["sox", "numpy"] if os.path.exists(sox_path) else ["numpy"])
+
+    work_dir = tempfile.mkdtemp(prefix="red-spectrogram-bench-")
+    try:
+        corpus_dir = args.corpus_dir or os.path.join(work_dir, "corpus")
+        files = build_corpus(corpus_dir, QUICK_CORPUS if args.quick else FULL_CORPUS)
+        matrix = QUICK_MATRIX if args.quick else FULL_MATRIX
+        output_folder = os.path.join(work_dir, "output")
+        os.makedirs(output_folder)
+
+        results = {
+            "meta": {
+                "version": __version__,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "backends": backends,
+                "quick": args.quick,
+                "repeat": args.repeat,
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")
+            },
+            "cases": {},
+            "batch": {}
+        }
+
+        for backend in backends:
+            results["cases"].update(bench_matrix(backend, sox_path, files, output_folder, matrix, ZOOM_MATRIX, args.repeat))
+            results["batch"].update(bench_batch(backend, sox_path, files, output_folder, concurrency_levels(), args.batch_copies))
+
+        status = 0
+        if args.baseline:
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                regressions = compare(results, json.load(f), args.tolerance)
+            results["regressions"] = regressions
+            if regressions:
+                status = 1
+
+        output = json.dumps(results, indent=2)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write(output + "\n")
+        print(output)
+
+        return status
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
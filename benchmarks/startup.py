@@ -0,0 +1,127 @@
+"""Startup time benchmark
+
+Usage:
+    python benchmarks/startup.py [--repeat N] [-o results.json]
+    python benchmarks/startup.py --baseline baseline.json [--tolerance 10]
+
+Times, as the median of several runs in fresh interpreters:
+
+- the bare interpreter, as a reference,
+- the command-line mode up to its first error (imports, configuration, SoX lookup),
+- importing the GUI script without opening a window,
+- the GUI until its window is drawn, when a display is available,
+
+and, in-process, the SoX lookup with and without its cache. The results
+use the format of run_benchmarks.py, so --baseline works the same way.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+from red_spectrogram import __version__
+from red_spectrogram.config import find_sox_path
+
+from run_benchmarks import compare, time_call
+
+GUI_SCRIPT = os.path.join(ROOT_DIR, "red-spectrogram.py")
+
+# Runs the GUI script without its main block, creates the window and waits until it is drawn
+GUI_WINDOW_CODE = f"""
+import runpy, tkinter
+from tkinter import messagebox
+# A missing SoX must not block the benchmark on a dialog
+messagebox.showwarning = lambda *args, **kwargs: None
+module = runpy.run_path({GUI_SCRIPT!r}, run_name="startup_benchmark")
+root = tkinter.Tk()
+module["SpectrogramGenerator"](root)
+root.update()
+root.destroy()
+"""
+
+
+def has_display():
+    """Check if Tk can open a window"""
+    return sys.platform in ("win32", "darwin") or bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+
+
+def time_process(command, repeat):
+    """Run a command repeat times in a fresh interpreter and return the median wall time in seconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=ROOT_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def bench_startup(repeat):
+    """Time the startup paths, return {case name: {"seconds": median}}"""
+    commands = {
+        "startup/interpreter": [sys.executable, "-c", "pass"],
+        "startup/cli": [sys.executable, "-m", "red_spectrogram", os.path.join(ROOT_DIR, "no-such-file.flac")],
+        "startup/gui_import": [sys.executable, "-c", f"import runpy; runpy.run_path({GUI_SCRIPT!r}, run_name='startup_benchmark')"]
+    }
+    if has_display():
+        commands["startup/gui_window"] = [sys.executable, "-c", GUI_WINDOW_CODE]
+
+    cases = {}
+    for name, command in commands.items():
+        cases[name] = {"seconds": round(time_process(command, repeat), 4)}
+        print(f"{name}: {cases[name]['seconds'] * 1000:.1f} ms", file=sys.stderr)
+
+    # The uncached lookup refreshes the cache, so it runs first
+    for name, use_cache in (("startup/find_sox_uncached", False), ("startup/find_sox_cached", True)):
+        cases[name] = {"seconds": round(time_call(lambda: find_sox_path(use_cache), repeat), 6)}
+        print(f"{name}: {cases[name]['seconds'] * 1000:.2f} ms", file=sys.stderr)
+
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the startup time of the GUI and the command line.")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per case, the median is reported (default 5)")
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare with the results of a previous run")
+    parser.add_argument("--tolerance", type=float, default=10.0, help="allowed slowdown in percent (default 10)")
+    args = parser.parse_args()
+
+    results = {
+        "meta": {
+            "version": __version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "display": has_display(),
+            "repeat": args.repeat,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")
+        },
+        "cases": bench_startup(args.repeat)
+    }
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        results["regressions"] = regressions
+        if regressions:
+            status = 1
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    print(output)
+
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,12 +2,34 @@ import os
 import subprocess
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox
-from PIL import Image, ImageTk
 import threading
+import queue
 import sys
-import configparser
-import re
-import webbrowser
+import time
+import logging
+
+from red_spectrogram import config as spectrogram_config
+from red_spectrogram.config import WINDOW_TYPES, POOLING_MODES, DEFAULT_SETTINGS, DEFAULT_ZOOM_SETTINGS
+from red_spectrogram.backends import BACKEND_NAMES, module_available
+from red_spectrogram.engine import SpectrogramEngine, validate_parameters, resolve_worker_count, format_duration, longest_first
+from red_spectrogram.flacinfo import audio_duration
+from red_spectrogram.scanner import PathIndex, iter_audio_files, iter_batches
+from red_spectrogram.archives import ARCHIVE_EXTENSIONS, expand_archives
+from red_spectrogram.joblog import JOB_LOG_NAME, summarize, format_summary, failures, format_error_report
+from red_spectrogram.widgets import VirtualList
+from red_spectrogram.outputindex import OutputIndex
+from red_spectrogram.postencode import OUTPUT_FORMATS
+from red_spectrogram.pyramid import DEFAULT_MAX_WIDTH, is_pyramid_index
+
+# Number of scanned files sent to the UI at once, and batches inserted per UI tick
+SCAN_BATCH_SIZE = 500
+SCAN_BATCHES_PER_TICK = 10
+
+# Colors of the files in the list while a batch runs
+QUEUE_COLORS = {"run_now": "blue", "hold": "dark orange", "release": "", "done": "gray"}
+
+# Seconds between two progress reads of a distributed batch
+LEDGER_POLL_INTERVAL = 1.0
 
 class SpectrogramGenerator:
     def __init__(self, root):
@@ -18,12 +40,30 @@ class SpectrogramGenerator:
         self.root.resizable(True, True)
         
         # Variables
-        self.selected_files = []
+        self.selected_files = PathIndex()
+        self.scan_thread = None
+        self.scan_cancel = None
+        self.scan_queue = None
+        self.engine = None
+        self.events = None
+        # Failed files of the running batch, listed at the end instead of one dialog each
+        self.failed_count = 0
+        # Files colored in the list by the queue actions and progress of the last batch
+        self.queue_marks = set()
+        # Set to cancel the running transcode analysis
+        self.analysis_cancel = None
+        # Set to cancel the batch enqueued in the job ledger
+        self.ledger_cancel = None
+        self.output_index = None
+        self.output_refresh_thread = None
+        self.output_refresh_requested = False
+        self.filter_after_id = None
         # Output folder inside the application directory
         self.output_folder = os.path.join(self.get_application_path(), "Spectrograms")
         self.sox_path = self.find_sox_path()
-        self.current_process = None
         self.config = self.load_config()
+        # Snapshot of the spectrogram parameters used by the running batch
+        self.job_params = None
         
         # SoX download URL
         self.sox_url = "https://sourceforge.net/projects/sox/files/sox/"
@@ -37,12 +77,7 @@ class SpectrogramGenerator:
     
     def get_application_path(self):
         """Get the application path, works both in development mode and with PyInstaller"""
-        if getattr(sys, 'frozen', False):
-            # If running as a PyInstaller bundle
-            return os.path.dirname(sys.executable)
-        else:
-            # If running in development mode
-            return os.path.dirname(os.path.abspath(__file__))
+        return spectrogram_config.get_application_path()
     
     def resource_path(self, relative_path):
         """Get the absolute path of the resource, works both in development and with PyInstaller"""
@@ -56,82 +91,14 @@ class SpectrogramGenerator:
     
     def find_sox_path(self):
         """Find the path of the SoX executable"""
-        # Default path next to the application
-        app_dir = self.get_application_path()
-        default_sox_path = os.path.join(app_dir, "sox", "sox.exe")
-        
-        # Check if it exists in the default path
-        if os.path.exists(default_sox_path):
-            print(f"SoX found in default path: {default_sox_path}")
-            return default_sox_path
-        
-        # Alternative system paths
-        system_paths = [
-            r"C:\Program Files\sox-14-4-2\sox.exe",
-            r"C:\Program Files (x86)\sox-14-4-2\sox.exe",
-            r"C:\sox-14-4-2\sox.exe"
-        ]
-        
-        # Check system paths
-        for path in system_paths:
-            if os.path.exists(path):
-                print(f"SoX found in system: {path}")
-                return path
-        
-        # Search in PATH
-        if sys.platform == "win32":
-            cmd = "where sox"
-        else:
-            cmd = "which sox"
-        
-        try:
-            result = subprocess.check_output(cmd, shell=True).decode().strip()
-            if result and os.path.exists(result):
-                print(f"SoX found in PATH: {result}")
-                return result
-        except:
-            pass
-        
-        # Return default path even if it doesn't exist
-        # (a warning will be shown to the user later)
-        return default_sox_path
+        return spectrogram_config.find_sox_path()
     
     def load_config(self):
         """Load or create the configuration file"""
-        config = configparser.ConfigParser()
-        config_file = os.path.join(self.get_application_path(), "spectrogram_config.ini")
-        
-        if os.path.exists(config_file):
-            config.read(config_file)
-        else:
-            # Default configuration
-            config["DEFAULT"] = {
-                "width": "3000",
-                "height": "513",
-                "z_range": "120",
-                "window_type": "Kaiser",
-                "output_folder": self.output_folder,
-                "sox_path": self.sox_path
-            }
-            
-            config["ZOOM"] = {
-                "width": "500",
-                "height": "1025",
-                "z_range": "120",
-                "window_type": "Kaiser",
-                "zoom_start": "1:00",
-                "zoom_duration": "0:02"
-            }
-            
-            with open(config_file, "w") as f:
-                config.write(f)
-        
-        return config
+        return spectrogram_config.load_config(output_folder=self.output_folder, sox_path=self.sox_path)
     
     def save_config(self):
         """Save the current settings to the configuration file"""
-        config_file = os.path.join(self.get_application_path(), "spectrogram_config.ini")
-        
         # Update config with current values
         self.config["DEFAULT"]["width"] = self.width_var.get()
         self.config["DEFAULT"]["height"] = self.height_var.get()
@@ -139,6 +106,18 @@ class SpectrogramGenerator:
         self.config["DEFAULT"]["window_type"] = self.window_type_var.get()
         self.config["DEFAULT"]["output_folder"] = self.output_folder
         self.config["DEFAULT"]["sox_path"] = self.sox_path if self.sox_path else ""
+        self.config["DEFAULT"]["workers"] = self.workers_var.get()
+        self.config["DEFAULT"]["backend"] = self.backend_var.get()
+        self.config["DEFAULT"]["incremental"] = "yes" if self.incremental_var.get() else "no"
+        self.config["DEFAULT"]["ledger"] = self.ledger_var.get()
+        self.config["DEFAULT"]["output_format"] = self.output_format_var.get()
+        self.config["DEFAULT"]["compress_level"] = self.compress_level_var.get()
+        self.config["DEFAULT"]["pooling"] = self.pooling_var.get()
+        self.config["DEFAULT"]["memory_limit"] = self.memory_limit_var.get()
+        self.config["DEFAULT"]["job_timeout"] = self.job_timeout_var.get()
+        self.config["DEFAULT"]["timeout_factor"] = self.timeout_factor_var.get()
+        self.config["DEFAULT"]["retries"] = self.retries_var.get()
+        self.config["DEFAULT"]["quarantine_after"] = self.quarantine_after_var.get()
         
         self.config["ZOOM"]["width"] = self.zoom_width_var.get()
         self.config["ZOOM"]["height"] = self.zoom_height_var.get()
@@ -147,8 +126,7 @@ class SpectrogramGenerator:
         self.config["ZOOM"]["zoom_start"] = self.zoom_start_var.get()
         self.config["ZOOM"]["zoom_duration"] = self.zoom_duration_var.get()
         
-        with open(config_file, "w") as f:
-            self.config.write(f)
+        spectrogram_config.save_config(self.config)
     
     def create_ui(self):
         """Create the user interface"""
@@ -169,9 +147,13 @@ class SpectrogramGenerator:
         # Main tab
         self.main_tab = ttk.Frame(self.notebook)
         self.settings_tab = ttk.Frame(self.notebook)
+        self.browser_tab = ttk.Frame(self.notebook)
+        self.stats_tab = ttk.Frame(self.notebook)
         
         self.notebook.add(self.main_tab, text="Main")
+        self.notebook.add(self.browser_tab, text="Browser")
         self.notebook.add(self.settings_tab, text="Settings")
+        self.notebook.add(self.stats_tab, text="Statistics")
         self.notebook.pack(expand=1, fill="both", padx=10, pady=10)
         
         # ---------- MAIN TAB ----------
@@ -188,6 +170,17 @@ class SpectrogramGenerator:
         listbox_scrollbar.pack(side=tk.RIGHT, fill="y")
         self.file_listbox.config(yscrollcommand=listbox_scrollbar.set)
         
+        # While a batch runs, double-click runs a file now and the context menu reorders the queue
+        self.file_listbox.bind("<Double-Button-1>", self.run_clicked_file)
+        self.file_listbox.bind("<Button-3>", self.show_queue_menu)
+        self.queue_menu = tk.Menu(self.root, tearoff=0)
+        self.queue_menu.add_command(label="Run Now", command=lambda: self.queue_action("run_now"))
+        self.queue_menu.add_command(label="Move to Front of Queue", command=lambda: self.queue_action("front"))
+        self.queue_menu.add_command(label="Move to End of Queue", command=lambda: self.queue_action("end"))
+        self.queue_menu.add_separator()
+        self.queue_menu.add_command(label="Hold", command=lambda: self.queue_action("hold"))
+        self.queue_menu.add_command(label="Release", command=lambda: self.queue_action("release"))
+        
         # File buttons frame
         file_button_frame = ttk.Frame(self.main_tab)
         file_button_frame.pack(fill="x", padx=10, pady=5)
@@ -198,6 +191,16 @@ class SpectrogramGenerator:
         ttk.Button(file_button_frame, text="Remove Selected", command=self.remove_selected).pack(side=tk.LEFT, padx=5)
         ttk.Button(file_button_frame, text="Clear List", command=self.clear_files).pack(side=tk.LEFT, padx=5)
         
+        self.recursive_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(file_button_frame, text="Include Subfolders", variable=self.recursive_var).pack(side=tk.LEFT, padx=5)
+        
+        self.cancel_scan_button = ttk.Button(file_button_frame, text="Cancel Scan", command=self.cancel_folder_scan, state="disabled")
+        self.cancel_scan_button.pack(side=tk.LEFT, padx=5)
+        
+        # Folder scan status
+        self.scan_status_var = tk.StringVar(value="")
+        ttk.Label(self.main_tab, textvariable=self.scan_status_var, foreground="gray").pack(fill="x", padx=15)
+        
         # Generation frame
         gen_frame = ttk.LabelFrame(self.main_tab, text="Spectrogram Generation")
         gen_frame.pack(fill="both", expand=False, padx=10, pady=5)
@@ -205,34 +208,59 @@ class SpectrogramGenerator:
         # Checkboxes for spectrogram types
         self.normal_var = tk.BooleanVar(value=True)
         self.zoom_var = tk.BooleanVar(value=False)
+        self.pyramid_var = tk.BooleanVar(value=False)
+        self.matrix_var = tk.BooleanVar(value=False)
         
         ttk.Checkbutton(gen_frame, text="Full Spectrogram", variable=self.normal_var).grid(row=0, column=0, padx=5, pady=5, sticky="w")
         ttk.Checkbutton(gen_frame, text="Zoomed Spectrogram", variable=self.zoom_var).grid(row=0, column=1, padx=5, pady=5, sticky="w")
-        
-        # Generate button
-        ttk.Button(gen_frame, text="Generate Spectrograms", command=self.start_generation).grid(row=1, column=0, columnspan=2, padx=5, pady=5)
+        ttk.Checkbutton(gen_frame, text="Tile Pyramid", variable=self.pyramid_var).grid(row=0, column=2, padx=5, pady=5, sticky="w")
+        ttk.Checkbutton(gen_frame, text="dB Matrix (.npy)", variable=self.matrix_var).grid(row=0, column=3, padx=5, pady=5, sticky="w")
+        
+        # Skip files whose spectrograms are up to date
+        self.incremental_var = tk.BooleanVar(value=self.config["DEFAULT"].getboolean("incremental", fallback=True))
+        ttk.Checkbutton(gen_frame, text="Skip unchanged files", variable=self.incremental_var).grid(row=0, column=4, padx=5, pady=5, sticky="w")
+        
+        # Generate, pause and cancel buttons
+        gen_button_frame = ttk.Frame(gen_frame)
+        gen_button_frame.grid(row=1, column=0, columnspan=5, padx=5, pady=5)
+        self.generate_button = ttk.Button(gen_button_frame, text="Generate Spectrograms", command=self.start_generation)
+        self.generate_button.pack(side=tk.LEFT, padx=5)
+        self.analyze_button = ttk.Button(gen_button_frame, text="Analyze Files", command=self.start_analysis)
+        self.analyze_button.pack(side=tk.LEFT, padx=5)
+        self.pause_button = ttk.Button(gen_button_frame, text="Pause", command=self.toggle_pause, state="disabled")
+        self.pause_button.pack(side=tk.LEFT, padx=5)
+        self.cancel_button = ttk.Button(gen_button_frame, text="Cancel", command=self.cancel_generation, state="disabled")
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
         
         # Progress bar
         self.progress = ttk.Progressbar(gen_frame, orient="horizontal", length=100, mode="determinate")
-        self.progress.grid(row=2, column=0, columnspan=2, padx=5, pady=5, sticky="ew")
+        self.progress.grid(row=2, column=0, columnspan=5, padx=5, pady=5, sticky="ew")
         
         # Status
         self.status_var = tk.StringVar(value="Ready")
-        ttk.Label(gen_frame, textvariable=self.status_var).grid(row=3, column=0, columnspan=2, padx=5, pady=5, sticky="w")
+        ttk.Label(gen_frame, textvariable=self.status_var).grid(row=3, column=0, columnspan=5, padx=5, pady=5, sticky="w")
+        
+        # Throughput and ETA
+        self.throughput_var = tk.StringVar(value="")
+        ttk.Label(gen_frame, textvariable=self.throughput_var, foreground="gray").grid(row=4, column=0, columnspan=5, padx=5, pady=0, sticky="w")
         
         # Output Frame
         output_frame = ttk.LabelFrame(self.main_tab, text="Output")
         output_frame.pack(fill="both", expand=True, padx=10, pady=5)
         
-        # Listbox for generated files
-        self.output_listbox = tk.Listbox(output_frame, height=6, width=70)
-        self.output_listbox.pack(side=tk.LEFT, fill="both", expand=True, padx=5, pady=5)
-        self.output_listbox.bind("<Double-1>", self.open_selected_output)
+        # Filter over the generated file names
+        output_filter_frame = ttk.Frame(output_frame)
+        output_filter_frame.pack(fill="x", padx=5, pady=(5, 0))
+        ttk.Label(output_filter_frame, text="Filter:").pack(side=tk.LEFT)
+        self.output_filter_var = tk.StringVar(value="")
+        self.output_filter_var.trace_add("write", lambda *args: self.schedule_output_filter())
+        ttk.Entry(output_filter_frame, textvariable=self.output_filter_var, width=30).pack(side=tk.LEFT, padx=5)
+        self.output_count_var = tk.StringVar(value="")
+        ttk.Label(output_filter_frame, textvariable=self.output_count_var, foreground="gray").pack(side=tk.LEFT, padx=5)
         
-        # Scrollbar for output
-        output_scrollbar = ttk.Scrollbar(output_frame, orient="vertical", command=self.output_listbox.yview)
-        output_scrollbar.pack(side=tk.RIGHT, fill="y")
-        self.output_listbox.config(yscrollcommand=output_scrollbar.set)
+        # List of generated files, only the visible rows are in the listbox
+        self.output_list = VirtualList(output_frame, on_activate=lambda name: self.open_selected_output())
+        self.output_list.pack(fill="both", expand=True)
         
         # Output buttons frame
         output_button_frame = ttk.Frame(self.main_tab)
@@ -249,49 +277,156 @@ class SpectrogramGenerator:
         sox_link.bind("<Button-1>", lambda e: self.open_sox_website())
         
         # ---------- SETTINGS TAB ----------
+        # The widgets are built when the tab is first shown, the variables are needed right away
+        self.create_settings_variables()
+        self.settings_built = False
+        
+        # ---------- BROWSER TAB ----------
+        # Thumbnails of the generated spectrograms, built when the tab is first shown
+        self.thumbnail_browser = None
+        self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
+        
+        # ---------- STATISTICS TAB ----------
+        # Timing summary of the last batch
+        stats_frame = ttk.LabelFrame(self.stats_tab, text="Last Batch")
+        stats_frame.pack(fill="both", expand=True, padx=10, pady=5)
+        
+        self.stats_text = tk.Text(stats_frame, height=15, width=70, wrap="none", state="disabled")
+        self.stats_text.pack(side=tk.LEFT, fill="both", expand=True, padx=5, pady=5)
+        
+        stats_scrollbar = ttk.Scrollbar(stats_frame, orient="vertical", command=self.stats_text.yview)
+        stats_scrollbar.pack(side=tk.RIGHT, fill="y")
+        self.stats_text.config(yscrollcommand=stats_scrollbar.set)
+        self.show_statistics("No batch has run yet.")
+        
+        stats_button_frame = ttk.Frame(self.stats_tab)
+        stats_button_frame.pack(fill="x", padx=10, pady=5)
+        ttk.Button(stats_button_frame, text="Open Job Log", command=self.open_job_log).pack(side=tk.LEFT, padx=5)
+        ttk.Label(stats_button_frame, text=f"Every processed file is logged to {JOB_LOG_NAME} in the output folder", foreground="gray").pack(side=tk.LEFT, padx=5)
+        
+        # Check if SoX is available and show warning if necessary
+        self.check_sox_available()
+        
+        # Initialize state
+        self.refresh_output_list()
+    
+    def create_settings_variables(self):
+        """Create the variables of the Settings tab from the configuration"""
+        # General settings
+        self.sox_path_var = tk.StringVar(value=self.sox_path if self.sox_path else "")
+        self.output_folder_var = tk.StringVar(value=self.output_folder)
+        self.workers_var = tk.StringVar(value=self.config["DEFAULT"].get("workers", "0"))
+        self.backend_var = tk.StringVar(value=self.config["DEFAULT"].get("backend", "sox"))
+        self.ledger_var = tk.StringVar(value=self.config["DEFAULT"].get("ledger", ""))
+        self.output_format_var = tk.StringVar(value=self.config["DEFAULT"].get("output_format", "png"))
+        self.compress_level_var = tk.StringVar(value=self.config["DEFAULT"].get("compress_level", "9"))
+        self.memory_limit_var = tk.StringVar(value=self.config["DEFAULT"].get("memory_limit", "1024"))
+        self.job_timeout_var = tk.StringVar(value=self.config["DEFAULT"].get("job_timeout", "120"))
+        self.timeout_factor_var = tk.StringVar(value=self.config["DEFAULT"].get("timeout_factor", "1.0"))
+        self.retries_var = tk.StringVar(value=self.config["DEFAULT"].get("retries", "2"))
+        self.quarantine_after_var = tk.StringVar(value=self.config["DEFAULT"].get("quarantine_after", "3"))
+        
+        # Full spectrogram settings
+        self.width_var = tk.StringVar(value=self.config["DEFAULT"]["width"])
+        self.height_var = tk.StringVar(value=self.config["DEFAULT"]["height"])
+        self.z_range_var = tk.StringVar(value=self.config["DEFAULT"]["z_range"])
+        self.window_type_var = tk.StringVar(value=self.config["DEFAULT"]["window_type"])
+        self.pooling_var = tk.StringVar(value=self.config["DEFAULT"].get("pooling", "mean"))
+        
+        # Zoomed spectrogram settings
+        self.zoom_width_var = tk.StringVar(value=self.config["ZOOM"]["width"])
+        self.zoom_height_var = tk.StringVar(value=self.config["ZOOM"]["height"])
+        self.zoom_z_range_var = tk.StringVar(value=self.config["ZOOM"]["z_range"])
+        self.zoom_window_type_var = tk.StringVar(value=self.config["ZOOM"]["window_type"])
+        self.zoom_start_var = tk.StringVar(value=self.config["ZOOM"]["zoom_start"])
+        self.zoom_duration_var = tk.StringVar(value=self.config["ZOOM"]["zoom_duration"])
+    
+    def build_settings_tab(self):
+        """Create the widgets of the Settings tab"""
         # General settings frame
         general_frame = ttk.LabelFrame(self.settings_tab, text="General Settings")
         general_frame.pack(fill="x", padx=10, pady=5)
         
         # SoX path
         ttk.Label(general_frame, text="SoX Path:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
-        self.sox_path_var = tk.StringVar(value=self.sox_path if self.sox_path else "")
         sox_entry = ttk.Entry(general_frame, textvariable=self.sox_path_var, width=50)
         sox_entry.grid(row=0, column=1, padx=5, pady=5, sticky="we")
         ttk.Button(general_frame, text="Browse", command=self.browse_sox).grid(row=0, column=2, padx=5, pady=5)
         
         # Output folder
         ttk.Label(general_frame, text="Output Folder:").grid(row=1, column=0, padx=5, pady=5, sticky="w")
-        self.output_folder_var = tk.StringVar(value=self.output_folder)
         output_entry = ttk.Entry(general_frame, textvariable=self.output_folder_var, width=50)
         output_entry.grid(row=1, column=1, padx=5, pady=5, sticky="we")
         ttk.Button(general_frame, text="Browse", command=self.browse_output_folder).grid(row=1, column=2, padx=5, pady=5)
         
+        # Number of parallel SoX jobs
+        ttk.Label(general_frame, text="Parallel Jobs:").grid(row=2, column=0, padx=5, pady=5, sticky="w")
+        ttk.Entry(general_frame, textvariable=self.workers_var, width=10).grid(row=2, column=1, padx=5, pady=5, sticky="w")
+        ttk.Label(general_frame, text="0 = one job per CPU core", foreground="gray").grid(row=3, column=1, padx=5, pady=0, sticky="w")
+        
+        # Spectrogram backend
+        ttk.Label(general_frame, text="Backend:").grid(row=4, column=0, padx=5, pady=5, sticky="w")
+        ttk.Combobox(general_frame, textvariable=self.backend_var, values=BACKEND_NAMES, state="readonly", width=10).grid(row=4, column=1, padx=5, pady=5, sticky="w")
+        ttk.Label(general_frame, text="sox = SoX executable, numpy = in-process (needs numpy and soundfile)", foreground="gray").grid(row=5, column=1, columnspan=2, padx=5, pady=0, sticky="w")
+        
+        # Job ledger of the render nodes
+        ttk.Label(general_frame, text="Job Ledger:").grid(row=6, column=0, padx=5, pady=5, sticky="w")
+        ttk.Entry(general_frame, textvariable=self.ledger_var, width=50).grid(row=6, column=1, padx=5, pady=5, sticky="we")
+        ttk.Button(general_frame, text="Browse", command=self.browse_ledger).grid(row=6, column=2, padx=5, pady=5)
+        ttk.Label(general_frame, text="Empty = render here. Otherwise batches go to the workers on a shared folder (--ledger PATH --worker)", foreground="gray").grid(row=7, column=1, columnspan=2, padx=5, pady=0, sticky="w")
+        
+        # Re-encoding of the generated images
+        ttk.Label(general_frame, text="Output Format:").grid(row=8, column=0, padx=5, pady=5, sticky="w")
+        format_frame = ttk.Frame(general_frame)
+        format_frame.grid(row=8, column=1, columnspan=2, sticky="w")
+        ttk.Combobox(format_frame, textvariable=self.output_format_var, values=OUTPUT_FORMATS, state="readonly", width=14).pack(side=tk.LEFT, padx=5, pady=5)
+        ttk.Label(format_frame, text="Compression Level:").pack(side=tk.LEFT, padx=5, pady=5)
+        ttk.Entry(format_frame, textvariable=self.compress_level_var, width=5).pack(side=tk.LEFT, padx=5, pady=5)
+        ttk.Label(general_frame, text="png-palette and webp (lossless) are the smallest, re-encoding runs next to the generation jobs", foreground="gray").grid(row=9, column=1, columnspan=2, padx=5, pady=0, sticky="w")
+        
+        # Memory ceiling of the numpy backend
+        ttk.Label(general_frame, text="Memory Limit (MB):").grid(row=10, column=0, padx=5, pady=5, sticky="w")
+        ttk.Entry(general_frame, textvariable=self.memory_limit_var, width=10).grid(row=10, column=1, padx=5, pady=5, sticky="w")
+        ttk.Label(general_frame, text="numpy backend, shared by the parallel jobs: longer files are rendered in chunks", foreground="gray").grid(row=11, column=1, columnspan=2, padx=5, pady=0, sticky="w")
+        
+        # Time limits, retries and quarantine of failing files
+        ttk.Label(general_frame, text="Timeout (s):").grid(row=12, column=0, padx=5, pady=5, sticky="w")
+        failure_frame = ttk.Frame(general_frame)
+        failure_frame.grid(row=12, column=1, columnspan=2, sticky="w")
+        ttk.Entry(failure_frame, textvariable=self.job_timeout_var, width=6).pack(side=tk.LEFT, padx=5, pady=5)
+        ttk.Label(failure_frame, text="+ per audio second:").pack(side=tk.LEFT, padx=5, pady=5)
+        ttk.Entry(failure_frame, textvariable=self.timeout_factor_var, width=5).pack(side=tk.LEFT, padx=5, pady=5)
+        ttk.Label(failure_frame, text="Retries:").pack(side=tk.LEFT, padx=5, pady=5)
+        ttk.Entry(failure_frame, textvariable=self.retries_var, width=4).pack(side=tk.LEFT, padx=5, pady=5)
+        ttk.Label(failure_frame, text="Quarantine After:").pack(side=tk.LEFT, padx=5, pady=5)
+        ttk.Entry(failure_frame, textvariable=self.quarantine_after_var, width=4).pack(side=tk.LEFT, padx=5, pady=5)
+        ttk.Label(general_frame, text="0 = no time limit. Files that fail that many attempts are skipped until they change", foreground="gray").grid(row=13, column=1, columnspan=2, padx=5, pady=0, sticky="w")
+        
         # Normal spectrogram settings frame
         normal_frame = ttk.LabelFrame(self.settings_tab, text="Full Spectrogram Settings")
         normal_frame.pack(fill="x", padx=10, pady=5)
         
         # Parameters
         ttk.Label(normal_frame, text="Width (pixels):").grid(row=0, column=0, padx=5, pady=5, sticky="w")
-        self.width_var = tk.StringVar(value=self.config["DEFAULT"]["width"])
         ttk.Entry(normal_frame, textvariable=self.width_var, width=10).grid(row=0, column=1, padx=5, pady=5, sticky="w")
         
         ttk.Label(normal_frame, text="Height (bins):").grid(row=0, column=2, padx=5, pady=5, sticky="w")
-        self.height_var = tk.StringVar(value=self.config["DEFAULT"]["height"])
         ttk.Entry(normal_frame, textvariable=self.height_var, width=10).grid(row=0, column=3, padx=5, pady=5, sticky="w")
         
         ttk.Label(normal_frame, text="Z Range (dB):").grid(row=1, column=0, padx=5, pady=5, sticky="w")
-        self.z_range_var = tk.StringVar(value=self.config["DEFAULT"]["z_range"])
         ttk.Entry(normal_frame, textvariable=self.z_range_var, width=10).grid(row=1, column=1, padx=5, pady=5, sticky="w")
         
         ttk.Label(normal_frame, text="Window Type:").grid(row=1, column=2, padx=5, pady=5, sticky="w")
-        self.window_type_var = tk.StringVar(value=self.config["DEFAULT"]["window_type"])
-        window_types = ["Kaiser", "Hamming", "Hann", "Bartlett", "Rectangular"]
+        window_types = WINDOW_TYPES
         ttk.Combobox(normal_frame, textvariable=self.window_type_var, values=window_types, width=10).grid(row=1, column=3, padx=5, pady=5, sticky="w")
         
+        ttk.Label(normal_frame, text="Pooling:").grid(row=0, column=4, padx=5, pady=5, sticky="w")
+        ttk.Combobox(normal_frame, textvariable=self.pooling_var, values=POOLING_MODES, state="readonly", width=10).grid(row=0, column=5, padx=5, pady=5, sticky="w")
+        
         # Parameters help
-        help_text = "Valid ranges - Width: 100-5000 pixels, Height: typically 129, 257, 513, 1025 (2^n+1), Z Range: 20-180 dB"
-        ttk.Label(normal_frame, text=help_text, foreground="gray").grid(row=2, column=0, columnspan=4, padx=5, pady=5, sticky="w")
+        help_text = ("Valid ranges - Width: 100-5000 pixels, Height: typically 129, 257, 513, 1025 (2^n+1), Z Range: 20-180 dB\n"
+                     "Pooling: max keeps short peaks visible in long recordings (numpy backend)")
+        ttk.Label(normal_frame, text=help_text, foreground="gray").grid(row=2, column=0, columnspan=6, padx=5, pady=5, sticky="w")
         
         # Zoom settings frame
         zoom_frame = ttk.LabelFrame(self.settings_tab, text="Zoomed Spectrogram Settings")
@@ -299,32 +434,28 @@ class SpectrogramGenerator:
         
         # Zoom parameters
         ttk.Label(zoom_frame, text="Width (pixels):").grid(row=0, column=0, padx=5, pady=5, sticky="w")
-        self.zoom_width_var = tk.StringVar(value=self.config["ZOOM"]["width"])
         ttk.Entry(zoom_frame, textvariable=self.zoom_width_var, width=10).grid(row=0, column=1, padx=5, pady=5, sticky="w")
         
         ttk.Label(zoom_frame, text="Height (bins):").grid(row=0, column=2, padx=5, pady=5, sticky="w")
-        self.zoom_height_var = tk.StringVar(value=self.config["ZOOM"]["height"])
         ttk.Entry(zoom_frame, textvariable=self.zoom_height_var, width=10).grid(row=0, column=3, padx=5, pady=5, sticky="w")
         
         ttk.Label(zoom_frame, text="Z Range (dB):").grid(row=1, column=0, padx=5, pady=5, sticky="w")
-        self.zoom_z_range_var = tk.StringVar(value=self.config["ZOOM"]["z_range"])
         ttk.Entry(zoom_frame, textvariable=self.zoom_z_range_var, width=10).grid(row=1, column=1, padx=5, pady=5, sticky="w")
         
         ttk.Label(zoom_frame, text="Window Type:").grid(row=1, column=2, padx=5, pady=5, sticky="w")
-        self.zoom_window_type_var = tk.StringVar(value=self.config["ZOOM"]["window_type"])
         ttk.Combobox(zoom_frame, textvariable=self.zoom_window_type_var, values=window_types, width=10).grid(row=1, column=3, padx=5, pady=5, sticky="w")
         
-        ttk.Label(zoom_frame, text="Start Time:").grid(row=2, column=0, padx=5, pady=5, sticky="w")
-        self.zoom_start_var = tk.StringVar(value=self.config["ZOOM"]["zoom_start"])
-        ttk.Entry(zoom_frame, textvariable=self.zoom_start_var, width=10).grid(row=2, column=1, padx=5, pady=5, sticky="w")
+        ttk.Label(zoom_frame, text="Start Times:").grid(row=2, column=0, padx=5, pady=5, sticky="w")
+        ttk.Entry(zoom_frame, textvariable=self.zoom_start_var, width=10).grid(row=2, column=1, padx=5, pady=5, sticky="we")
         
         ttk.Label(zoom_frame, text="Duration:").grid(row=2, column=2, padx=5, pady=5, sticky="w")
-        self.zoom_duration_var = tk.StringVar(value=self.config["ZOOM"]["zoom_duration"])
         ttk.Entry(zoom_frame, textvariable=self.zoom_duration_var, width=10).grid(row=2, column=3, padx=5, pady=5, sticky="w")
         
         # Parameters help
         zoom_help_text = "Valid ranges - Width: 100-5000 pixels, Height: typically 129, 257, 513, 1025 (2^n+1), Z Range: 20-180 dB, Time Format: M:SS"
         ttk.Label(zoom_frame, text=zoom_help_text, foreground="gray").grid(row=3, column=0, columnspan=4, padx=5, pady=5, sticky="w")
+        windows_help_text = "Several start times, separated by commas, render one window each: e.g. 1:00, 50%, end-0:10, every 2:00"
+        ttk.Label(zoom_frame, text=windows_help_text, foreground="gray").grid(row=4, column=0, columnspan=4, padx=5, pady=0, sticky="w")
         
         # Save buttons
         button_frame = ttk.Frame(self.settings_tab)
@@ -332,12 +463,25 @@ class SpectrogramGenerator:
         
         ttk.Button(button_frame, text="Save Settings", command=self.save_settings).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Reset to Defaults", command=self.reset_settings).pack(side=tk.LEFT, padx=5)
-        
-        # Check if SoX is available and show warning if necessary
-        self.check_sox_available()
-        
-        # Initialize state
-        self.refresh_output_list()
+    
+    def build_browser_tab(self):
+        """Create the thumbnail browser, loading Pillow on first use"""
+        from red_spectrogram.browser import ThumbnailBrowser
+        
+        # Double-click opens the full image, or the viewer of a tile pyramid
+        self.thumbnail_browser = ThumbnailBrowser(self.browser_tab, on_open=self.open_output)
+        self.thumbnail_browser.pack(fill="both", expand=True, padx=10, pady=10)
+        self.thumbnail_browser.set_folder(self.output_folder)
+        self.apply_output_filter()
+    
+    def on_tab_changed(self, event=None):
+        """Build the Settings and Browser tabs the first time they are shown"""
+        selected = self.notebook.nametowidget(self.notebook.select())
+        if selected is self.settings_tab and not self.settings_built:
+            self.settings_built = True
+            self.build_settings_tab()
+        elif selected is self.browser_tab and self.thumbnail_browser is None:
+            self.build_browser_tab()
     
     def check_sox_available(self):
         """Check if SoX is available and display warning if necessary"""
@@ -349,59 +493,213 @@ class SpectrogramGenerator:
                 "Make sure the 'sox' folder is present next to the executable.\n"
                 "Alternatively, specify the path manually in the settings or download SoX from the Help menu."
             )
+            return
+        
+        # Probed once per SoX executable, then read from the cache
+        info = spectrogram_config.sox_info(self.sox_path)
+        if info and not info["flac"]:
+            messagebox.showwarning(
+                "SoX Without FLAC Support",
+                f"SoX {info['version'] or ''} at {self.sox_path} was built without FLAC support.\n\n"
+                "Download a complete SoX build from the Help menu, or select the numpy backend in the settings."
+            )
     
     def open_sox_website(self):
         """Open the SoX download website"""
+        import webbrowser
+        
         webbrowser.open(self.sox_url)
     
     def show_about(self):
         """Show the About dialog"""
+        info = spectrogram_config.sox_info(self.sox_path)
+        sox_version = f"SoX {info['version']}" if info and info["version"] else "SoX not found"
         messagebox.showinfo(
             "About RED-Spectrogram",
             "RED-Spectrogram v2.0\n\n"
-            "A tool to create spectrograms from FLAC files using SoX.\n\n"
+            "A tool to create spectrograms from FLAC files using SoX.\n"
+            f"{sox_version}\n\n"
             "© 2025 RED-Spectrogram Team"
         )
     
     def browse_files(self):
         """Open the dialog to select files"""
+        archive_patterns = " ".join(f"*{extension}" for extension in ARCHIVE_EXTENSIONS)
         files = filedialog.askopenfilenames(
             title="Select FLAC Files",
-            filetypes=(("FLAC Files", "*.flac"), ("All Files", "*.*"))
+            filetypes=(("FLAC Files and Archives", f"*.flac {archive_patterns}"), ("FLAC Files", "*.flac"),
+                       ("Archives", archive_patterns), ("All Files", "*.*"))
         )
         
         if files:
-            for file in files:
-                if file not in self.selected_files:
-                    self.selected_files.append(file)
-                    self.file_listbox.insert(tk.END, os.path.basename(file))
+            # Archives are replaced by the FLAC files listed in their index
+            new_files = self.selected_files.extend(expand_archives(files))
+            if new_files:
+                self.file_listbox.insert(tk.END, *[os.path.basename(file) for file in new_files])
+                # Files picked while a batch runs go before the rest of its queue
+                self.queue_files(new_files, interactive=True)
     
     def browse_folder(self):
         """Open the dialog to select a folder"""
         folder = filedialog.askdirectory(title="Select Folder with FLAC Files")
         
         if folder:
-            for file in os.listdir(folder):
-                if file.lower().endswith('.flac'):
-                    full_path = os.path.join(folder, file)
-                    if full_path not in self.selected_files:
-                        self.selected_files.append(full_path)
-                        self.file_listbox.insert(tk.END, file)
+            self.start_folder_scan(folder)
+    
+    def start_folder_scan(self, folder):
+        """Scan a folder for FLAC files in the background"""
+        if self.scan_thread and self.scan_thread.is_alive():
+            messagebox.showinfo("Scan", "A folder scan is already running.")
+            return
+        
+        self.scan_cancel = threading.Event()
+        self.scan_queue = queue.Queue()
+        self.scan_added = 0
+        self.scan_thread = threading.Thread(
+            target=self.scan_folder,
+            args=(folder, self.recursive_var.get(), self.scan_cancel, self.scan_queue),
+            daemon=True
+        )
+        self.scan_thread.start()
+        
+        self.cancel_scan_button.config(state="normal")
+        self.scan_status_var.set(f"Scanning {folder}...")
+        self.root.after(100, self.drain_scan_queue)
+    
+    def scan_folder(self, folder, recursive, cancel_event, scan_queue):
+        """Walk the folder and send the files found to the UI in batches (runs in a worker thread)"""
+        stats = {"folders": 0, "files": 0}
+        paths = iter_audio_files(folder, recursive, cancel_event, stats, archives=True)
+        
+        for batch in iter_batches(paths, SCAN_BATCH_SIZE):
+            scan_queue.put(("batch", batch, dict(stats)))
+        
+        scan_queue.put(("done", cancel_event.is_set(), dict(stats)))
+    
+    def drain_scan_queue(self):
+        """Insert the scanned files into the list in bulk (runs on the UI thread)"""
+        new_files = []
+        finished = None
+        stats = None
+        
+        for _ in range(SCAN_BATCHES_PER_TICK):
+            try:
+                kind, payload, stats = self.scan_queue.get_nowait()
+            except queue.Empty:
+                break
+            
+            if kind == "batch":
+                new_files.extend(self.selected_files.extend(payload))
+            else:
+                finished = payload
+                break
+        
+        if new_files:
+            self.file_listbox.insert(tk.END, *[os.path.basename(file) for file in new_files])
+            self.scan_added += len(new_files)
+            self.queue_files(new_files)
+        
+        if stats:
+            summary = f"{stats['files']} FLAC files found in {stats['folders']} folders, {self.scan_added} added"
+            if finished is None:
+                self.scan_status_var.set(f"Scanning: {summary}")
+            else:
+                self.scan_status_var.set(f"Scan {'cancelled' if finished else 'complete'}: {summary}")
+        
+        if finished is None:
+            self.root.after(100, self.drain_scan_queue)
+        else:
+            self.cancel_scan_button.config(state="disabled")
+    
+    def cancel_folder_scan(self):
+        """Stop the running folder scan"""
+        if self.scan_cancel:
+            self.scan_cancel.set()
     
     def remove_selected(self):
         """Remove selected files from the list"""
         selected_indices = self.file_listbox.curselection()
+        # Queued files also leave the running batch
+        if self.engine:
+            self.engine.dequeue([self.selected_files[i] for i in selected_indices])
+        self.selected_files.remove_indices(selected_indices)
         
         # Remove from last to first to avoid issues with indices
         for i in sorted(selected_indices, reverse=True):
-            del self.selected_files[i]
             self.file_listbox.delete(i)
     
     def clear_files(self):
         """Clear the file list"""
-        self.selected_files = []
+        self.cancel_folder_scan()
+        self.selected_files.clear()
         self.file_listbox.delete(0, tk.END)
     
+    def queue_files(self, files, interactive=False):
+        """Add files to the running batch, reading their headers off the UI thread"""
+        if self.engine and files:
+            threading.Thread(target=self.engine.enqueue, args=(files, interactive), daemon=True).start()
+    
+    def show_queue_menu(self, event):
+        """Show the queue actions for the selected files, or the file under the pointer"""
+        index = self.file_listbox.nearest(event.y)
+        if index >= 0 and not self.file_listbox.selection_includes(index):
+            self.file_listbox.selection_clear(0, tk.END)
+            self.file_listbox.selection_set(index)
+        
+        state = "normal" if self.engine else "disabled"
+        for i in range(self.queue_menu.index("end") + 1):
+            if self.queue_menu.type(i) == "command":
+                self.queue_menu.entryconfig(i, state=state)
+        self.queue_menu.tk_popup(event.x_root, event.y_root)
+    
+    def run_clicked_file(self, event):
+        """Run the double-clicked file now, a double-click toggles its selection twice so the pointer decides"""
+        index = self.file_listbox.nearest(event.y)
+        if 0 <= index < len(self.selected_files):
+            self.queue_action("run_now", [self.selected_files[index]])
+    
+    def queue_action(self, action, file_paths=None):
+        """Run now, move, hold or release files, the selected ones by default, in the queue of the running batch"""
+        if not self.engine:
+            return
+        
+        scheduler = self.engine.scheduler
+        if file_paths is None:
+            file_paths = [self.selected_files[i] for i in self.file_listbox.curselection()]
+        if action == "run_now":
+            # Also files that are not in the batch yet
+            self.queue_files(file_paths, interactive=True)
+            changed = file_paths
+        elif action in ("front", "end"):
+            # Keep the selection order when moving several files to the front
+            ordered = reversed(file_paths) if action == "front" else file_paths
+            changed = [file_path for file_path in ordered if scheduler.move(file_path, front=action == "front")]
+        else:
+            changed = [file_path for file_path in file_paths if scheduler.hold(file_path, held=action == "hold")]
+        
+        if action in QUEUE_COLORS:
+            for file_path in changed:
+                self.mark_file(file_path, QUEUE_COLORS[action])
+        
+        counts = scheduler.counts()
+        self.status_var.set(f"Queue: {counts['running']} running, {counts['queued']} queued, {counts['held']} held")
+    
+    def mark_file(self, file_path, color):
+        """Color a file in the list, an empty color restores the default"""
+        index = self.selected_files.index(file_path)
+        if index is None:
+            return
+        self.file_listbox.itemconfig(index, foreground=color)
+        if color:
+            self.queue_marks.add(file_path)
+        else:
+            self.queue_marks.discard(file_path)
+    
+    def clear_marks(self):
+        """Restore the default color of the files colored by the last batch"""
+        for file_path in list(self.queue_marks):
+            self.mark_file(file_path, "")
+    
     def browse_sox(self):
         """Select the SoX path"""
         sox_path = filedialog.askopenfilename(
@@ -425,6 +723,18 @@ class SpectrogramGenerator:
             if not os.path.exists(self.output_folder):
                 os.makedirs(self.output_folder)
     
+    def browse_ledger(self):
+        """Select or create the job ledger on a shared folder"""
+        ledger = filedialog.asksaveasfilename(
+            title="Select Job Ledger",
+            defaultextension=".db",
+            confirmoverwrite=False,
+            filetypes=(("Job Ledger", "*.db"), ("All Files", "*.*"))
+        )
+        
+        if ledger:
+            self.ledger_var.set(ledger)
+    
     def save_settings(self):
         """Save the settings"""
         self.sox_path = self.sox_path_var.get()
@@ -435,131 +745,207 @@ class SpectrogramGenerator:
             os.makedirs(self.output_folder)
         
         self.save_config()
+        # Remember the SoX executable for the next launch
+        spectrogram_config.sox_info(self.sox_path)
         messagebox.showinfo("Save", "Settings saved successfully!")
     
     def reset_settings(self):
         """Reset settings to default values"""
         if messagebox.askyesno("Reset", "Are you sure you want to reset all settings to default values?"):
             # Reset to default settings
-            self.width_var.set("3000")
-            self.height_var.set("513")
-            self.z_range_var.set("120")
-            self.window_type_var.set("Kaiser")
+            self.width_var.set(DEFAULT_SETTINGS["width"])
+            self.height_var.set(DEFAULT_SETTINGS["height"])
+            self.z_range_var.set(DEFAULT_SETTINGS["z_range"])
+            self.window_type_var.set(DEFAULT_SETTINGS["window_type"])
+            self.pooling_var.set(DEFAULT_SETTINGS["pooling"])
+            
+            self.zoom_width_var.set(DEFAULT_ZOOM_SETTINGS["width"])
+            self.zoom_height_var.set(DEFAULT_ZOOM_SETTINGS["height"])
+            self.zoom_z_range_var.set(DEFAULT_ZOOM_SETTINGS["z_range"])
+            self.zoom_window_type_var.set(DEFAULT_ZOOM_SETTINGS["window_type"])
+            self.zoom_start_var.set(DEFAULT_ZOOM_SETTINGS["zoom_start"])
+            self.zoom_duration_var.set(DEFAULT_ZOOM_SETTINGS["zoom_duration"])
             
-            self.zoom_width_var.set("500")
-            self.zoom_height_var.set("1025")
-            self.zoom_z_range_var.set("120")
-            self.zoom_window_type_var.set("Kaiser")
-            self.zoom_start_var.set("1:00")
-            self.zoom_duration_var.set("0:02")
+            self.workers_var.set(DEFAULT_SETTINGS["workers"])
+            self.backend_var.set(DEFAULT_SETTINGS["backend"])
+            self.ledger_var.set(DEFAULT_SETTINGS["ledger"])
+            self.output_format_var.set(DEFAULT_SETTINGS["output_format"])
+            self.compress_level_var.set(DEFAULT_SETTINGS["compress_level"])
+            self.memory_limit_var.set(DEFAULT_SETTINGS["memory_limit"])
+            self.job_timeout_var.set(DEFAULT_SETTINGS["job_timeout"])
+            self.timeout_factor_var.set(DEFAULT_SETTINGS["timeout_factor"])
+            self.retries_var.set(DEFAULT_SETTINGS["retries"])
+            self.quarantine_after_var.set(DEFAULT_SETTINGS["quarantine_after"])
     
     def refresh_output_list(self):
-        """Update the list of output files"""
-        self.output_listbox.delete(0, tk.END)
+        """Update the list of output files with the changes in the output folder (scans in the background)"""
+        if self.output_index is None or self.output_index.folder != self.output_folder:
+            self.output_index = OutputIndex(self.output_folder)
+            if self.thumbnail_browser:
+                self.thumbnail_browser.set_folder(self.output_folder)
+        
+        # One scan at a time, refresh again when it is done
+        if self.output_refresh_thread and self.output_refresh_thread.is_alive():
+            self.output_refresh_requested = True
+            return
         
-        if os.path.exists(self.output_folder):
-            files = [f for f in os.listdir(self.output_folder) if f.lower().endswith('.png')]
-            files.sort()
-            
-            for file in files:
-                self.output_listbox.insert(tk.END, file)
+        self.output_refresh_requested = False
+        self.output_refresh_thread = threading.Thread(target=self.output_index.refresh, daemon=True)
+        self.output_refresh_thread.start()
+        self.root.after(50, self.finish_output_refresh, self.output_index)
+    
+    def finish_output_refresh(self, index):
+        """Show the refreshed index once the background scan is done"""
+        if self.output_refresh_thread.is_alive():
+            self.root.after(50, self.finish_output_refresh, index)
+            return
+        
+        if index is self.output_index:
+            self.apply_output_filter()
+        if self.output_refresh_requested:
+            self.refresh_output_list()
+    
+    def schedule_output_filter(self):
+        """Filter the output list shortly after the user stops typing"""
+        if self.filter_after_id:
+            self.root.after_cancel(self.filter_after_id)
+        self.filter_after_id = self.root.after(200, self.apply_output_filter)
+    
+    def apply_output_filter(self):
+        """Show the output files matching the filter in the list and the browser"""
+        self.filter_after_id = None
+        if self.output_index is None:
+            return
+        
+        names = self.output_index.filter(self.output_filter_var.get())
+        self.output_list.set_items(names)
+        if self.thumbnail_browser:
+            self.thumbnail_browser.set_files(names)
+        
+        if len(names) == len(self.output_index):
+            self.output_count_var.set(f"{len(names)} files")
+        else:
+            self.output_count_var.set(f"{len(names)} of {len(self.output_index)} files")
     
     def open_selected_output(self, event=None):
         """Open the selected output file"""
-        selected = self.output_listbox.curselection()
+        filename = self.output_list.selected_item()
         
-        if selected:
-            index = selected[0]
-            filename = self.output_listbox.get(index)
-            filepath = os.path.join(self.output_folder, filename)
-            
-            # Open the file with the default system program
-            if sys.platform == "win32":
-                os.startfile(filepath)
-            else:
-                opener = "open" if sys.platform == "darwin" else "xdg-open"
-                subprocess.call([opener, filepath])
+        if filename:
+            self.open_output(os.path.join(self.output_folder, filename))
+    
+    def open_output(self, path):
+        """Open a tile pyramid in the deep-zoom viewer and other output files with the system viewer"""
+        if not is_pyramid_index(path):
+            self.open_path(path)
+            return
+        
+        try:
+            from red_spectrogram.pyramidviewer import PyramidViewer
+            PyramidViewer(self.root, path)
+        except ImportError:
+            messagebox.showerror("Error", "The tile pyramid viewer needs the Pillow package.")
+        except (OSError, ValueError, KeyError) as e:
+            messagebox.showerror("Error", f"Could not open the tile pyramid: {e}")
     
     def open_output_folder(self):
         """Open the output folder"""
         if os.path.exists(self.output_folder):
-            if sys.platform == "win32":
-                os.startfile(self.output_folder)
-            else:
-                opener = "open" if sys.platform == "darwin" else "xdg-open"
-                subprocess.call([opener, self.output_folder])
+            self.open_path(self.output_folder)
     
-    def validate_time_format(self, time_str):
-        """Validate the time format (M:SS)"""
-        pattern = r"^\d+:\d{2}$"
-        return bool(re.match(pattern, time_str))
+    def open_path(self, path):
+        """Open a file or folder with the default system program"""
+        if sys.platform == "win32":
+            os.startfile(path)
+        else:
+            opener = "open" if sys.platform == "darwin" else "xdg-open"
+            subprocess.call([opener, path])
     
+    def open_job_log(self):
+        """Open the job log of the output folder"""
+        log_path = os.path.join(self.output_folder, JOB_LOG_NAME)
+        if not os.path.exists(log_path):
+            messagebox.showinfo("Job Log", "No job log yet. It is written when spectrograms are generated.")
+            return
+        
+        self.open_path(log_path)
+        
+    def show_statistics(self, text):
+        """Replace the text of the statistics panel"""
+        self.stats_text.config(state="normal")
+        self.stats_text.delete("1.0", tk.END)
+        self.stats_text.insert(tk.END, text)
+        self.stats_text.config(state="disabled")
+        
     def validate_parameters(self):
         """Validate parameters against SoX limits"""
-        # Check width parameters (100-5000)
-        try:
-            width = int(self.width_var.get())
-            if width < 100 or width > 5000:
-                messagebox.showwarning("Invalid Parameter", "Width must be between 100 and 5000 pixels.")
-                return False
-            
-            zoom_width = int(self.zoom_width_var.get())
-            if zoom_width < 100 or zoom_width > 5000:
-                messagebox.showwarning("Invalid Parameter", "Zoomed Width must be between 100 and 5000 pixels.")
-                return False
-        except ValueError:
-            messagebox.showwarning("Invalid Parameter", "Width values must be integers.")
-            return False
+        errors, warnings = validate_parameters(self.collect_parameters())
         
-        # Check height parameters (should be 2^n+1 for efficiency)
-        try:
-            height = int(self.height_var.get())
-            zoom_height = int(self.zoom_height_var.get())
-            
-            # Check if heights are proper values (2^n+1)
-            # We'll just warn but allow non-optimal values
-            valid_heights = [65, 129, 257, 513, 1025, 2049, 4097]
-            if height not in valid_heights and height != 0:
-                if not messagebox.askyesno("Non-optimal Height", 
-                                       "The height value is not optimal for SoX processing.\n"
-                                       "For best performance, use values like 129, 257, 513, or 1025.\n"
-                                       "Continue anyway?"):
-                    return False
-            
-            if zoom_height not in valid_heights and zoom_height != 0:
-                if not messagebox.askyesno("Non-optimal Height", 
-                                        "The zoomed height value is not optimal for SoX processing.\n"
-                                        "For best performance, use values like 129, 257, 513, or 1025.\n"
-                                        "Continue anyway?"):
-                    return False
-        except ValueError:
-            messagebox.showwarning("Invalid Parameter", "Height values must be integers.")
+        if errors:
+            messagebox.showwarning("Invalid Parameter", errors[0])
             return False
         
-        # Check Z-range parameters (20-180)
-        try:
-            z_range = int(self.z_range_var.get())
-            if z_range < 20 or z_range > 180:
-                messagebox.showwarning("Invalid Parameter", "Z Range must be between 20 and 180 dB.")
+        # We'll just warn but allow non-optimal values
+        for warning in warnings:
+            if not messagebox.askyesno("Non-optimal Height", f"{warning}\nContinue anyway?"):
                 return False
-            
-            zoom_z_range = int(self.zoom_z_range_var.get())
-            if zoom_z_range < 20 or zoom_z_range > 180:
-                messagebox.showwarning("Invalid Parameter", "Zoomed Z Range must be between 20 and 180 dB.")
+        
+        # Check number of parallel jobs (0 = automatic)
+        try:
+            workers = int(self.workers_var.get())
+            if workers < 0:
+                messagebox.showwarning("Invalid Parameter", "Parallel Jobs must be 0 or a positive number.")
                 return False
         except ValueError:
-            messagebox.showwarning("Invalid Parameter", "Z Range values must be integers.")
+            messagebox.showwarning("Invalid Parameter", "Parallel Jobs must be an integer.")
             return False
         
         return True
     
+    def collect_parameters(self):
+        """Read the current settings into a plain dict that worker threads can use safely"""
+        return {
+            "sox_path": self.sox_path,
+            "output_folder": self.output_folder,
+            "normal": self.normal_var.get(),
+            "zoom": self.zoom_var.get(),
+            "pyramid": self.pyramid_var.get(),
+            "matrix": self.matrix_var.get(),
+            "width": self.width_var.get(),
+            "height": self.height_var.get(),
+            "z_range": self.z_range_var.get(),
+            "window_type": self.window_type_var.get(),
+            "zoom_width": self.zoom_width_var.get(),
+            "zoom_height": self.zoom_height_var.get(),
+            "zoom_z_range": self.zoom_z_range_var.get(),
+            "zoom_window_type": self.zoom_window_type_var.get(),
+            "zoom_start": self.zoom_start_var.get(),
+            "zoom_duration": self.zoom_duration_var.get(),
+            "workers": resolve_worker_count(self.workers_var.get()),
+            "backend": self.backend_var.get(),
+            "output_format": self.output_format_var.get(),
+            "compress_level": self.compress_level_var.get(),
+            "pooling": self.pooling_var.get(),
+            "memory_limit": self.memory_limit_var.get(),
+            "job_timeout": self.job_timeout_var.get(),
+            "timeout_factor": self.timeout_factor_var.get(),
+            "retries": self.retries_var.get(),
+            "retry_delay": self.config["DEFAULT"].get("retry_delay", "2"),
+            "quarantine_after": self.quarantine_after_var.get(),
+            "pyramid_max_width": self.config["DEFAULT"].get("pyramid_max_width", str(DEFAULT_MAX_WIDTH)),
+            "incremental": self.incremental_var.get(),
+            "job_log": self.config["DEFAULT"].getboolean("job_log", fallback=True)
+        }
+    
     def start_generation(self):
         """Start the spectrogram generation process"""
         if not self.selected_files:
             messagebox.showwarning("Warning", "No files selected.")
             return
         
-        if not self.sox_path or not os.path.exists(self.sox_path):
+        # The workers check their own SoX path in distributed mode
+        ledger_path = self.ledger_var.get().strip()
+        if not ledger_path and self.backend_var.get() == "sox" and (not self.sox_path or not os.path.exists(self.sox_path)):
             messagebox.showerror("Error", "Invalid SoX path. Check the settings.")
             return
         
@@ -567,158 +953,336 @@ class SpectrogramGenerator:
             os.makedirs(self.output_folder)
         
         # Check that at least one spectrogram type is selected
-        if not self.normal_var.get() and not self.zoom_var.get():
+        if not (self.normal_var.get() or self.zoom_var.get() or self.pyramid_var.get() or self.matrix_var.get()):
             messagebox.showwarning("Warning", "Select at least one spectrogram type to generate.")
             return
         
-        # Validate parameters
+        # Validate parameters (including the zoom time format)
         if not self.validate_parameters():
             return
         
-        # Check zoom time format
-        if self.zoom_var.get():
-            if not self.validate_time_format(self.zoom_start_var.get()) or not self.validate_time_format(self.zoom_duration_var.get()):
-                messagebox.showwarning("Warning", "Invalid zoom time format. Use the format M:SS")
-                return
+        # Snapshot the settings and the file list so the workers never touch Tk variables
+        self.job_params = self.collect_parameters()
+        files = list(self.selected_files)
         
-        # Create separate thread for generation
-        threading.Thread(target=self.generate_spectrograms, daemon=True).start()
-    
-    def generate_spectrograms(self):
-        """Generate spectrograms for all selected files"""
-        total_files = len(self.selected_files)
-        self.progress["maximum"] = total_files
+        if ledger_path:
+            self.start_distributed(ledger_path, files)
+            return
+        
+        self.engine = SpectrogramEngine(self.job_params)
+        self.events = queue.Queue()
+        self.failed_count = 0
+        self.clear_marks()
+        
+        # Progress in percent of the audio seconds of the batch
+        self.progress["maximum"] = 100
         self.progress["value"] = 0
+        self.status_var.set(f"Processing {len(files)} files with {self.job_params['workers']} parallel jobs...")
+        self.throughput_var.set("")
+        self.generate_button.config(state="disabled")
+        self.analyze_button.config(state="disabled")
+        self.pause_button.config(state="normal", text="Pause")
+        self.cancel_button.config(state="normal")
+        
+        # Create separate thread for generation, the UI polls its events
+        threading.Thread(target=self.generate_spectrograms, args=(self.engine, files, self.events), daemon=True).start()
+        self.root.after(100, self.drain_events)
+    
+    def generate_spectrograms(self, engine, files, events):
+        """Generate spectrograms for all files (runs in a worker thread, reports through the event queue)"""
+        def on_progress(done, total, result):
+            events.put(("progress", result, engine.stats.snapshot()))
         
-        generated_count = 0
+        try:
+            results = engine.run_batch(files, on_progress, interactive=True)
+            events.put(("done", results, engine.cache_stats()))
+        except Exception as e:
+            events.put(("failed", str(e), None))
+    
+    def start_distributed(self, ledger_path, files):
+        """Enqueue the files in the job ledger and follow the progress of the workers"""
+        # Workers on other nodes run in other folders
+        self.job_params["output_folder"] = os.path.abspath(self.job_params["output_folder"])
+        self.ledger_cancel = threading.Event()
+        self.events = queue.Queue()
+        
+        self.progress["maximum"] = len(files)
+        self.progress["value"] = 0
+        self.status_var.set(f"Enqueueing {len(files)} files in {ledger_path}...")
+        self.throughput_var.set("")
+        self.generate_button.config(state="disabled")
+        self.analyze_button.config(state="disabled")
+        self.cancel_button.config(state="normal")
+        
+        threading.Thread(target=self.follow_ledger_batch, args=(ledger_path, files, self.job_params, self.ledger_cancel, self.events), daemon=True).start()
+        self.root.after(100, self.drain_events)
+    
+    def follow_ledger_batch(self, ledger_path, files, params, cancel_event, events):
+        """Enqueue a batch and poll its progress until the workers are done (runs in a worker thread)"""
+        from red_spectrogram.ledger import JobLedger
         
-        for i, file_path in enumerate(self.selected_files):
-            file_name = os.path.basename(file_path)
-            self.status_var.set(f"Processing {i+1}/{total_files}: {file_name}")
-            self.root.update()
+        try:
+            ledger = JobLedger(ledger_path)
+            # Workers claim jobs in ledger order
+            batch = ledger.enqueue(longest_first({file_path: audio_duration(file_path) for file_path in files}), params)
+            cancelled = False
             
-            try:
-                # Generate normal spectrogram
-                if self.normal_var.get():
-                    try:
-                        self.generate_normal_spectrogram(file_path, file_name)
-                        generated_count += 1
-                    except Exception as e:
-                        messagebox.showerror("Error", f"Error generating full spectrogram for {file_name}: {str(e)}")
+            while True:
+                if cancel_event.is_set() and not cancelled:
+                    # Jobs already claimed finish on their workers
+                    ledger.cancel(batch)
+                    cancelled = True
                 
-                # Generate zoomed spectrogram
-                if self.zoom_var.get():
-                    try:
-                        self.generate_zoomed_spectrogram(file_path, file_name)
-                        generated_count += 1
-                    except Exception as e:
-                        messagebox.showerror("Error", f"Error generating zoomed spectrogram for {file_name}: {str(e)}")
-                
-                # Update progress
-                self.progress["value"] = i + 1
-                self.root.update()
+                progress = ledger.progress(batch)
+                events.put(("ledger_progress", progress, None))
+                if progress["finished"]:
+                    break
+                time.sleep(LEDGER_POLL_INTERVAL)
             
-            except Exception as e:
-                messagebox.showerror("Error", f"Error processing {file_name}: {str(e)}")
+            events.put(("ledger_done", ledger.results(batch), None))
+        except Exception as e:
+            events.put(("failed", str(e), None))
+    
+    def start_analysis(self):
+        """Start detecting lossy transcodes in the selected files"""
+        if not self.selected_files:
+            messagebox.showwarning("Warning", "No files selected.")
+            return
         
-        # Use correct plural form
-        if generated_count == 1:
-            completion_message = f"Completed! Generated {generated_count} spectrogram."
-        else:
-            completion_message = f"Completed! Generated {generated_count} spectrograms."
-            
-        self.status_var.set(completion_message)
-        self.refresh_output_list()
-        messagebox.showinfo("Complete", completion_message)
+        missing = [module for module in ("numpy", "soundfile") if not module_available(module)]
+        if missing:
+            messagebox.showerror("Error", f"The analysis needs these Python packages: {', '.join(missing)}")
+            return
+        
+        files = list(self.selected_files)
+        workers = resolve_worker_count(self.workers_var.get())
+        self.analysis_cancel = threading.Event()
+        self.events = queue.Queue()
+        
+        self.progress["maximum"] = len(files)
+        self.progress["value"] = 0
+        self.status_var.set(f"Analyzing {len(files)} files with {workers} parallel jobs...")
+        self.throughput_var.set("")
+        self.generate_button.config(state="disabled")
+        self.analyze_button.config(state="disabled")
+        self.cancel_button.config(state="normal")
+        
+        threading.Thread(target=self.analyze_files, args=(files, workers, self.analysis_cancel, self.events), daemon=True).start()
+        self.root.after(100, self.drain_events)
     
-    def generate_normal_spectrogram(self, file_path, file_name):
-        """Generate a normal spectrogram"""
-        output_path = os.path.join(self.output_folder, f"{file_name}_full.png")
+    def analyze_files(self, files, workers, cancel_event, events):
+        """Analyze all files (runs in a worker thread, reports through the event queue)"""
+        from red_spectrogram.analysis import analyze_files
         
-        # Get the SoX directory to set the correct environment
-        sox_dir = os.path.dirname(self.sox_path)
+        def on_result(done, total, result):
+            events.put(("analysis_progress", result, (done, total)))
         
-        # Prepare the SoX command as a string to use shell=True
-        sox_cmd = f'"{self.sox_path}" "{file_path}" -n remix 1 spectrogram -x {self.width_var.get()} -y {self.height_var.get()} -z {self.z_range_var.get()} -w {self.window_type_var.get()} -t "{file_name} [FULL]" -o "{output_path}"'
+        try:
+            events.put(("analysis_done", analyze_files(files, workers, on_result, cancel_event), None))
+        except Exception as e:
+            events.put(("failed", str(e), None))
+    
+    def finish_analysis(self, results):
+        """Save the analysis report and list the suspicious files"""
+        from red_spectrogram.analysis import ANALYSIS_REPORT_NAME, flagged, write_report
         
-        print(f"Executing command: {sox_cmd}")
+        cancelled = self.analysis_cancel.is_set()
+        self.end_generation()
         
+        if not os.path.exists(self.output_folder):
+            os.makedirs(self.output_folder)
+        report_path = os.path.join(self.output_folder, ANALYSIS_REPORT_NAME)
         try:
-            # Save the current directory
-            current_dir = os.getcwd()
-            
-            # Change to the SoX directory to ensure it finds all its DLLs
-            if os.path.exists(sox_dir):
-                os.chdir(sox_dir)
-            
-            # Execute the command
-            result = subprocess.run(sox_cmd, shell=True, check=True, capture_output=True, text=True)
-            
-            # Restore the original directory
-            os.chdir(current_dir)
+            write_report(results, report_path)
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not save the analysis report: {e}")
+        
+        suspicious = flagged(results)
+        lines = [f"{len(suspicious)} of {len(results)} files look like lossy transcodes or upsampled files.",
+                 f"Full report: {report_path}", ""]
+        for result in suspicious:
+            lines.append(f"  {result['score']:3d}  {result['verdict']:<9} cutoff {result['cutoff_hz'] / 1000:.1f} kHz  {os.path.basename(result['file'])}")
+        self.show_statistics("\n".join(lines))
+        
+        message = f"Analyzed {len(results)} files, {len(suspicious)} flagged."
+        self.status_var.set(("Cancelled! " if cancelled else "Completed! ") + message)
+        if suspicious:
+            self.notebook.select(self.stats_tab)
+        messagebox.showinfo("Analysis Complete", f"{message} The flagged files are listed in the Statistics tab.")
+    
+    def drain_events(self):
+        """Apply the events of the running batch to the UI (runs on the UI thread)"""
+        while True:
+            try:
+                kind, payload, extra = self.events.get_nowait()
+            except queue.Empty:
+                break
             
-            # Print any error output
-            if result.stderr:
-                print(f"Error output: {result.stderr}")
+            if kind == "progress":
+                self.show_progress(payload, extra)
+            elif kind == "done":
+                self.finish_generation(payload, extra)
+                return
+            elif kind == "ledger_progress":
+                self.show_ledger_progress(payload)
+            elif kind == "ledger_done":
+                self.finish_distributed(payload)
+                return
+            elif kind == "analysis_progress":
+                done, total = extra
+                self.progress["value"] = done
+                self.status_var.set(f"Analyzed {done}/{total}: {os.path.basename(payload['file'])}")
+            elif kind == "analysis_done":
+                self.finish_analysis(payload)
+                return
+            elif kind == "failed":
+                self.end_generation()
+                self.status_var.set("Generation failed.")
+                messagebox.showerror("Error", f"Error generating spectrograms: {payload}")
+                return
         
-        except subprocess.CalledProcessError as e:
-            print(f"Error executing SoX: {e}")
-            print(f"Error output: {e.stderr if hasattr(e, 'stderr') else 'No details available'}")
-            
-            # Restore the original directory in case of error
-            if os.getcwd() != current_dir:
-                os.chdir(current_dir)
-            
-            messagebox.showerror("SoX Error", f"Error generating spectrogram:\n{str(e)}")
-            raise
+        self.root.after(100, self.drain_events)
     
-    def generate_zoomed_spectrogram(self, file_path, file_name):
-        """Generate a zoomed spectrogram"""
-        output_path = os.path.join(self.output_folder, f"{file_name}_zoom.png")
+    def show_progress(self, result, stats):
+        """Show the progress of one finished file"""
+        file_name = os.path.basename(result["file"])
+        
+        # Failures are collected for the end of the batch, a dialog would stall it until someone clicks OK
+        if result["status"] in ("error", "quarantined"):
+            self.failed_count += 1
+        self.mark_file(result["file"], QUEUE_COLORS["done"])
+        failed = f" ({self.failed_count} failed)" if self.failed_count else ""
+        self.status_var.set(f"Processed {stats['done']}/{stats['total']}{failed}: {file_name}")
+        self.progress["value"] = stats["progress"] * 100
+        
+        throughput = f"{stats['files_per_second']:.2f} files/s, {stats['audio_seconds_per_second']:.0f} audio s/s"
+        if stats["eta"] is not None and stats["done"] < stats["total"]:
+            throughput += f", ETA {format_duration(stats['eta'])}"
+        if self.engine:
+            held = self.engine.scheduler.counts()["held"]
+            if held:
+                throughput += f", {held} held"
+        if self.engine and self.engine.is_paused():
+            throughput += " (paused)"
+        self.throughput_var.set(throughput)
+    
+    def show_ledger_progress(self, progress):
+        """Show the progress of all workers on the distributed batch"""
+        self.progress["maximum"] = max(1, progress["total"])
+        self.progress["value"] = progress["done"]
+        self.status_var.set(f"Distributed: {progress['done']}/{progress['total']} files, "
+                            f"{progress['running']} running on {len(progress['workers'])} workers")
+        
+        details = f"{progress['queued']} queued"
+        if progress["error"]:
+            details += f", {progress['error']} failed"
+        if not progress["workers"] and progress["queued"]:
+            details += ", waiting for a worker"
+        self.throughput_var.set(details)
+    
+    def toggle_pause(self):
+        """Pause or resume the running batch"""
+        if not self.engine:
+            return
         
-        # Get the SoX directory to set the correct environment
-        sox_dir = os.path.dirname(self.sox_path)
+        if self.engine.is_paused():
+            self.engine.resume()
+            self.pause_button.config(text="Pause")
+            self.status_var.set("Resumed.")
+        else:
+            self.engine.pause()
+            self.pause_button.config(text="Resume")
+            self.status_var.set("Paused: running jobs will finish, only files run with Run Now will start.")
+    
+    def cancel_generation(self):
+        """Cancel the running batch and stop its SoX processes"""
+        if self.analysis_cancel:
+            self.analysis_cancel.set()
+            self.status_var.set("Cancelling...")
+            self.cancel_button.config(state="disabled")
+        if self.ledger_cancel:
+            self.ledger_cancel.set()
+            self.status_var.set("Cancelling: running jobs finish on their workers...")
+            self.cancel_button.config(state="disabled")
+        if self.engine:
+            self.engine.cancel()
+            self.status_var.set("Cancelling...")
+            self.pause_button.config(state="disabled")
+            self.cancel_button.config(state="disabled")
+    
+    def end_generation(self):
+        """Restore the buttons after a batch"""
+        self.engine = None
+        self.analysis_cancel = None
+        self.ledger_cancel = None
+        self.generate_button.config(state="normal")
+        self.analyze_button.config(state="normal")
+        self.pause_button.config(state="disabled", text="Pause")
+        self.cancel_button.config(state="disabled")
+    
+    def finish_generation(self, results, cache):
+        """Show the outcome of a finished batch"""
+        cancelled = self.engine.cancelled
+        stats = self.engine.stats.snapshot()
+        error_report = self.engine.error_report
+        self.end_generation()
         
-        # Prepare the SoX command as a string to use shell=True
-        start_time = self.zoom_start_var.get()
-        duration = self.zoom_duration_var.get()
+        generated_count = sum(len(result["outputs"]) for result in results)
         
-        sox_cmd = f'"{self.sox_path}" "{file_path}" -n remix 1 spectrogram -x {self.zoom_width_var.get()} -y {self.zoom_height_var.get()} -z {self.zoom_z_range_var.get()} -w {self.zoom_window_type_var.get()} -t "{file_name} [ZOOM {start_time} to {start_time}+{duration}]" -S {start_time} -d {duration} -o "{output_path}"'
+        # Use correct plural form
+        if generated_count == 1:
+            completion_message = f"Generated {generated_count} spectrogram."
+        else:
+            completion_message = f"Generated {generated_count} spectrograms."
         
-        print(f"Executing command: {sox_cmd}")
+        if cancelled:
+            completion_message = f"Cancelled! {completion_message}"
+        else:
+            completion_message = f"Completed! {completion_message}"
         
-        try:
-            # Save the current directory
-            current_dir = os.getcwd()
-            
-            # Change to the SoX directory to ensure it finds all its DLLs
-            if os.path.exists(sox_dir):
-                os.chdir(sox_dir)
-            
-            # Execute the command
-            result = subprocess.run(sox_cmd, shell=True, check=True, capture_output=True, text=True)
-            
-            # Restore the original directory
-            os.chdir(current_dir)
-            
-            # Print any error output
-            if result.stderr:
-                print(f"Error output: {result.stderr}")
+        if cache["hits"]:
+            completion_message += f" Skipped {cache['hits']} up to date ({cache['misses']} cache misses)."
         
-        except subprocess.CalledProcessError as e:
-            print(f"Error executing SoX: {e}")
-            print(f"Error output: {e.stderr if hasattr(e, 'stderr') else 'No details available'}")
-            
-            # Restore the original directory in case of error
-            if os.getcwd() != current_dir:
-                os.chdir(current_dir)
-            
-            messagebox.showerror("SoX Error", f"Error generating spectrogram:\n{str(e)}")
-            raise
-
+        failed = failures(results)
+        lines = [format_summary(summarize(results))]
+        if failed:
+            completion_message += f" {len(failed)} files failed, see the Statistics tab."
+            lines += ["", "Failed files:", format_error_report(results)]
+            if error_report:
+                lines += ["", f"Error report: {error_report}"]
+        
+        self.throughput_var.set(f"{stats['done']} files in {format_duration(stats['elapsed'])}, "
+                                f"{stats['files_per_second']:.2f} files/s, {stats['audio_seconds_per_second']:.0f} audio s/s")
+        self.status_var.set(completion_message)
+        self.show_statistics("\n".join(lines))
+        self.refresh_output_list()
+        if failed:
+            self.notebook.select(self.stats_tab)
+        messagebox.showinfo("Complete", completion_message)
+    
+    def finish_distributed(self, results):
+        """Show the outcome of a distributed batch"""
+        cancelled = self.ledger_cancel.is_set()
+        self.end_generation()
+        
+        generated_count = sum(len(result["outputs"]) for result in results)
+        failed = [result for result in results if result["status"] == "error"]
+        completion_message = f"{'Cancelled' if cancelled else 'Completed'}! Generated {generated_count} spectrogram{'' if generated_count == 1 else 's'}."
+        if failed:
+            completion_message += f" {len(failed)} files failed."
+        
+        lines = [format_summary(summarize(results))]
+        if failed:
+            lines += ["", "Failed files:"] + [f"  {os.path.basename(result['file'])}: {result['error']}" for result in failed]
+        
+        self.throughput_var.set("")
+        self.status_var.set(completion_message)
+        self.show_statistics("\n".join(lines))
+        self.refresh_output_list()
+        messagebox.showinfo("Complete", completion_message)
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     root = tk.Tk()
     app = SpectrogramGenerator(root)
     root.mainloop()
-    
\ No newline at end of file
@@ -0,0 +1,11 @@
+"""Spectrogram generation engine for RED-Spectrogram
+
+This package has no dependency on Tk so it can be used from the
+command line and on machines without a display.
+"""
+
+__version__ = "2.0"
+
+from .config import WINDOW_TYPES, find_sox_path, get_application_path, load_config, save_config
+from .backends import BACKEND_NAMES, BackendUnavailable, SoxError, SpectrogramBackend, SoxBackend
+from .engine import SpectrogramEngine, parameters_from_config, parse_time, validate_parameters, validate_time_format
@@ -0,0 +1,235 @@
+"""Lossy transcode detection
+
+Lossy encoders low-pass the audio (around 16 kHz for 128 kbps MP3, 19-20
+kHz for high bitrates), and a FLAC made from such a file keeps that
+brick-wall cutoff. Upsampled files show the same shelf at the Nyquist
+frequency of the source. This module estimates, per file:
+
+- the effective cutoff frequency of the long-term average spectrum,
+- the shelf depth and steepness at that cutoff,
+- a suspicion score from 0 (looks lossless) to 100 (almost certainly lossy),
+
+so that only the flagged files need a look at their spectrograms.
+"""
+import os
+import csv
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+from .backends import BackendUnavailable
+from .archives import open_soundfile
+
+logger = logging.getLogger(__name__)
+
+# DFT size of the average spectrum, about 10 Hz per bin at 44.1 kHz
+FFT_SIZE = 4096
+
+# DFT frames decoded and transformed at once, keeps memory flat on long files
+BLOCK_FRAMES = 512
+
+# Width of the smoothing applied to the spectrum before looking for the cutoff
+SMOOTHING_HZ = 200
+
+# Reference band for the level of the music itself
+REFERENCE_BAND = (2000, 8000)
+
+# Content counts as present down to this level above the noise floor
+FLOOR_MARGIN_DB = 10
+
+ANALYSIS_REPORT_NAME = "red-spectrogram-analysis.csv"
+
+# Scores from which a file is listed as suspicious or worth a check
+SUSPICIOUS_SCORE = 50
+CHECK_SCORE = 25
+
+# Columns of the CSV report, in order
+REPORT_FIELDS = ["file", "score", "verdict", "cutoff_hz", "cutoff_ratio", "shelf_db", "steepness_db_per_khz",
+                 "sample_rate", "channels", "duration", "error"]
+
+
+def average_spectrum(file_path, fft_size=FFT_SIZE, cancel_event=None):
+    """Get the mean power spectrum of the mid channel of a file
+
+    Returns (power, sample_rate, channels, duration). Frames do not
+    overlap, which is plenty for a long-term average.
+    """
+    if soundfile is None:
+        raise BackendUnavailable("The analysis needs the soundfile package to decode FLAC files")
+
+    window = np.hanning(fft_size).astype(np.float32)
+    total = np.zeros(fft_size // 2 + 1)
+    frames = 0
+
+    with open_soundfile(file_path) as f:
+        sample_rate = f.samplerate
+        channels = f.channels
+        duration = f.frames / sample_rate
+
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                raise InterruptedError("Analysis cancelled")
+
+            block = f.read(fft_size * BLOCK_FRAMES, dtype="float32", always_2d=True)
+            count = len(block) // fft_size
+            if count == 0:
+                break
+
+            mid = block[:count * fft_size].mean(axis=1).reshape(count, fft_size)
+            spectrum = np.fft.rfft(mid * window, axis=1)
+            total += (spectrum.real ** 2 + spectrum.imag ** 2).sum(axis=0)
+            frames += count
+
+    if not frames:
+        raise ValueError("File is too short to analyze")
+
+    return total / frames, sample_rate, channels, duration
+
+
+def smooth(values, width):
+    """Moving average over width bins"""
+    if width <= 1:
+        return values
+    kernel = np.ones(width) / width
+    padded = np.pad(values, (width // 2, width - width // 2 - 1), mode="edge")
+    return np.convolve(padded, kernel, mode="valid")
+
+
+def estimate_cutoff(power, sample_rate):
+    """Find the cutoff frequency, shelf depth and steepness of an average spectrum
+
+    Returns a dict with cutoff_hz, shelf_db and steepness_db_per_khz.
+    """
+    bins = len(power)
+    nyquist = sample_rate / 2
+    bin_hz = nyquist / (bins - 1)
+    levels = smooth(10 * np.log10(power + 1e-20), max(1, int(SMOOTHING_HZ / bin_hz)))
+
+    def band(low, high):
+        return levels[int(low / bin_hz):max(int(low / bin_hz) + 1, int(high / bin_hz))]
+
+    reference = np.median(band(*REFERENCE_BAND))
+    # The top 2 % of the band is silent above a cutoff, and music below none
+    floor = np.median(levels[int(bins * .98):])
+
+    if reference - floor < FLOOR_MARGIN_DB * 2:
+        return {"cutoff_hz": round(nyquist), "shelf_db": round(float(max(reference - floor, 0.0)), 1), "steepness_db_per_khz": 0.0}
+
+    # Highest frequency still clearly above the floor
+    above = np.nonzero(levels > floor + FLOOR_MARGIN_DB)[0]
+    cutoff_bin = int(above[-1]) if len(above) else 0
+    cutoff = cutoff_bin * bin_hz
+
+    # Level just below the cutoff against the floor just above it
+    below = levels[max(0, cutoff_bin - int(1000 / bin_hz))]
+    after = levels[min(bins - 1, cutoff_bin + int(250 / bin_hz))]
+    shelf = below - floor
+
+    return {
+        "cutoff_hz": round(cutoff),
+        "shelf_db": round(float(shelf), 1),
+        "steepness_db_per_khz": round(float((below - after) / 1.25), 1)
+    }
+
+
+def suspicion_score(cutoff, sample_rate, steepness):
+    """Score from 0 to 100: how far below Nyquist the cutoff is, weighted by how sharp it is"""
+    nyquist = sample_rate / 2
+    # CD masters often have an anti-alias filter near 21 kHz, lossy encoders cut at 20 kHz or lower
+    gap = np.clip((0.95 * nyquist - cutoff) / (0.15 * nyquist), 0, 1)
+    sharpness = np.clip(steepness / 30, 0, 1)
+    return int(round(100 * gap * (0.4 + 0.6 * sharpness)))
+
+
+def verdict(score, cutoff, sample_rate):
+    """Describe a score in words"""
+    if score >= SUSPICIOUS_SCORE:
+        # A high-resolution file that stops at the Nyquist frequency of CD or DAT audio
+        if sample_rate > 48000 and cutoff <= 24500:
+            return "upsampled"
+        return "lossy"
+    if score >= CHECK_SCORE:
+        return "check"
+    return "ok"
+
+
+def analyze_file(file_path, cancel_event=None):
+    """Analyze one file and describe the result as a dict with the REPORT_FIELDS keys"""
+    result = {field: None for field in REPORT_FIELDS}
+    result["file"] = file_path
+
+    try:
+        power, sample_rate, channels, duration = average_spectrum(file_path, cancel_event=cancel_event)
+        result.update(estimate_cutoff(power, sample_rate))
+        result.update({
+            "sample_rate": sample_rate,
+            "channels": channels,
+            "duration": round(duration, 2),
+            "cutoff_ratio": round(result["cutoff_hz"] / (sample_rate / 2), 3)
+        })
+        result["score"] = suspicion_score(result["cutoff_hz"], sample_rate, result["steepness_db_per_khz"])
+        result["verdict"] = verdict(result["score"], result["cutoff_hz"], sample_rate)
+    except InterruptedError:
+        result["verdict"] = "cancelled"
+    except Exception as e:
+        logger.error(f"Error analyzing {os.path.basename(file_path)}: {e}")
+        result["verdict"] = "error"
+        result["error"] = str(e)
+
+    return result
+
+
+def analyze_files(files, workers, on_result=None, cancel_event=None):
+    """Analyze files on a pool of parallel jobs
+
+    libsndfile decoding and the NumPy FFTs run without the GIL, so threads
+    spread the work over the cores like the spectrogram jobs do.
+    on_result(done, total, result) is called as files finish.
+    Returns the results in list order.
+    """
+    files = list(files)
+    results = [None] * len(files)
+    cancel_event = cancel_event or threading.Event()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(analyze_file, file_path, cancel_event): i for i, file_path in enumerate(files)}
+        for done, future in enumerate(as_completed(futures), 1):
+            results[futures[future]] = future.result()
+            if on_result:
+                on_result(done, len(files), results[futures[future]])
+
+    return results
+
+
+def sort_report(results):
+    """Sort results by score, most suspicious first, errors last"""
+    return sorted(results, key=lambda result: (result["score"] is None, -(result["score"] or 0), result["file"]))
+
+
+def write_report(results, path):
+    """Write the results as CSV, or as JSON when the path ends with .json"""
+    results = sort_report(results)
+    temp_path = path + ".tmp"
+
+    with open(temp_path, "w", encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".json"):
+            json.dump({"generated": time.strftime("%Y-%m-%dT%H:%M:%S"), "files": results}, f, indent=2)
+        else:
+            writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+            writer.writeheader()
+            writer.writerows(results)
+    os.replace(temp_path, path)
+
+
+def flagged(results):
+    """Get the suspicious results, most suspicious first"""
+    return [result for result in sort_report(results) if (result["score"] or 0) >= SUSPICIOUS_SCORE]
@@ -0,0 +1,139 @@
+"""FLAC files inside zip and tar archives
+
+A track inside an archive is named "<archive path>!/<member path>", for
+example /incoming/album.zip!/CD1/01 Intro.flac. The members are listed
+from the archive index and their bytes are streamed to the backends, so
+nothing is extracted to disk. The archive's size and mtime stand in for
+the size and mtime of its members in the caches.
+"""
+import os
+import tarfile
+import zipfile
+import logging
+import contextlib
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+# Between the archive path and the member path
+MEMBER_SEPARATOR = "!/"
+
+# Errors of a damaged or unsupported archive
+ARCHIVE_ERRORS = (OSError, EOFError, zipfile.BadZipFile, tarfile.TarError, KeyError)
+
+
+def is_archive(path):
+    """Check if a path names a supported archive"""
+    return path.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def member_path(archive_path, member):
+    """Get the path of an archive member"""
+    return f"{archive_path}{MEMBER_SEPARATOR}{member}"
+
+
+def split_member_path(path):
+    """Split the path of an archive member into (archive path, member name), or None for other paths"""
+    lower = path.lower()
+    # os.path.abspath turns the separator into a backslash on Windows
+    for separator in (MEMBER_SEPARATOR, "!\\"):
+        for extension in ARCHIVE_EXTENSIONS:
+            index = lower.find(extension + separator)
+            if index != -1:
+                archive_end = index + len(extension)
+                return path[:archive_end], path[archive_end + len(separator):].replace("\\", "/")
+    return None
+
+
+def is_member_path(path):
+    """Check if a path names a file inside an archive"""
+    return split_member_path(path) is not None
+
+
+def output_name(path):
+    """Get the name the outputs of a file are based on
+
+    Archive members are named after the archive and the full member path,
+    so the tracks of different albums and discs do not overwrite each other.
+    """
+    parts = split_member_path(path)
+    if parts is None:
+        return os.path.basename(path)
+    archive_path, member = parts
+    return f"{os.path.basename(archive_path)}_{member.replace('/', '_')}"
+
+
+def source_stat(path):
+    """Stat a file, or the archive that contains it"""
+    parts = split_member_path(path)
+    return os.stat(parts[0] if parts else path)
+
+
+def iter_archive_members(archive_path, extensions=(".flac",)):
+    """Yield the paths of the audio files in an archive, in archive order, from its index"""
+    try:
+        if archive_path.lower().endswith(".zip"):
+            with zipfile.ZipFile(archive_path) as archive:
+                names = [info.filename for info in archive.infolist() if not info.is_dir()]
+        else:
+            # Compressed tar files have no index, listing them decompresses them once
+            with tarfile.open(archive_path) as archive:
+                names = [info.name for info in archive.getmembers() if info.isfile()]
+    except ARCHIVE_ERRORS as e:
+        logger.warning(f"Cannot read archive {archive_path}: {e}")
+        return
+
+    for name in names:
+        if name.lower().endswith(extensions):
+            yield member_path(archive_path, name)
+
+
+def expand_archives(paths, extensions=(".flac",)):
+    """Yield the paths, with every archive replaced by the audio files it contains"""
+    for path in paths:
+        if is_archive(path) and os.path.isfile(path):
+            yield from iter_archive_members(path, extensions)
+        else:
+            yield path
+
+
+@contextlib.contextmanager
+def open_member(path):
+    """Open an archive member for streaming binary reads"""
+    archive_path, member = split_member_path(path)
+
+    if archive_path.lower().endswith(".zip"):
+        with zipfile.ZipFile(archive_path) as archive, archive.open(member) as f:
+            yield f
+    else:
+        with tarfile.open(archive_path) as archive:
+            f = archive.extractfile(member)
+            if f is None:
+                raise KeyError(f"Not a regular file in {archive_path}: {member}")
+            with f:
+                yield f
+
+
+def open_source(path):
+    """Open a file or an archive member for binary reading"""
+    if is_member_path(path):
+        return open_member(path)
+    return open(path, "rb")
+
+
+@contextlib.contextmanager
+def open_soundfile(path):
+    """Open a file or an archive member with soundfile
+
+    Plain files are opened by path so libsndfile reads them directly.
+    """
+    import soundfile
+
+    if not is_member_path(path):
+        with soundfile.SoundFile(path) as f:
+            yield f
+    else:
+        with open_member(path) as source, soundfile.SoundFile(source) as f:
+            yield f
+
@@ -0,0 +1,660 @@
+"""Spectrogram backends
+
+A backend turns one audio file into the full and/or zoomed spectrogram
+images. The SoX backend runs the external SoX binary, the NumPy backend
+(see numpy_backend.py) decodes and renders in-process.
+"""
+import os
+import time
+import shutil
+import subprocess
+import logging
+import threading
+import contextlib
+import importlib.util
+
+from .joblog import StageTimer
+from .flacinfo import audio_duration, read_streaminfo, READ_ERRORS
+from .pyramid import PYRAMID_SUFFIX, build_pyramid, pyramid_width
+from .matrix import MATRIX_SUFFIX
+from .archives import is_member_path, open_member
+from .zoom import (parse_time, format_time, split_zoom_starts, has_multiple_windows, expand_zoom_starts,
+                   resolve_zoom_start, is_absolute, zoom_label)
+
+logger = logging.getLogger(__name__)
+
+# SoX renderers fed by one decode, more spectrograms decode the file again
+MAX_RENDERERS = 8
+
+
+class SoxError(Exception):
+    """Raised when a SoX process exits with an error"""
+
+    def __init__(self, command, returncode, stderr=""):
+        self.command = command
+        self.returncode = returncode
+        self.stderr = stderr or ""
+        message = f"SoX exited with status {returncode}"
+        if self.stderr.strip():
+            message += f": {self.stderr.strip()}"
+        super().__init__(message)
+
+
+class BackendUnavailable(Exception):
+    """Raised when a backend cannot be used because a dependency is missing"""
+
+
+class BatchCancelled(Exception):
+    """Raised when a job is stopped because the batch was cancelled"""
+
+
+class JobTimeout(Exception):
+    """Raised when a job runs longer than its time limit"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        super().__init__(f"Timed out after {seconds:.1f}s")
+
+
+class JobWatchdog:
+    """Kill the processes of one job once its time limit has passed
+
+    SoX processes are killed where they hang. In-process work, like the
+    decoding of the numpy backend, stops at its next cancellation check.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.deadline = time.monotonic() + seconds
+        self.expired = False
+        self.processes = set()
+        self.lock = threading.Lock()
+        self.timer = threading.Timer(seconds, self.expire)
+        self.timer.daemon = True
+
+    def expire(self):
+        """Kill the running processes of the job"""
+        with self.lock:
+            self.expired = True
+            processes = list(self.processes)
+
+        for process in processes:
+            try:
+                process.kill()
+            except OSError:
+                pass
+
+    def add(self, process):
+        """Watch a process started by the job"""
+        with self.lock:
+            self.processes.add(process)
+
+    def discard(self, process):
+        """Stop watching a process that has exited"""
+        with self.lock:
+            self.processes.discard(process)
+
+    def check(self):
+        """Raise JobTimeout once the time limit has passed"""
+        if self.expired or time.monotonic() > self.deadline:
+            raise JobTimeout(self.seconds)
+
+
+class MemberFeeder(threading.Thread):
+    """Copy an archive member to the stdin of a process on a separate thread"""
+
+    def __init__(self, file_path, stdin):
+        super().__init__(daemon=True)
+        self.file_path = file_path
+        self.stdin = stdin
+        self.error = None
+
+    def run(self):
+        try:
+            with open_member(self.file_path) as source:
+                shutil.copyfileobj(source, self.stdin, 256 * 1024)
+        except BrokenPipeError:
+            # SoX stops reading once a zoom window is done
+            pass
+        except Exception as e:
+            self.error = e
+        finally:
+            try:
+                self.stdin.close()
+            except OSError:
+                pass
+
+
+class PipeReader(threading.Thread):
+    """Read the error output of a process on a separate thread, so a full pipe never blocks it"""
+
+    def __init__(self, pipe):
+        super().__init__(daemon=True)
+        self.pipe = pipe
+        self.output = b""
+
+    def run(self):
+        try:
+            self.output = self.pipe.read()
+        except (OSError, ValueError):
+            # The pipe was closed when the process was killed
+            pass
+
+    def text(self):
+        """Wait for the end of the output and decode it"""
+        self.join()
+        return self.output.decode(errors="replace")
+
+
+class SpectrogramBackend:
+    """Base class for the spectrogram backends
+
+    Subclasses implement generate_normal_spectrogram and
+    generate_zoomed_spectrogram. generate_combined_spectrograms should be
+    overridden when a backend can render both from a single decode.
+    The zoom methods take the zoom positions to render, all positions of
+    the zoom start setting by default. Every method returns the list of
+    written output paths, the full spectrogram first. Backends that
+    implement generate_pyramid can also write a deep-zoom tile pyramid,
+    those that implement generate_matrix the dB matrix of the full
+    spectrogram.
+    """
+
+    name = None
+
+    def __init__(self, params):
+        self.params = params
+        self.cancelled = False
+        # Processes started by running jobs, so they can be stopped on cancel
+        self.processes = set()
+        self.process_lock = threading.Lock()
+        # Stage timings of the job running on each worker thread
+        self.local = threading.local()
+
+    def begin_job(self):
+        """Start timing a new job on the current thread and return its timer"""
+        self.local.timer = StageTimer()
+        return self.local.timer
+
+    @property
+    def timer(self):
+        """Get the stage timer of the job running on the current thread"""
+        if getattr(self.local, "timer", None) is None:
+            self.local.timer = StageTimer()
+        return self.local.timer
+
+    def start_process(self, command, **kwargs):
+        """Start a process that is terminated when the batch is cancelled"""
+        logger.info(f"Executing command: {subprocess.list2cmdline(command)}")
+
+        watchdog = getattr(self.local, "watchdog", None)
+        with self.process_lock:
+            if self.cancelled:
+                raise BatchCancelled()
+            if watchdog:
+                watchdog.check()
+            with self.timer.measure("spawn"):
+                process = subprocess.Popen(command, **kwargs)
+            self.processes.add(process)
+        if watchdog:
+            watchdog.add(process)
+        return process
+
+    def finish_process(self, process):
+        """Forget a process that has exited and record its exit status"""
+        with self.process_lock:
+            self.processes.discard(process)
+        watchdog = getattr(self.local, "watchdog", None)
+        if watchdog:
+            watchdog.discard(process)
+        if process.returncode is not None:
+            self.timer.exit_statuses.append(process.returncode)
+
+    @contextlib.contextmanager
+    def time_limit(self, seconds):
+        """Kill the processes the current thread starts after seconds and raise JobTimeout, None means no limit"""
+        if not seconds:
+            yield
+            return
+
+        watchdog = JobWatchdog(seconds)
+        self.local.watchdog = watchdog
+        watchdog.timer.start()
+        try:
+            yield
+        except (BatchCancelled, JobTimeout):
+            raise
+        except Exception:
+            if watchdog.expired:
+                # The error is a consequence of the killed processes
+                raise JobTimeout(seconds)
+            raise
+        finally:
+            watchdog.timer.cancel()
+            self.local.watchdog = None
+
+    def terminate(self):
+        """Stop all running processes and refuse to start new ones"""
+        with self.process_lock:
+            self.cancelled = True
+            processes = list(self.processes)
+
+        for process in processes:
+            try:
+                process.kill()
+            except OSError:
+                pass
+
+    def check_cancelled(self):
+        """Raise BatchCancelled if the batch was cancelled, JobTimeout if the job ran out of time"""
+        if self.cancelled:
+            raise BatchCancelled()
+        watchdog = getattr(self.local, "watchdog", None)
+        if watchdog:
+            watchdog.check()
+
+    @classmethod
+    def missing_dependencies(cls, params):
+        """Get a description of what is missing to use this backend, or None"""
+        return None
+
+    def full_output_path(self, file_name):
+        """Get the output path of the full spectrogram"""
+        return os.path.join(self.params["output_folder"], f"{file_name}_full.png")
+
+    def zoomed_output_path(self, file_name, spec=None):
+        """Get the output path of a zoomed spectrogram, named after its position when there are several"""
+        if spec is None:
+            return os.path.join(self.params["output_folder"], f"{file_name}_zoom.png")
+        return os.path.join(self.params["output_folder"], f"{file_name}_zoom_{zoom_label(spec)}.png")
+
+    def matrix_output_path(self, file_name):
+        """Get the output path of the dB matrix of the full spectrogram"""
+        return os.path.join(self.params["output_folder"], f"{file_name}{MATRIX_SUFFIX}")
+
+    def pyramid_folder(self, file_name):
+        """Get the folder of the tile pyramid of a file"""
+        return os.path.join(self.params["output_folder"], f"{file_name}{PYRAMID_SUFFIX}")
+
+    def pyramid_width(self, duration):
+        """Get the number of columns of the finest pyramid level of a track"""
+        return pyramid_width(duration, self.params["height"], self.params.get("pyramid_max_width"))
+
+    def write_pyramid(self, image, file_path, file_name, sample_rate, duration):
+        """Cut the spectrogram image of the finest level into the tile pyramid, return [index path]"""
+        info = {
+            "file": file_path,
+            "title": self.full_title(file_name),
+            "duration": duration,
+            "sample_rate": sample_rate,
+            "z_range": int(self.params["z_range"]),
+            "window_type": self.params["window_type"]
+        }
+        with self.timer.measure("save"):
+            index_path = build_pyramid(image, self.pyramid_folder(file_name), info, self.params.get("output_format", "png"),
+                                       int(self.params.get("compress_level", 9)), self.check_cancelled)
+        return [index_path]
+
+    def full_title(self, file_name):
+        """Get the title of the full spectrogram"""
+        return f"{file_name} [FULL]"
+
+    def zoomed_title(self, file_name, spec=None, start=None):
+        """Get the title of a zoomed spectrogram"""
+        start_time = spec or self.params["zoom_start"]
+        duration = self.params["zoom_duration"]
+        if start is None or is_absolute(start_time):
+            return f"{file_name} [ZOOM {start_time} to {start_time}+{duration}]"
+        return f"{file_name} [ZOOM {start_time}: {format_time(start)} to {format_time(start)}+{duration}]"
+
+    def track_duration(self, file_path):
+        """Get the duration of a track in seconds, or None when it is unknown"""
+        return audio_duration(file_path)
+
+    def zoom_windows(self, file_path, file_name, specs=None):
+        """Resolve zoom positions to windows with their start, duration, output path and title"""
+        all_specs = split_zoom_starts(self.params["zoom_start"])
+        multiple = has_multiple_windows(all_specs)
+        if specs is None:
+            specs = all_specs
+
+        # Only read the header when a position depends on the track duration
+        total_duration = None
+        if not all(is_absolute(spec) for spec in specs):
+            total_duration = self.track_duration(file_path)
+
+        duration = parse_time(self.params["zoom_duration"])
+        windows = []
+        for spec in expand_zoom_starts(specs, total_duration):
+            start = resolve_zoom_start(spec, total_duration, duration)
+            windows.append({
+                "spec": spec,
+                "start": start,
+                "duration": duration,
+                "path": self.zoomed_output_path(file_name, spec if multiple else None),
+                "title": self.zoomed_title(file_name, spec, start)
+            })
+        return windows
+
+    def generate_normal_spectrogram(self, file_path, file_name):
+        """Generate a normal spectrogram"""
+        raise NotImplementedError
+
+    def generate_zoomed_spectrogram(self, file_path, file_name, specs=None):
+        """Generate the zoomed spectrograms"""
+        raise NotImplementedError
+
+    def generate_combined_spectrograms(self, file_path, file_name, specs=None):
+        """Generate the full and zoomed spectrograms"""
+        return (self.generate_normal_spectrogram(file_path, file_name)
+                + self.generate_zoomed_spectrogram(file_path, file_name, specs))
+
+    def generate_pyramid(self, file_path, file_name):
+        """Generate the tile pyramid of a track from one analysis of the whole file"""
+        raise NotImplementedError
+
+    def generate_matrix(self, file_path, file_name, full=False, specs=None):
+        """Export the dB matrix of the full spectrogram, with the full spectrogram when full and the zoom windows of specs"""
+        raise NotImplementedError
+
+
+class SoxBackend(SpectrogramBackend):
+    """Render spectrograms with the SoX spectrogram effect"""
+
+    name = "sox"
+
+    @classmethod
+    def missing_dependencies(cls, params):
+        """Get a description of what is missing to use this backend, or None"""
+        if not params.get("sox_path") or not os.path.exists(params["sox_path"]):
+            return f"SoX was not found: {params.get('sox_path')}"
+        return None
+
+    def get_sox_dir(self):
+        """Get the directory SoX should run from so it finds all its DLLs"""
+        sox_dir = os.path.dirname(self.params["sox_path"])
+        return sox_dir if os.path.exists(sox_dir) else None
+
+    def full_spectrogram_options(self, file_name):
+        """Build the SoX spectrogram effect options for a full spectrogram"""
+        params = self.params
+
+        return [
+            "spectrogram",
+            "-x", str(params["width"]),
+            "-y", str(params["height"]),
+            "-z", str(params["z_range"]),
+            "-w", params["window_type"],
+            "-t", self.full_title(file_name),
+            "-o", self.full_output_path(file_name)
+        ]
+
+    def zoomed_spectrogram_options(self, window):
+        """Build the SoX spectrogram effect options for one zoom window"""
+        params = self.params
+        # Keep M:SS positions as typed, SoX also accepts seconds
+        start = window["spec"] if is_absolute(window["spec"]) else f"{window['start']:.3f}"
+
+        return [
+            "spectrogram",
+            "-x", str(params["zoom_width"]),
+            "-y", str(params["zoom_height"]),
+            "-z", str(params["zoom_z_range"]),
+            "-w", params["zoom_window_type"],
+            "-t", window["title"],
+            "-S", start,
+            "-d", params["zoom_duration"],
+            "-o", window["path"]
+        ]
+
+    def input_args(self, file_path):
+        """Get the SoX input arguments of a file, archive members are streamed to stdin"""
+        if is_member_path(file_path):
+            return ["-t", "flac", "-"]
+        return [file_path]
+
+    def start_feeder(self, file_path, process):
+        """Stream an archive member to a SoX process, return the feeder or None for plain files"""
+        if not is_member_path(file_path):
+            return None
+        feeder = MemberFeeder(file_path, process.stdin)
+        feeder.start()
+        return feeder
+
+    def run_sox(self, sox_cmd, file_path):
+        """Run a SoX command from the SoX directory without changing the process working directory"""
+        member = is_member_path(file_path)
+        process = self.start_process(sox_cmd, stdin=subprocess.PIPE if member else None, stdout=subprocess.DEVNULL,
+                                     stderr=subprocess.PIPE, cwd=self.get_sox_dir())
+        feeder = self.start_feeder(file_path, process)
+        try:
+            # A single SoX process both decodes and renders
+            with self.timer.measure("render"):
+                if feeder:
+                    stderr = process.stderr.read()
+                    process.wait()
+                    feeder.join()
+                else:
+                    _, stderr = process.communicate()
+        finally:
+            self.finish_process(process)
+
+        stderr = stderr.decode(errors="replace")
+
+        # Log any error output
+        if stderr:
+            logger.warning(f"Error output: {stderr}")
+
+        self.check_cancelled()
+        if feeder and feeder.error:
+            raise feeder.error
+        if process.returncode != 0:
+            raise SoxError(sox_cmd, process.returncode, stderr)
+
+    def generate_normal_spectrogram(self, file_path, file_name):
+        """Generate a normal spectrogram"""
+        sox_cmd = [self.params["sox_path"]] + self.input_args(file_path) + ["-n", "remix", "1"] + self.full_spectrogram_options(file_name)
+
+        self.run_sox(sox_cmd, file_path)
+        return [self.full_output_path(file_name)]
+
+    def generate_zoomed_spectrogram(self, file_path, file_name, specs=None):
+        """Generate the zoomed spectrograms, from a single decode when there are several windows"""
+        windows = self.zoom_windows(file_path, file_name, specs)
+        if len(windows) > 1:
+            return self.render_from_single_decode(file_path, [self.zoomed_spectrogram_options(window) for window in windows],
+                                                  [window["path"] for window in windows])
+
+        sox_cmd = [self.params["sox_path"]] + self.input_args(file_path) + ["-n", "remix", "1"] + self.zoomed_spectrogram_options(windows[0])
+
+        self.run_sox(sox_cmd, file_path)
+        return [windows[0]["path"]]
+
+    def generate_combined_spectrograms(self, file_path, file_name, specs=None):
+        """Generate the full and zoomed spectrograms from a single decode of the file"""
+        windows = self.zoom_windows(file_path, file_name, specs)
+        options = [self.full_spectrogram_options(file_name)] + [self.zoomed_spectrogram_options(window) for window in windows]
+        output_paths = [self.full_output_path(file_name)] + [window["path"] for window in windows]
+        return self.render_from_single_decode(file_path, options, output_paths)
+
+    def generate_pyramid(self, file_path, file_name):
+        """Generate the tile pyramid from one raw SoX spectrogram at the finest resolution"""
+        from PIL import Image
+
+        try:
+            sample_rate = read_streaminfo(file_path)["sample_rate"]
+        except READ_ERRORS:
+            sample_rate = None
+        duration = self.track_duration(file_path)
+
+        folder = self.pyramid_folder(file_name)
+        os.makedirs(folder, exist_ok=True)
+        raw_path = os.path.join(folder, "finest.png")
+        params = self.params
+        # -r leaves out the axes and the legend, the image is exactly -x by -y pixels
+        sox_cmd = [params["sox_path"]] + self.input_args(file_path) + ["-n", "remix", "1", "spectrogram", "-r",
+                                                                       "-x", str(self.pyramid_width(duration)),
+                                                                       "-y", str(params["height"]),
+                                                                       "-z", str(params["z_range"]),
+                                                                       "-w", params["window_type"],
+                                                                       "-o", raw_path]
+        try:
+            self.run_sox(sox_cmd, file_path)
+            with Image.open(raw_path) as image:
+                image = image.convert("RGB")
+        finally:
+            if os.path.exists(raw_path):
+                os.remove(raw_path)
+
+        return self.write_pyramid(image, file_path, file_name, sample_rate, duration)
+
+    def render_from_single_decode(self, file_path, options, output_paths):
+        """Render several spectrograms from one decode per MAX_RENDERERS lists of spectrogram options"""
+        # An "every" zoom start gives up to 100 windows, each one a SoX process
+        for first in range(0, len(options), MAX_RENDERERS):
+            self.check_cancelled()
+            self.render_group(file_path, options[first:first + MAX_RENDERERS])
+        return output_paths
+
+    def render_group(self, file_path, options):
+        """Render spectrograms from one decode, one renderer per list of spectrogram options"""
+        sox_path = self.params["sox_path"]
+        cwd = self.get_sox_dir()
+
+        # One SoX process decodes the FLAC to an uncompressed mono stream,
+        # one more per spectrogram reads that stream from stdin and renders it
+        decode_cmd = [sox_path] + self.input_args(file_path) + ["-t", "sox", "-", "remix", "1"]
+        render_cmds = [[sox_path, "-t", "sox", "-", "-n"] + spectrogram_options for spectrogram_options in options]
+
+        decoder = self.start_process(decode_cmd, stdin=subprocess.PIPE if is_member_path(file_path) else None,
+                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd)
+        feeder = self.start_feeder(file_path, decoder)
+        renderers = []
+        try:
+            for render_cmd in render_cmds:
+                renderers.append(self.start_process(render_cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, cwd=cwd))
+
+            self.tee_decoded_audio(decoder, decode_cmd, renderers, render_cmds)
+            if feeder:
+                feeder.join()
+                if feeder.error:
+                    raise feeder.error
+        finally:
+            for process in [decoder] + renderers:
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+                self.finish_process(process)
+
+    def tee_decoded_audio(self, decoder, decode_cmd, renderers, render_cmds):
+        """Copy the decoder output to the renderers and collect their errors"""
+        # Drain the error output while the audio streams, SoX blocks once a pipe is full
+        decode_reader = PipeReader(decoder.stderr)
+        render_readers = [PipeReader(renderer.stderr) for renderer in renderers]
+        for reader in [decode_reader] + render_readers:
+            reader.start()
+
+        # Copy the decoded audio to every renderer that is still reading.
+        # Zoomed renderers may exit as soon as their time window is done.
+        # The renderers consume the stream as it arrives, so this time
+        # also covers the rendering they keep up with.
+        active = list(renderers)
+        with self.timer.measure("decode"):
+            while active:
+                chunk = decoder.stdout.read(256 * 1024)
+                if not chunk:
+                    break
+
+                for renderer in list(active):
+                    try:
+                        renderer.stdin.write(chunk)
+                    except OSError:
+                        active.remove(renderer)
+
+        for renderer in renderers:
+            try:
+                renderer.stdin.close()
+            except OSError:
+                pass
+
+        # Nobody is reading any more, stop decoding
+        stopped_early = not active and decoder.poll() is None
+        if stopped_early:
+            decoder.kill()
+        decoder.stdout.close()
+        decoder.wait()
+        decode_errors = decode_reader.text()
+
+        errors = []
+        if decoder.returncode != 0 and not stopped_early:
+            errors.append(SoxError(decode_cmd, decoder.returncode, decode_errors))
+
+        for render_cmd, renderer, reader in zip(render_cmds, renderers, render_readers):
+            # What is left of the rendering once the whole stream was read
+            with self.timer.measure("render"):
+                renderer.wait()
+                render_errors = reader.text()
+
+            # Log any error output
+            if render_errors:
+                logger.warning(f"Error output: {render_errors}")
+
+            if renderer.returncode != 0:
+                errors.append(SoxError(render_cmd, renderer.returncode, render_errors))
+
+        self.check_cancelled()
+        if errors:
+            raise errors[0]
+
+
+def numpy_backend_class():
+    """Import the NumPy backend only when it is used, it pulls in numpy and Pillow"""
+    from .numpy_backend import NumpyBackend
+    return NumpyBackend
+
+
+# Backend name -> function returning the backend class
+BACKENDS = {
+    "sox": lambda: SoxBackend,
+    "numpy": numpy_backend_class
+}
+
+BACKEND_NAMES = list(BACKENDS)
+
+
+def module_available(name):
+    """Check if a module can be imported without importing it"""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def backend_missing_dependencies(params):
+    """Get a description of what is missing to use the selected backend, or None"""
+    name = params.get("backend", "sox")
+    if name not in BACKENDS:
+        return f"Unknown backend: {name}. Choose one of: {', '.join(BACKEND_NAMES)}"
+
+    if name == "numpy":
+        # Check without importing numpy, so startup stays light
+        missing = [module for module in ("numpy", "PIL", "soundfile") if not module_available(module)]
+        if missing:
+            return f"The numpy backend needs these Python packages: {', '.join(missing)}"
+        return None
+
+    return BACKENDS[name]().missing_dependencies(params)
+
+
+def create_backend(params):
+    """Create the backend selected by params["backend"]"""
+    name = params.get("backend", "sox")
+    if name not in BACKENDS:
+        raise BackendUnavailable(f"Unknown backend: {name}")
+
+    try:
+        backend_class = BACKENDS[name]()
+    except ImportError as e:
+        raise BackendUnavailable(f"The {name} backend is not available: {e}")
+
+    return backend_class(params)
@@ -0,0 +1,243 @@
+"""Thumbnail browser tab of the graphical interface
+
+Imported by red-spectrogram.py when the Browser tab is first shown, so
+Pillow is not loaded at startup.
+"""
+import os
+import queue
+import tkinter as tk
+from tkinter import ttk
+
+from PIL import ImageTk
+
+from .thumbnails import ThumbnailCache, ThumbnailLoader, THUMBNAIL_FOLDER_NAME, THUMBNAIL_SIZE
+
+# Size of one grid cell: the thumbnail and its file name below
+CELL_PADDING = 8
+LABEL_HEIGHT = 16
+
+# Height of the preview pane under the grid
+PREVIEW_HEIGHT = 260
+
+
+class ThumbnailBrowser(ttk.Frame):
+    """Scrollable thumbnail grid with a preview pane
+
+    Only the rows in view have canvas items and PhotoImages, the rest of
+    the files are just paths. Thumbnails are loaded in the background and
+    drawn when they arrive.
+    """
+
+    def __init__(self, parent, on_open=None):
+        super().__init__(parent)
+        self.on_open = on_open
+        self.folder = None
+        # File names in the folder, in display order
+        self.files = []
+        self.selected = None
+        self.cache = None
+        self.loader = None
+        # Loaded (path, size) pairs posted by the loader threads
+        self.loaded = queue.Queue()
+        # path -> (thumbnail, PhotoImage) of the visible cells, Tk drops images that are not referenced
+        self.photos = {}
+        self.preview_photo = None
+        self.redraw_pending = False
+        # Thumbnails of the visible cells and preview image still to load
+        self.missing = []
+        self.preview_request = None
+
+        cell_width, cell_height = THUMBNAIL_SIZE
+        self.cell_width = cell_width + CELL_PADDING * 2
+        self.cell_height = cell_height + LABEL_HEIGHT + CELL_PADDING * 2
+
+        grid_frame = ttk.Frame(self)
+        grid_frame.pack(fill="both", expand=True)
+
+        self.canvas = tk.Canvas(grid_frame, background="#202020", highlightthickness=0)
+        self.canvas.pack(side=tk.LEFT, fill="both", expand=True)
+        scrollbar = ttk.Scrollbar(grid_frame, orient="vertical", command=self.scroll)
+        scrollbar.pack(side=tk.RIGHT, fill="y")
+        self.canvas.config(yscrollcommand=scrollbar.set)
+
+        self.preview = tk.Canvas(self, height=PREVIEW_HEIGHT, background="black", highlightthickness=0)
+        self.preview.pack(fill="x", pady=(5, 0))
+
+        self.canvas.bind("<Configure>", lambda event: self.schedule_redraw())
+        self.canvas.bind("<Button-1>", self.click)
+        self.canvas.bind("<Double-1>", self.double_click)
+        self.canvas.bind("<MouseWheel>", self.wheel)
+        self.canvas.bind("<Button-4>", lambda event: self.scroll("scroll", -1, "units"))
+        self.canvas.bind("<Button-5>", lambda event: self.scroll("scroll", 1, "units"))
+        self.preview.bind("<Configure>", lambda event: self.show_preview())
+
+        self.after(50, self.drain_loaded)
+
+    def set_folder(self, folder):
+        """Show images of an output folder, using its thumbnail cache"""
+        self.folder = folder
+        cache_folder = os.path.join(folder, THUMBNAIL_FOLDER_NAME)
+        if self.cache and self.cache.cache_folder == cache_folder:
+            return
+        if self.loader:
+            self.loader.stop()
+        self.cache = ThumbnailCache(cache_folder)
+        self.loader = ThumbnailLoader(self.cache, lambda path, size: self.loaded.put((path, size)))
+
+    def set_files(self, files):
+        """Show a new list of image names from the folder"""
+        self.files = files
+        if self.selected is not None and self.selected not in self.files:
+            self.selected = None
+            self.show_preview()
+        self.schedule_redraw()
+
+    def path(self, name):
+        """Get the path of a file name"""
+        return os.path.join(self.folder, name)
+
+    def columns(self):
+        """Get the number of thumbnail columns that fit in the canvas"""
+        return max(1, self.canvas.winfo_width() // self.cell_width)
+
+    def scroll(self, *args):
+        """Scroll the grid and draw the rows that came into view"""
+        self.canvas.yview(*args)
+        self.schedule_redraw()
+
+    def wheel(self, event):
+        """Scroll with the mouse wheel on Windows and macOS"""
+        self.scroll("scroll", -1 if event.delta > 0 else 1, "units")
+
+    def schedule_redraw(self):
+        """Redraw once after a burst of scroll or resize events"""
+        if not self.redraw_pending:
+            self.redraw_pending = True
+            self.after_idle(self.redraw)
+
+    def visible_range(self):
+        """Get the first and last index of the files in view"""
+        columns = self.columns()
+        top = self.canvas.canvasy(0)
+        bottom = top + self.canvas.winfo_height()
+        first_row = max(0, int(top // self.cell_height))
+        last_row = int(bottom // self.cell_height) + 1
+        return first_row * columns, min(len(self.files), (last_row + 1) * columns)
+
+    def redraw(self):
+        """Create canvas items for the visible cells only"""
+        self.redraw_pending = False
+        columns = self.columns()
+        rows = (len(self.files) + columns - 1) // columns
+        self.canvas.config(scrollregion=(0, 0, columns * self.cell_width, rows * self.cell_height))
+        self.canvas.delete("cell")
+
+        first, last = self.visible_range()
+        photos = {}
+        missing = []
+
+        for index in range(first, last):
+            path = self.path(self.files[index])
+            x = (index % columns) * self.cell_width + CELL_PADDING
+            y = (index // columns) * self.cell_height + CELL_PADDING
+
+            if self.files[index] == self.selected:
+                self.canvas.create_rectangle(x - 4, y - 4, x + self.cell_width - CELL_PADDING * 2 + 4,
+                                             y + self.cell_height - CELL_PADDING * 2 + 4, outline="#4a90d9", width=2, tags="cell")
+
+            image = self.cache.get(path) if self.cache else None
+            if image is None:
+                self.canvas.create_rectangle(x, y, x + THUMBNAIL_SIZE[0], y + THUMBNAIL_SIZE[1], outline="#505050", tags="cell")
+                missing.append((path, THUMBNAIL_SIZE, True))
+            else:
+                # Reuse the PhotoImage while the thumbnail is the same
+                cached_image, photo = self.photos.get(path, (None, None))
+                if cached_image is not image:
+                    photo = ImageTk.PhotoImage(image)
+                photos[path] = (image, photo)
+                self.canvas.create_image(x, y, image=photo, anchor="nw", tags="cell")
+
+            self.canvas.create_text(x, y + THUMBNAIL_SIZE[1] + 2, text=self.files[index], anchor="nw",
+                                    fill="white", width=THUMBNAIL_SIZE[0], tags="cell")
+
+        # Forget the PhotoImages of the cells that scrolled out of view
+        self.photos = photos
+        self.missing = missing
+        self.request_loads()
+
+    def request_loads(self):
+        """Ask the loader for the preview first, then the visible thumbnails"""
+        if self.loader:
+            self.loader.want(([self.preview_request] if self.preview_request else []) + self.missing)
+
+    def drain_loaded(self):
+        """Draw the thumbnails loaded in the background (runs on the UI thread)"""
+        redraw = False
+        while True:
+            try:
+                path, size = self.loaded.get_nowait()
+            except queue.Empty:
+                break
+            if size == THUMBNAIL_SIZE:
+                redraw = True
+            elif self.selected and path == self.path(self.selected):
+                self.show_preview()
+
+        if redraw:
+            self.schedule_redraw()
+        self.after(50, self.drain_loaded)
+
+    def index_at(self, event):
+        """Get the index of the file under the mouse, or None"""
+        column = int(self.canvas.canvasx(event.x) // self.cell_width)
+        row = int(self.canvas.canvasy(event.y) // self.cell_height)
+        if column >= self.columns():
+            return None
+        index = row * self.columns() + column
+        return index if 0 <= index < len(self.files) else None
+
+    def click(self, event):
+        """Select a thumbnail and show it in the preview pane"""
+        index = self.index_at(event)
+        if index is None:
+            return
+        self.selected = self.files[index]
+        self.schedule_redraw()
+        self.show_preview()
+
+    def double_click(self, event):
+        """Open a spectrogram in the external viewer"""
+        index = self.index_at(event)
+        if index is not None and self.on_open:
+            self.on_open(self.path(self.files[index]))
+
+    def preview_size(self):
+        """Get the size the selected image is scaled to in the preview pane"""
+        return (max(1, self.preview.winfo_width()), max(1, self.preview.winfo_height()))
+
+    def show_preview(self):
+        """Show the selected image scaled to the preview pane, loading it in the background"""
+        self.preview.delete("all")
+        self.preview_photo = None
+        self.preview_request = None
+        if not self.selected or not self.cache:
+            return
+
+        size = self.preview_size()
+        path = self.path(self.selected)
+        image = self.cache.get(path, size)
+        if image is None:
+            self.preview.create_text(size[0] // 2, size[1] // 2, text="Loading...", fill="white")
+            # Previews depend on the window size, do not persist them
+            self.preview_request = (path, size, False)
+            self.request_loads()
+            return
+
+        self.preview_photo = ImageTk.PhotoImage(image)
+        self.preview.create_image(size[0] // 2, size[1] // 2, image=self.preview_photo)
+
+    def destroy(self):
+        """Stop the loader threads with the widget"""
+        if self.loader:
+            self.loader.stop()
+        super().destroy()
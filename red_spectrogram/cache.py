@@ -0,0 +1,113 @@
+"""Incremental generation cache
+
+A JSON manifest in the output folder remembers, for every source file, its
+size and mtime and a hash of the parameters each spectrogram was rendered
+with. Files whose entry still matches are skipped on the next run.
+"""
+import os
+import json
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = ".red-spectrogram-manifest.json"
+MANIFEST_VERSION = 1
+
+# Save the manifest after this many new entries, so a crash loses little work
+SAVE_INTERVAL = 100
+
+# Parameters that change the image of each spectrogram type
+FULL_PARAMETERS = ["backend", "width", "height", "z_range", "window_type"]
+ZOOM_PARAMETERS = ["backend", "zoom_width", "zoom_height", "zoom_z_range", "zoom_window_type", "zoom_start", "zoom_duration"]
+
+# Parameters of the tile pyramid, it uses the settings of the full spectrogram
+PYRAMID_PARAMETERS = ["backend", "height", "z_range", "window_type", "pyramid_max_width"]
+
+# Parameters of the dB matrix, the levels of the full spectrogram
+MATRIX_PARAMETERS = ["backend", "width", "height", "z_range", "window_type"]
+
+# Parameters of the post-encode stage, they change the file of every type
+ENCODE_PARAMETERS = ["output_format", "compress_level"]
+
+
+def parameters_hash(params, keys):
+    """Hash the effective parameters of one spectrogram type"""
+    values = {key: str(params.get(key, "")) for key in keys}
+    return hashlib.sha1(json.dumps(values, sort_keys=True).encode()).hexdigest()
+
+
+class GenerationCache:
+    """Manifest of generated spectrograms, keyed by source path"""
+
+    def __init__(self, output_folder):
+        self.path = os.path.join(output_folder, MANIFEST_NAME)
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.unsaved = 0
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    def load(self):
+        """Read the manifest, starting empty if it is missing or unreadable"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.entries = data.get("files", {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable cache manifest {self.path}: {e}")
+
+    def save(self):
+        """Write the manifest atomically"""
+        with self.lock:
+            if not self.unsaved:
+                return
+            data = {"version": MANIFEST_VERSION, "files": self.entries}
+            temp_path = self.path + ".tmp"
+            try:
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f, separators=(",", ":"))
+                os.replace(temp_path, self.path)
+                self.unsaved = 0
+            except OSError as e:
+                logger.warning(f"Could not save cache manifest {self.path}: {e}")
+
+    def source_key(self, file_path):
+        """Get the manifest key of a source file"""
+        return os.path.normcase(os.path.abspath(file_path))
+
+    def lookup(self, file_path, stat, kind, params_hash):
+        """Get the output path if the spectrogram of this kind is up to date, otherwise None"""
+        with self.lock:
+            entry = self.entries.get(self.source_key(file_path))
+            output = None
+            if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns:
+                output = entry["outputs"].get(kind)
+
+            if output and output["hash"] == params_hash and os.path.exists(output["path"]):
+                self.hits += 1
+                return output["path"]
+
+            self.misses += 1
+            return None
+
+    def record(self, file_path, stat, kind, params_hash, output_path):
+        """Remember a generated spectrogram"""
+        with self.lock:
+            key = self.source_key(file_path)
+            entry = self.entries.get(key)
+            if not entry or entry["size"] != stat.st_size or entry["mtime"] != stat.st_mtime_ns:
+                entry = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "outputs": {}}
+                self.entries[key] = entry
+
+            entry["outputs"][kind] = {"hash": params_hash, "path": output_path}
+            self.unsaved += 1
+            save_now = self.unsaved >= SAVE_INTERVAL
+
+        if save_now:
+            self.save()
@@ -0,0 +1,424 @@
+"""Headless command-line batch mode
+
+Usage: python -m red_spectrogram [options] FILE|FOLDER|GLOB ...
+       python -m red_spectrogram --ledger LEDGER --enqueue [options] FILE|FOLDER|GLOB ...
+       python -m red_spectrogram --ledger LEDGER --worker [options]
+       python -m red_spectrogram --serve [HOST:]PORT [options]
+
+Generates spectrograms without a display and prints the results as JSON
+on stdout. Tkinter is never imported on this path, and PIL only when
+the numpy backend or a re-encoded output format is selected.
+"""
+import os
+import sys
+import glob
+import json
+import time
+import signal
+import threading
+import argparse
+import logging
+
+from . import __version__
+from .backends import BACKEND_NAMES, module_available
+from .postencode import OUTPUT_FORMATS
+from .config import WINDOW_TYPES, POOLING_MODES, load_config, find_sox_path, sox_info
+from .scanner import PathIndex, iter_audio_files
+from .archives import is_archive, iter_archive_members, split_member_path
+from .joblog import summarize
+from .flacinfo import audio_duration
+from .engine import SpectrogramEngine, longest_first, parameters_from_config, resolve_worker_count, validate_parameters
+
+
+def collect_files(paths, recursive=False):
+    """Expand files, folders, archives and glob patterns into a list of FLAC files without duplicates"""
+    files = PathIndex()
+
+    for path in paths:
+        if glob.has_magic(path):
+            matches = sorted(glob.glob(path, recursive=True))
+        else:
+            matches = [path]
+
+        for match in matches:
+            member = split_member_path(match)
+            if os.path.isdir(match):
+                files.extend(os.path.abspath(file) for file in iter_audio_files(match, recursive, archives=True))
+            elif is_archive(match) and os.path.isfile(match):
+                files.extend(iter_archive_members(os.path.abspath(match)))
+            elif os.path.isfile(match) or (member and os.path.isfile(member[0])):
+                files.add(os.path.abspath(match))
+            else:
+                logging.warning(f"No such file or folder: {match}")
+
+    return list(files)
+
+
+def build_parser():
+    """Build the command-line argument parser"""
+    parser = argparse.ArgumentParser(
+        prog="red-spectrogram",
+        description="Generate spectrograms from FLAC files without the graphical interface."
+    )
+    parser.add_argument("paths", nargs="*", metavar="PATH", help="FLAC files, zip/tar archives, folders or glob patterns")
+    parser.add_argument("-r", "--recursive", action="store_true", help="scan folders recursively")
+    parser.add_argument("--config", help="configuration file to read the default parameters from")
+    parser.add_argument("-o", "--output-folder", help="folder for the generated spectrograms")
+    parser.add_argument("--sox-path", help="path of the SoX executable")
+    parser.add_argument("--backend", choices=BACKEND_NAMES, help="render with SoX or in-process with NumPy")
+    parser.add_argument("-j", "--jobs", type=int, help="number of parallel jobs (0 = one per CPU core)")
+    parser.add_argument("--output-format", choices=OUTPUT_FORMATS, help="re-encode the spectrograms as optimized PNG, palette PNG or lossless WebP (needs Pillow)")
+    parser.add_argument("--compress-level", help="zlib level of the re-encoded PNG files (0-9)")
+    parser.add_argument("--memory-limit", metavar="MB", help="memory for decoded audio shared by the parallel jobs of the numpy backend, longer files are rendered in chunks (default 1024)")
+    parser.add_argument("-f", "--force", action="store_true", help="regenerate spectrograms that are already up to date, and quarantined files")
+    parser.add_argument("--no-job-log", action="store_true", help="do not append per-file timings to the job log in the output folder")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log SoX commands and output to stderr")
+    parser.add_argument("--version", action="version", version=f"%(prog)s {__version__}")
+
+    failures = parser.add_argument_group("failure policy")
+    failures.add_argument("--timeout", metavar="SECONDS", help="time limit of a job, plus --timeout-factor seconds per second of audio (0 = no limit, default 120)")
+    failures.add_argument("--timeout-factor", help="seconds added to the time limit per second of audio (default 1.0)")
+    failures.add_argument("--retries", help="attempts after a timeout or another transient error, with doubling delays (default 2)")
+    failures.add_argument("--quarantine-after", metavar="ATTEMPTS", help="skip files in later batches once they failed this many attempts, until they change (0 = never, default 3)")
+
+    analysis = parser.add_argument_group("transcode analysis")
+    analysis.add_argument("--analyze", action="store_true", help="detect lossy transcodes and upsampled files instead of generating spectrograms (needs numpy and soundfile)")
+    analysis.add_argument("--report", help="also write the analysis report to this CSV file (JSON when it ends with .json)")
+
+    distributed = parser.add_argument_group("distributed mode")
+    distributed.add_argument("--ledger", help="job ledger (SQLite database) on a filesystem shared by the render nodes")
+    distributed.add_argument("--enqueue", action="store_true", help="add the files to the ledger as a batch and print its id")
+    distributed.add_argument("--wait", action="store_true", help="with --enqueue, follow the batch progress on stderr and print the results when it is done")
+    distributed.add_argument("--worker", action="store_true", help="claim and render jobs from the ledger until interrupted")
+    distributed.add_argument("--exit-when-idle", action="store_true", help="with --worker, stop when the ledger has no jobs left")
+    distributed.add_argument("--status", action="store_true", help="print the progress of the batches in the ledger")
+
+    service = parser.add_argument_group("service mode")
+    service.add_argument("--serve", metavar="[HOST:]PORT", help="render spectrograms on demand over HTTP (GET /spectrogram?file=PATH&type=full|zoom, GET /status), on 127.0.0.1 unless a host is given")
+    service.add_argument("--queue-size", type=int, help="renders queued or running before new requests are refused with 503 (default 4 per parallel job)")
+    service.add_argument("--cache-size", type=int, default=256, help="number of recent images served from the cache (default 256)")
+
+    watch = parser.add_argument_group("watch mode")
+    watch.add_argument("-w", "--watch", action="store_true", help="keep watching the folders and process new FLAC files as they arrive, printing one JSON line per file")
+    watch.add_argument("--settle", type=float, default=5.0, help="seconds a file must stay unchanged before it is processed (default 5)")
+    watch.add_argument("--poll-interval", type=float, default=10.0, help="seconds between rescans when inotify is not available (default 10)")
+    watch.add_argument("--no-inotify", action="store_true", help="always use polling instead of inotify")
+
+    types = parser.add_argument_group("spectrogram types")
+    types.add_argument("--full", dest="normal", action="store_true", default=None, help="generate full spectrograms (default)")
+    types.add_argument("--no-full", dest="normal", action="store_false", help="do not generate full spectrograms")
+    types.add_argument("--zoom", action="store_true", default=False, help="generate zoomed spectrograms")
+    types.add_argument("--pyramid", action="store_true", default=False, help="generate a deep-zoom tile pyramid of every file (needs Pillow)")
+    types.add_argument("--matrix", action="store_true", default=False, help="export the dB matrix of the full spectrogram as a memory-mappable .npy file with a JSON sidecar of its axes (numpy backend)")
+    types.add_argument("--pyramid-max-width", metavar="COLUMNS", help="columns of the finest pyramid level of long tracks (default 32768, 10 ms per column for shorter ones)")
+
+    full = parser.add_argument_group("full spectrogram settings (DEFAULT section)")
+    full.add_argument("--width", help="width in pixels (100-5000)")
+    full.add_argument("--height", help="height in bins, typically 129, 257, 513, 1025")
+    full.add_argument("--z-range", help="dynamic range in dB (20-180)")
+    full.add_argument("--window-type", choices=WINDOW_TYPES, help="FFT window function")
+    full.add_argument("--pooling", choices=POOLING_MODES, help="combine the DFTs of a pixel column by their mean (like SoX) or keep the loudest (numpy backend)")
+
+    zoom = parser.add_argument_group("zoomed spectrogram settings (ZOOM section)")
+    zoom.add_argument("--zoom-width", help="width in pixels (100-5000)")
+    zoom.add_argument("--zoom-height", help="height in bins, typically 129, 257, 513, 1025")
+    zoom.add_argument("--zoom-z-range", help="dynamic range in dB (20-180)")
+    zoom.add_argument("--zoom-window-type", choices=WINDOW_TYPES, help="FFT window function")
+    zoom.add_argument("--zoom-start", help="comma-separated start times: M:SS, N%%, end-M:SS or every M:SS, one zoomed spectrogram each")
+    zoom.add_argument("--zoom-duration", help="duration (M:SS)")
+
+    return parser
+
+
+def parameters_from_args(args):
+    """Build the spectrogram parameters from the configuration file and the command-line overrides"""
+    params = parameters_from_config(load_config(args.config))
+
+    if not params["sox_path"] or not os.path.exists(params["sox_path"]):
+        params["sox_path"] = find_sox_path()
+
+    overrides = {
+        "sox_path": args.sox_path,
+        "backend": args.backend,
+        "output_format": args.output_format,
+        "compress_level": args.compress_level,
+        "pooling": args.pooling,
+        "memory_limit": args.memory_limit,
+        "job_timeout": args.timeout,
+        "timeout_factor": args.timeout_factor,
+        "retries": args.retries,
+        "quarantine_after": args.quarantine_after,
+        "output_folder": args.output_folder,
+        "width": args.width,
+        "height": args.height,
+        "z_range": args.z_range,
+        "window_type": args.window_type,
+        "zoom_width": args.zoom_width,
+        "zoom_height": args.zoom_height,
+        "zoom_z_range": args.zoom_z_range,
+        "zoom_window_type": args.zoom_window_type,
+        "zoom_start": args.zoom_start,
+        "zoom_duration": args.zoom_duration,
+        "pyramid_max_width": args.pyramid_max_width
+    }
+    for key, value in overrides.items():
+        if value is not None:
+            params[key] = value
+
+    # SoX runs from its own folder, a relative output folder would resolve there
+    params["output_folder"] = os.path.abspath(params["output_folder"])
+
+    if args.force:
+        params["incremental"] = False
+        params["retry_quarantined"] = True
+
+    if args.no_job_log:
+        params["job_log"] = False
+
+    if args.jobs is not None:
+        params["workers"] = resolve_worker_count(args.jobs)
+
+    params["zoom"] = args.zoom
+    params["pyramid"] = args.pyramid
+    params["matrix"] = args.matrix
+    # Full spectrograms are generated unless only --zoom, --pyramid or --matrix was requested
+    params["normal"] = args.normal if args.normal is not None else not (args.zoom or args.pyramid or args.matrix)
+
+    return params
+
+
+def main(argv=None):
+    """Run the command-line batch mode"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(levelname)s: %(message)s", stream=sys.stderr)
+
+    # Only the default configuration file is created when missing, a given path may be a typo
+    if args.config is not None and not os.path.isfile(args.config):
+        parser.error(f"configuration file not found: {args.config}")
+
+    params = parameters_from_args(args)
+
+    if not (params["normal"] or params["zoom"] or params["pyramid"] or params["matrix"]):
+        parser.error("select at least one spectrogram type to generate")
+
+    errors, warnings = validate_parameters(params)
+    for warning in warnings:
+        logging.warning(warning.replace("\n", " "))
+    if errors:
+        parser.error(errors[0])
+
+    if args.ledger:
+        return distributed(args, parser, params)
+    if args.serve:
+        return serve(args, parser, params)
+    if not args.paths:
+        parser.error("the following arguments are required: PATH")
+
+    if args.analyze:
+        return analyze(args, parser, params)
+
+    if params["backend"] == "sox":
+        if not params["sox_path"] or not os.path.exists(params["sox_path"]):
+            parser.error(f"SoX was not found: {params['sox_path']}. Use --sox-path to specify it.")
+        # Probed once per SoX executable, then read from the cache
+        info = sox_info(params["sox_path"])
+        if info and not info["flac"]:
+            parser.error(f"SoX {params['sox_path']} was built without FLAC support")
+
+    if args.watch:
+        return watch(args, parser, params)
+
+    files = collect_files(args.paths, args.recursive)
+    if not files:
+        parser.error("no FLAC files found")
+
+    engine = SpectrogramEngine(params)
+    results = engine.run_batch(files)
+
+    failed = sum(1 for result in results if result["status"] == "error")
+    quarantined = sum(1 for result in results if result["status"] == "quarantined")
+    report = {
+        "version": __version__,
+        "output_folder": params["output_folder"],
+        "files": len(results),
+        "generated": sum(len(result["outputs"]) for result in results),
+        "failed": failed,
+        "quarantined": quarantined,
+        "error_report": engine.error_report,
+        "cache": engine.cache_stats(),
+        "summary": summarize(results),
+        "results": results
+    }
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+    return 1 if failed or quarantined else 0
+
+
+def analyze(args, parser, params):
+    """Run the transcode analysis and print the results sorted by suspicion"""
+    missing = [module for module in ("numpy", "soundfile") if not module_available(module)]
+    if missing:
+        parser.error(f"the analysis needs these Python packages: {', '.join(missing)}")
+
+    from .analysis import analyze_files, flagged, sort_report, write_report
+
+    files = collect_files(args.paths, args.recursive)
+    if not files:
+        parser.error("no FLAC files found")
+
+    results = analyze_files(files, params["workers"])
+    if args.report:
+        write_report(results, args.report)
+
+    failed = sum(1 for result in results if result["verdict"] == "error")
+    report = {
+        "version": __version__,
+        "files": len(results),
+        "flagged": len(flagged(results)),
+        "failed": failed,
+        "results": sort_report(results)
+    }
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+    return 1 if failed else 0
+
+
+def distributed(args, parser, params):
+    """Enqueue a batch in the job ledger, run a worker or print the ledger status"""
+    from .ledger import JobLedger, LedgerWorker
+
+    modes = [mode for mode in ("enqueue", "worker", "status") if getattr(args, mode)]
+    if len(modes) != 1:
+        parser.error("--ledger needs one of --enqueue, --worker or --status")
+
+    ledger = JobLedger(args.ledger)
+
+    if args.status:
+        json.dump({"version": __version__, "batches": ledger.batches()}, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return 0
+
+    if args.worker:
+        # Batches rendered with the numpy backend do not need SoX
+        if not params["sox_path"] or not os.path.exists(params["sox_path"]):
+            logging.warning(f"SoX was not found: {params['sox_path']}, batches using the sox backend will fail. Use --sox-path to specify it.")
+
+        # The batch settings come from the ledger, only what differs between nodes is local
+        overrides = {"sox_path": params["sox_path"], "workers": params["workers"]}
+        if args.backend:
+            overrides["backend"] = args.backend
+
+        def on_result(result):
+            sys.stdout.write(json.dumps(result) + "\n")
+            sys.stdout.flush()
+
+        worker = LedgerWorker(ledger, overrides, exit_when_idle=args.exit_when_idle, on_result=on_result)
+        signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+        try:
+            worker.run()
+        except KeyboardInterrupt:
+            worker.stop()
+        return 0
+
+    files = collect_files(args.paths, args.recursive)
+    if not files:
+        parser.error("no FLAC files found")
+
+    # Workers claim jobs in ledger order
+    batch = ledger.enqueue(longest_first({file_path: audio_duration(file_path) for file_path in files}), params)
+
+    if not args.wait:
+        json.dump({"version": __version__, "batch": batch, "files": len(files)}, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return 0
+
+    try:
+        while True:
+            progress = ledger.progress(batch)
+            sys.stderr.write(f"{progress['done']}/{progress['total']} files, {progress['running']} running "
+                             f"on {len(progress['workers'])} workers, {progress['error']} failed\n")
+            if progress["finished"]:
+                break
+            time.sleep(2)
+    except KeyboardInterrupt:
+        ledger.cancel(batch)
+        return 1
+
+    results = ledger.results(batch)
+    failed = sum(1 for result in results if result["status"] == "error")
+    report = {
+        "version": __version__,
+        "batch": batch,
+        "output_folder": params["output_folder"],
+        "files": len(results),
+        "generated": sum(len(result["outputs"]) for result in results),
+        "failed": failed,
+        "summary": summarize(results),
+        "results": results
+    }
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+    return 1 if failed else 0
+
+
+def serve(args, parser, params):
+    """Run the HTTP service until interrupted"""
+    from .service import SpectrogramService, create_server
+
+    host, _, port = args.serve.rpartition(":")
+    try:
+        port = int(port)
+    except ValueError:
+        parser.error(f"invalid port: {args.serve}")
+
+    # Requests may select the numpy backend, which does not need SoX
+    if not params["sox_path"] or not os.path.exists(params["sox_path"]):
+        logging.warning(f"SoX was not found: {params['sox_path']}, requests using the sox backend will fail. Use --sox-path to specify it.")
+
+    service = SpectrogramService(params, params["workers"], args.queue_size, args.cache_size)
+    server = create_server(service, host or "127.0.0.1", port)
+    sys.stderr.write(f"Serving spectrograms on http://{server.server_address[0]}:{server.server_address[1]}/ "
+                     f"with {params['workers']} parallel jobs\n")
+
+    # serve_forever() must be stopped from another thread
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+    return 0
+
+
+def watch(args, parser, params):
+    """Run the watch-folder mode until interrupted"""
+    from .watcher import WatchService
+
+    folders = [path for path in args.paths if os.path.isdir(path)]
+    if len(folders) != len(args.paths):
+        parser.error("watch mode needs existing folders")
+
+    def on_result(result):
+        if result["status"] != "cached":
+            sys.stdout.write(json.dumps(result) + "\n")
+            sys.stdout.flush()
+
+    service = WatchService(SpectrogramEngine(params), folders, args.settle, not args.no_inotify, args.poll_interval, on_result)
+
+    # Stop cleanly on Ctrl+C and on SIGTERM from a service manager
+    signal.signal(signal.SIGTERM, lambda signum, frame: service.stop())
+    try:
+        service.run()
+    except KeyboardInterrupt:
+        pass
+
+    return 0
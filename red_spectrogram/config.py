@@ -0,0 +1,246 @@
+import os
+import re
+import sys
+import json
+import shutil
+import subprocess
+import configparser
+import logging
+
+logger = logging.getLogger(__name__)
+
+CONFIG_FILE_NAME = "spectrogram_config.ini"
+
+# Resolved SoX path and what it supports, so launches do not search and probe again
+SOX_CACHE_NAME = ".red-spectrogram-sox.json"
+
+WINDOW_TYPES = ["Kaiser", "Hamming", "Hann", "Bartlett", "Rectangular"]
+
+# How the DFT frames of one pixel column are combined by the numpy backend
+POOLING_MODES = ["mean", "max"]
+
+# Default values for the full spectrogram (DEFAULT section)
+DEFAULT_SETTINGS = {
+    "width": "3000",
+    "height": "513",
+    "z_range": "120",
+    "window_type": "Kaiser",
+    "workers": "0",
+    "backend": "sox",
+    "incremental": "yes",
+    "job_log": "yes",
+    "output_format": "png",
+    "compress_level": "9",
+    "pooling": "mean",
+    "memory_limit": "1024",
+    "job_timeout": "120",
+    "timeout_factor": "1.0",
+    "retries": "2",
+    "retry_delay": "2",
+    "quarantine_after": "3",
+    "pyramid_max_width": "32768",
+    "ledger": ""
+}
+
+# Default values for the zoomed spectrogram (ZOOM section)
+DEFAULT_ZOOM_SETTINGS = {
+    "width": "500",
+    "height": "1025",
+    "z_range": "120",
+    "window_type": "Kaiser",
+    "zoom_start": "1:00",
+    "zoom_duration": "0:02"
+}
+
+
+def get_application_path():
+    """Get the application path, works both in development mode and with PyInstaller"""
+    if getattr(sys, 'frozen', False):
+        # If running as a PyInstaller bundle
+        return os.path.dirname(sys.executable)
+    else:
+        # If running in development mode, the package lives next to red-spectrogram.py
+        return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_config_file():
+    """Get the path of the configuration file"""
+    return os.path.join(get_application_path(), CONFIG_FILE_NAME)
+
+
+def get_default_output_folder():
+    """Get the default output folder inside the application directory"""
+    return os.path.join(get_application_path(), "Spectrograms")
+
+
+def get_sox_cache_file():
+    """Get the path of the SoX discovery cache"""
+    return os.path.join(get_application_path(), SOX_CACHE_NAME)
+
+
+def sox_signature(sox_path):
+    """Get the mtime and size of the SoX executable, None if it does not exist"""
+    try:
+        stat = os.stat(sox_path)
+    except (OSError, TypeError, ValueError):
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def read_sox_cache():
+    """Read the cached SoX path and probe, or None"""
+    try:
+        with open(get_sox_cache_file(), "r", encoding="utf-8") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    
+    # Valid while the executable is the one that was probed
+    if not isinstance(cached, dict) or sox_signature(cached.get("path")) != cached.get("signature"):
+        return None
+    return cached
+
+
+def write_sox_cache(cached):
+    """Save the SoX path and probe, the cache is only an optimization"""
+    cache_file = get_sox_cache_file()
+    try:
+        with open(cache_file + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(cached, f)
+        os.replace(cache_file + ".tmp", cache_file)
+    except OSError as e:
+        logger.debug(f"Could not save the SoX cache {cache_file}: {e}")
+
+
+def probe_sox(sox_path):
+    """Run SoX once to get its version and check that it reads FLAC files"""
+    try:
+        output = subprocess.run([sox_path, "-h"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                timeout=10).stdout.decode(errors="replace")
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning(f"Could not run SoX {sox_path}: {e}")
+        return None
+    
+    version = re.search(r"SoX v(\S+)", output)
+    formats = re.search(r"AUDIO FILE FORMATS:(.*)", output)
+    return {
+        "version": version.group(1) if version else None,
+        "flac": bool(formats) and "flac" in formats.group(1).split()
+    }
+
+
+def sox_info(sox_path):
+    """Get the version and FLAC support of a SoX executable, probed once per executable
+
+    Returns a dict with version and flac, or None if SoX cannot run.
+    """
+    signature = sox_signature(sox_path)
+    if signature is None:
+        return None
+    
+    cached = read_sox_cache()
+    if cached and cached["path"] == sox_path:
+        return cached["info"]
+    
+    info = probe_sox(sox_path)
+    if info:
+        write_sox_cache({"path": sox_path, "signature": signature, "info": info})
+    return info
+
+
+def find_sox_path(use_cache=True):
+    """Find the path of the SoX executable
+
+    The result is cached with a probe of the executable, and reused as long
+    as that file does not change.
+    """
+    if use_cache:
+        cached = read_sox_cache()
+        if cached:
+            return cached["path"]
+    
+    sox_path = search_sox_path()
+    if os.path.exists(sox_path):
+        sox_info(sox_path)
+    return sox_path
+
+
+def search_sox_path():
+    """Search the SoX executable next to the application, in the usual folders and in PATH"""
+    # Default path next to the application
+    app_dir = get_application_path()
+    default_sox_path = os.path.join(app_dir, "sox", "sox.exe")
+    
+    # Check if it exists in the default path
+    if os.path.exists(default_sox_path):
+        logger.info(f"SoX found in default path: {default_sox_path}")
+        return default_sox_path
+    
+    # Alternative system paths
+    system_paths = [
+        r"C:\Program Files\sox-14-4-2\sox.exe",
+        r"C:\Program Files (x86)\sox-14-4-2\sox.exe",
+        r"C:\sox-14-4-2\sox.exe"
+    ]
+    
+    # Check system paths
+    for path in system_paths:
+        if os.path.exists(path):
+            logger.info(f"SoX found in system: {path}")
+            return path
+    
+    # Search in PATH, without starting a shell
+    result = shutil.which("sox")
+    if result:
+        logger.info(f"SoX found in PATH: {result}")
+        return result
+    
+    # Return default path even if it doesn't exist
+    # (a warning will be shown to the user later)
+    return default_sox_path
+
+
+def default_config(output_folder=None, sox_path=None):
+    """Build a configuration with the default settings"""
+    config = configparser.ConfigParser()
+    config["DEFAULT"] = dict(DEFAULT_SETTINGS)
+    config["DEFAULT"]["output_folder"] = output_folder or get_default_output_folder()
+    config["DEFAULT"]["sox_path"] = sox_path or ""
+    
+    config["ZOOM"] = dict(DEFAULT_ZOOM_SETTINGS)
+    return config
+
+
+def load_config(config_file=None, output_folder=None, sox_path=None):
+    """Load or create the configuration file"""
+    if config_file is None:
+        config_file = get_config_file()
+    
+    config = configparser.ConfigParser()
+    
+    if os.path.exists(config_file):
+        config.read(config_file)
+    else:
+        # Default configuration
+        config = default_config(output_folder, sox_path)
+        
+        try:
+            with open(config_file, "w") as f:
+                config.write(f)
+        except OSError as e:
+            logger.warning(f"Could not write configuration file {config_file}: {e}")
+    
+    # Configuration files written by older versions may miss newer keys
+    for key, value in DEFAULT_SETTINGS.items():
+        config["DEFAULT"].setdefault(key, value)
+    
+    return config
+
+
+def save_config(config, config_file=None):
+    """Save the configuration to the configuration file"""
+    if config_file is None:
+        config_file = get_config_file()
+    
+    with open(config_file, "w") as f:
+        config.write(f)
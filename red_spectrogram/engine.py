@@ -0,0 +1,782 @@
+import os
+import queue
+import logging
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from .backends import (SoxError, BatchCancelled, JobTimeout, backend_missing_dependencies, create_backend,
+                       module_available)
+from .flacinfo import MetadataCache, audio_duration
+from .archives import output_name, source_stat
+from .cache import (GenerationCache, parameters_hash, FULL_PARAMETERS, ZOOM_PARAMETERS, PYRAMID_PARAMETERS, MATRIX_PARAMETERS,
+                    ENCODE_PARAMETERS)
+from .pyramid import TILE_WIDTH, DEFAULT_MAX_WIDTH
+from .postencode import OUTPUT_FORMATS, reencode_outputs
+from .quarantine import Quarantine
+from .scheduler import JobScheduler, INTERACTIVE, BULK
+from .joblog import JobLog, JOB_LOG_NAME, ERROR_REPORT_NAME, write_error_report
+from .config import POOLING_MODES
+from .zoom import (validate_time_format, parse_time, format_time, split_zoom_starts, validate_zoom_start,
+                   is_absolute, has_multiple_windows, expand_zoom_starts, zoom_kind)
+
+logger = logging.getLogger(__name__)
+
+# Heights that map to an efficient DFT size in SoX (2^n+1)
+VALID_HEIGHTS = [65, 129, 257, 513, 1025, 2049, 4097]
+
+
+def resolve_worker_count(value):
+    """Get the number of parallel jobs, 0 or an invalid value means one per CPU core"""
+    try:
+        workers = int(value)
+    except (TypeError, ValueError):
+        workers = 0
+
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return workers
+
+
+def parameters_from_config(config):
+    """Build the spectrogram parameters from the DEFAULT and ZOOM configuration sections"""
+    default = config["DEFAULT"]
+    zoom = config["ZOOM"]
+
+    return {
+        "sox_path": default.get("sox_path", ""),
+        "output_folder": default.get("output_folder", ""),
+        "normal": True,
+        "zoom": False,
+        "pyramid": False,
+        "matrix": False,
+        "width": default["width"],
+        "height": default["height"],
+        "z_range": default["z_range"],
+        "window_type": default["window_type"],
+        "zoom_width": zoom["width"],
+        "zoom_height": zoom["height"],
+        "zoom_z_range": zoom["z_range"],
+        "zoom_window_type": zoom["window_type"],
+        "zoom_start": zoom["zoom_start"],
+        "zoom_duration": zoom["zoom_duration"],
+        "workers": resolve_worker_count(default.get("workers", "0")),
+        "backend": default.get("backend", "sox"),
+        "incremental": default.getboolean("incremental", fallback=True),
+        "job_log": default.getboolean("job_log", fallback=True),
+        "output_format": default.get("output_format", "png"),
+        "compress_level": default.get("compress_level", "9"),
+        "pooling": default.get("pooling", "mean"),
+        "memory_limit": default.get("memory_limit", "1024"),
+        "job_timeout": default.get("job_timeout", "120"),
+        "timeout_factor": default.get("timeout_factor", "1.0"),
+        "retries": default.get("retries", "2"),
+        "retry_delay": default.get("retry_delay", "2"),
+        "quarantine_after": default.get("quarantine_after", "3"),
+        "pyramid_max_width": default.get("pyramid_max_width", str(DEFAULT_MAX_WIDTH))
+    }
+
+
+def validate_parameters(params):
+    """Validate parameters against SoX limits
+
+    Returns a tuple (errors, warnings). Errors must stop the generation,
+    warnings describe values that work but are not optimal for SoX.
+    """
+    errors = []
+    warnings = []
+
+    # Check width parameters (100-5000)
+    try:
+        width = int(params["width"])
+        if width < 100 or width > 5000:
+            errors.append("Width must be between 100 and 5000 pixels.")
+
+        zoom_width = int(params["zoom_width"])
+        if zoom_width < 100 or zoom_width > 5000:
+            errors.append("Zoomed Width must be between 100 and 5000 pixels.")
+    except ValueError:
+        errors.append("Width values must be integers.")
+
+    # Check height parameters (should be 2^n+1 for efficiency)
+    try:
+        height = int(params["height"])
+        zoom_height = int(params["zoom_height"])
+
+        # We'll just warn but allow non-optimal values
+        if height not in VALID_HEIGHTS and height != 0:
+            warnings.append("The height value is not optimal for SoX processing.\n"
+                            "For best performance, use values like 129, 257, 513, or 1025.")
+
+        if zoom_height not in VALID_HEIGHTS and zoom_height != 0:
+            warnings.append("The zoomed height value is not optimal for SoX processing.\n"
+                            "For best performance, use values like 129, 257, 513, or 1025.")
+    except ValueError:
+        errors.append("Height values must be integers.")
+
+    # Check Z-range parameters (20-180)
+    try:
+        z_range = int(params["z_range"])
+        if z_range < 20 or z_range > 180:
+            errors.append("Z Range must be between 20 and 180 dB.")
+
+        zoom_z_range = int(params["zoom_z_range"])
+        if zoom_z_range < 20 or zoom_z_range > 180:
+            errors.append("Zoomed Z Range must be between 20 and 180 dB.")
+    except ValueError:
+        errors.append("Z Range values must be integers.")
+
+    # Check zoom time format
+    if params.get("zoom"):
+        specs = split_zoom_starts(params["zoom_start"])
+        if not specs or not all(validate_zoom_start(spec) for spec in specs) or not validate_time_format(params["zoom_duration"]):
+            errors.append("Invalid zoom time format. Use M:SS for the duration and a comma-separated list of\n"
+                          "M:SS, N%, end-M:SS or every M:SS for the start times")
+
+    # Check the output format
+    output_format = params.get("output_format", "png")
+    if output_format not in OUTPUT_FORMATS:
+        errors.append(f"Output format must be one of: {', '.join(OUTPUT_FORMATS)}.")
+    elif output_format != "png":
+        if not module_available("PIL"):
+            errors.append("Re-encoding the spectrograms needs the Pillow package.")
+        try:
+            if not 0 <= int(params.get("compress_level", 9)) <= 9:
+                errors.append("Compression level must be between 0 and 9.")
+        except ValueError:
+            errors.append("Compression level must be an integer.")
+
+    # Check the streaming settings of the numpy backend
+    pooling = params.get("pooling", "mean")
+    if pooling not in POOLING_MODES:
+        errors.append(f"Pooling must be one of: {', '.join(POOLING_MODES)}.")
+    elif pooling != "mean" and params.get("backend", "sox") != "numpy":
+        errors.append("Max pooling needs the numpy backend, SoX always averages.")
+    if params.get("matrix") and params.get("backend", "sox") != "numpy":
+        errors.append("The dB matrix export needs the numpy backend, SoX only writes images.")
+    try:
+        if int(params.get("memory_limit", 1024)) < 16:
+            errors.append("Memory limit must be at least 16 MB.")
+    except ValueError:
+        errors.append("Memory limit must be an integer number of MB.")
+
+    # Check the failure policy
+    try:
+        if float(params.get("job_timeout", 120)) < 0 or float(params.get("timeout_factor", 1.0)) < 0:
+            errors.append("Timeouts cannot be negative.")
+    except ValueError:
+        errors.append("Timeouts must be numbers.")
+    try:
+        if int(params.get("retries", 2)) < 0 or int(params.get("quarantine_after", 3)) < 0 or float(params.get("retry_delay", 2)) < 0:
+            errors.append("Retries, retry delay and quarantine threshold cannot be negative.")
+    except ValueError:
+        errors.append("Retries and the quarantine threshold must be integers, the retry delay a number.")
+
+    # Check the tile pyramid, its tiles are cut with Pillow for both backends
+    if params.get("pyramid"):
+        if not module_available("PIL"):
+            errors.append("The tile pyramid needs the Pillow package.")
+        try:
+            # SoX accepts up to 200000 columns
+            if not TILE_WIDTH <= int(params.get("pyramid_max_width", DEFAULT_MAX_WIDTH)) <= 200000:
+                errors.append(f"Pyramid max width must be between {TILE_WIDTH} and 200000 columns.")
+        except ValueError:
+            errors.append("Pyramid max width must be an integer.")
+
+    # Check the backend can be used
+    if params.get("backend", "sox") != "sox":
+        missing = backend_missing_dependencies(params)
+        if missing:
+            errors.append(missing)
+
+    return errors, warnings
+
+
+class BatchStats:
+    """Throughput and ETA of a running batch
+
+    Progress is measured in audio seconds rather than files: rendering time
+    grows with the track length, so a two-hour mix weighs as much as
+    the forty short tracks it takes as long to render.
+    """
+
+    def __init__(self, total_files, total_weight=0.0):
+        self.total_files = total_files
+        self.total_weight = total_weight
+        self.done_files = 0
+        self.done_weight = 0.0
+        self.audio_seconds = 0.0
+        self.start = time.monotonic()
+        self.lock = threading.Lock()
+
+    def add_files(self, count, weight):
+        """Grow the batch by files added while it runs, or shrink it with negative values"""
+        with self.lock:
+            self.total_files += count
+            self.total_weight += weight
+
+    def average_weight(self):
+        """Get the average weight of the files of the batch"""
+        with self.lock:
+            return self.total_weight / self.total_files if self.total_files else 1.0
+
+    def add(self, result, weight=None):
+        """Account for a finished file, weighted by its audio seconds unless given"""
+        with self.lock:
+            self.done_files += 1
+            self.audio_seconds += result.get("duration") or 0.0
+            self.done_weight += weight if weight is not None else result.get("duration") or 0.0
+
+    def snapshot(self):
+        """Get the current progress as a dict"""
+        with self.lock:
+            elapsed = max(time.monotonic() - self.start, 1e-6)
+            files_per_second = self.done_files / elapsed
+
+            if self.total_weight > 0:
+                progress = min(1.0, self.done_weight / self.total_weight)
+            else:
+                progress = self.done_files / self.total_files if self.total_files else 0.0
+            eta = elapsed * (1 - progress) / progress if progress > 0 else None
+
+            return {
+                "done": self.done_files,
+                "total": self.total_files,
+                "progress": progress,
+                "elapsed": elapsed,
+                "files_per_second": files_per_second,
+                "audio_seconds_per_second": self.audio_seconds / elapsed,
+                "eta": eta
+            }
+
+
+def is_transient(error):
+    """Check if an error may go away when the job runs again
+
+    Timeouts, processes killed from outside and system errors are worth
+    another attempt. A corrupt file fails the same way every time.
+    """
+    if isinstance(error, (JobTimeout, MemoryError)):
+        return True
+    if isinstance(error, SoxError):
+        # Killed by a signal, like the out-of-memory killer
+        return error.returncode < 0
+    if isinstance(error, OSError):
+        # A missing or unreadable file stays that way
+        return not isinstance(error, (FileNotFoundError, PermissionError, IsADirectoryError, NotADirectoryError))
+    return False
+
+
+def format_duration(seconds):
+    """Format a number of seconds as H:MM:SS or M:SS"""
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+
+def longest_first(durations):
+    """Order the files of a {file path: duration} dict longest first
+
+    Starting the longest jobs first keeps one long track from running alone
+    at the end of a batch. Files of unknown length go first, they may be
+    the longest.
+    """
+    return sorted(durations, key=lambda file_path: -(durations[file_path] or float("inf")))
+
+
+class SpectrogramEngine:
+    """Generate spectrograms with the selected backend, independent of any user interface"""
+
+    def __init__(self, params):
+        self.params = params
+        self.backend = create_backend(params)
+        self.cache = None
+        self.quarantine = None
+        self.job_log = None
+        self.metadata = None
+        # Path of the error report of the last batch, None when nothing failed
+        self.error_report = None
+        self.zoom_specs = split_zoom_starts(params["zoom_start"])
+        self.multiple_windows = has_multiple_windows(self.zoom_specs)
+        self.output_format = params.get("output_format", "png")
+        # Settings added after the manifest format only count when they differ
+        # from their default, so the hashes of older manifests stay valid
+        self.extra_parameters = []
+        if self.output_format != "png":
+            self.extra_parameters += ENCODE_PARAMETERS
+        if params.get("pooling", "mean") != "mean":
+            self.extra_parameters.append("pooling")
+        # Cache kind -> hash of the parameters its image depends on, one kind per zoom window
+        self.hashes = {"full": parameters_hash(params, FULL_PARAMETERS + self.extra_parameters),
+                       "pyramid": parameters_hash(params, PYRAMID_PARAMETERS + self.extra_parameters),
+                       "matrix": parameters_hash(params, MATRIX_PARAMETERS + [key for key in self.extra_parameters
+                                                                             if key not in ENCODE_PARAMETERS])}
+        self.stats = BatchStats(0)
+        # Queue of the next or running batch, and where each of its files is in the results.
+        # It exists before run_batch, so files enqueued while the batch reads durations are kept
+        self.scheduler = JobScheduler()
+        self.batch_lock = threading.Lock()
+        self.positions = {}
+        self.weights = {}
+        self.results = []
+        # Cleared while paused, workers wait on it before starting a job
+        self.running = threading.Event()
+        self.running.set()
+        self.cancelled = False
+        # Set on cancel, interrupts the wait before a retry
+        self.stopped = threading.Event()
+
+    def pause(self):
+        """Stop starting new jobs, running jobs finish normally and interactive files still start"""
+        self.running.clear()
+        if self.scheduler:
+            self.scheduler.pause()
+
+    def resume(self):
+        """Start new jobs again after a pause"""
+        self.running.set()
+        if self.scheduler:
+            self.scheduler.resume()
+
+    def is_paused(self):
+        """Check if the batch is paused"""
+        return not self.running.is_set()
+
+    def cancel(self):
+        """Cancel the batch: skip queued jobs and terminate running SoX processes"""
+        self.cancelled = True
+        self.stopped.set()
+        self.backend.terminate()
+        self.running.set()
+        if self.scheduler:
+            # Held files run out as cancelled too
+            self.scheduler.release_all()
+
+    def generate_normal_spectrogram(self, file_path, file_name):
+        """Generate a normal spectrogram"""
+        return self.backend.generate_normal_spectrogram(file_path, file_name)
+
+    def generate_zoomed_spectrogram(self, file_path, file_name, specs=None):
+        """Generate the zoomed spectrograms"""
+        return self.backend.generate_zoomed_spectrogram(file_path, file_name, specs)
+
+    def generate_combined_spectrograms(self, file_path, file_name, specs=None):
+        """Generate the full and zoomed spectrograms from a single decode of the file"""
+        return self.backend.generate_combined_spectrograms(file_path, file_name, specs)
+
+    def generate(self, file_path, file_name, full, specs, pyramid=False, matrix=False):
+        """Generate the full spectrogram, the dB matrix, the zoom windows of specs and the tile pyramid, in that order"""
+        outputs = []
+        if matrix:
+            # The matrix holds the levels of the full spectrogram, rendered from the same decode
+            outputs = self.backend.generate_matrix(file_path, file_name, full, specs)
+        elif full and specs:
+            # Decode the file once and render all spectrograms from the same stream
+            outputs = self.generate_combined_spectrograms(file_path, file_name, specs)
+        elif specs:
+            outputs = self.generate_zoomed_spectrogram(file_path, file_name, specs)
+        elif full:
+            outputs = self.generate_normal_spectrogram(file_path, file_name)
+        if pyramid:
+            outputs = outputs + self.backend.generate_pyramid(file_path, file_name)
+        return outputs
+
+    def job_timeout(self, duration):
+        """Get the time limit of a job in seconds, scaled by the audio duration, None for no limit"""
+        timeout = float(self.params.get("job_timeout", 120))
+        if not timeout:
+            return None
+        return timeout + float(self.params.get("timeout_factor", 1.0)) * (duration or 0.0)
+
+    def generate_with_retries(self, file_path, file_name, full, specs, pyramid, matrix, result):
+        """Generate within the time limit, retrying transient errors with exponential backoff
+
+        The number of attempts is stored in result["attempts"].
+        """
+        timeout = self.job_timeout(result["duration"])
+        retries = int(self.params.get("retries", 2))
+        delay = float(self.params.get("retry_delay", 2))
+        attempt = 1
+
+        while True:
+            result["attempts"] = attempt
+            try:
+                with self.backend.time_limit(timeout):
+                    return self.generate(file_path, file_name, full, specs, pyramid, matrix)
+            except BatchCancelled:
+                raise
+            except Exception as e:
+                if self.cancelled or attempt > retries or not is_transient(e):
+                    raise
+                logger.warning(f"Attempt {attempt} of {file_name} failed: {e}. Retrying in {delay:g}s")
+
+            if self.stopped.wait(delay):
+                raise BatchCancelled()
+            attempt += 1
+            delay *= 2
+
+    def zoom_kinds(self, total_duration):
+        """Get the cache kind of every zoom window of a track, by zoom position"""
+        kinds = {}
+        for spec in expand_zoom_starts(self.zoom_specs, total_duration):
+            kind = zoom_kind(spec, self.multiple_windows)
+            if kind not in self.hashes:
+                self.hashes[kind] = parameters_hash(dict(self.params, zoom_start=spec), ZOOM_PARAMETERS + self.extra_parameters)
+            kinds[spec] = kind
+        return kinds
+
+    def track_duration(self, file_path):
+        """Get the duration of a file from the metadata cache, or None when it is unknown"""
+        if self.metadata:
+            return self.metadata.duration(file_path)
+        return audio_duration(file_path)
+
+    def zoom_window_error(self, total_duration):
+        """Describe why the zoom windows do not fit in a track, or None when they do
+
+        Checked before any process is started, a window that starts after the
+        end of the track would only fail once SoX has decoded the file.
+        """
+        if not total_duration:
+            return None
+        for spec in self.zoom_specs:
+            if is_absolute(spec) and parse_time(spec) >= total_duration:
+                return f"Zoom window {spec} starts after the end of the track ({format_time(round(total_duration, 2))})"
+        return None
+
+    def schedule(self, files):
+        """Order files longest first and weigh them by audio seconds
+
+        Returns (ordered files, weights by file). Files of unknown length
+        weigh as much as an average file.
+        """
+        with ThreadPoolExecutor(max_workers=max(4, self.params["workers"])) as executor:
+            durations = dict(zip(files, executor.map(self.track_duration, files)))
+
+        known = [duration for duration in durations.values() if duration]
+        average = sum(known) / len(known) if known else 1.0
+        weights = {file_path: duration or average for file_path, duration in durations.items()}
+
+        return longest_first(durations), weights
+
+    def process_file(self, file_path, queued_at=None, wait=True):
+        """Generate the selected spectrogram types for one file and describe the outcome
+
+        The status is "ok" when something was generated, "cached" when every
+        output was already up to date, "cancelled" when the batch was
+        cancelled first, "error" when generation failed and "quarantined"
+        when the file failed too often before. queued_at is the
+        time.monotonic() value when the job was submitted, used to measure
+        how long it waited for a worker. Unless wait is False, the job waits
+        while the batch is paused.
+        """
+        return self.finish_file(*self.render_file(file_path, queued_at, wait))
+
+    def render_file(self, file_path, queued_at=None, wait=True):
+        """Generate the spectrograms of one file, return (result, stat, kinds) for finish_file"""
+        file_name = output_name(file_path)
+        result = {"file": file_path, "status": "ok", "outputs": [], "cached": [], "error": None}
+
+        if wait:
+            self.running.wait()
+        start = time.monotonic()
+        result["queue_wait"] = round(start - queued_at, 3) if queued_at is not None else 0.0
+        result["duration"] = self.track_duration(file_path)
+
+        if self.cancelled:
+            result["status"] = "cancelled"
+            result["elapsed"] = 0.0
+            return result, None, []
+
+        timer = self.backend.begin_job()
+        stat = None
+        kinds = []
+
+        try:
+            if self.params["zoom"]:
+                error = self.zoom_window_error(result["duration"])
+                if error:
+                    raise ValueError(error)
+
+            if self.params["normal"]:
+                kinds.append("full")
+            if self.params.get("matrix"):
+                kinds.append("matrix")
+            zoom_kinds = self.zoom_kinds(result["duration"]) if self.params["zoom"] else {}
+            kinds += zoom_kinds.values()
+            if self.params.get("pyramid"):
+                kinds.append("pyramid")
+
+            # Skip the spectrograms that are up to date in the manifest
+            stat = source_stat(file_path)
+            if self.cache:
+                missing = []
+                for kind in kinds:
+                    cached_path = self.cache.lookup(file_path, stat, kind, self.hashes[kind])
+                    if cached_path:
+                        result["cached"].append(cached_path)
+                    else:
+                        missing.append(kind)
+                kinds = missing
+
+            # Zoom positions whose window is not up to date
+            specs = [spec for spec, kind in zoom_kinds.items() if kind in kinds]
+            # --force retries quarantined files, their failures still count
+            quarantined = None
+            if self.quarantine and kinds and not self.params.get("retry_quarantined"):
+                quarantined = self.quarantine.reason(file_path, stat)
+
+            if not kinds:
+                result["status"] = "cached"
+            elif quarantined:
+                result["status"] = "quarantined"
+                result["error"] = quarantined
+                kinds = []
+            else:
+                result["outputs"] = self.generate_with_retries(file_path, file_name, "full" in kinds, specs,
+                                                               "pyramid" in kinds, "matrix" in kinds, result)
+        except BatchCancelled:
+            result["status"] = "cancelled"
+        except Exception as e:
+            if self.cancelled:
+                result["status"] = "cancelled"
+            else:
+                logger.error(f"Error processing {file_name}: {e}")
+                result["status"] = "error"
+                result["error"] = str(e)
+
+        # Only failures of the generation itself count, not those of the settings
+        if self.quarantine and "attempts" in result:
+            if result["status"] == "ok":
+                self.quarantine.succeeded(file_path)
+            elif result["status"] == "error" and self.quarantine.failed(file_path, stat, result["attempts"], result["error"]):
+                logger.warning(f"{file_name} is quarantined, later batches skip it until it changes")
+
+        result["elapsed"] = round(time.monotonic() - start, 3)
+        result["timings"] = timer.as_dict()
+        result["exit_status"] = timer.exit_statuses
+        return result, stat, kinds
+
+    def finish_file(self, result, stat, kinds):
+        """Re-encode the new spectrograms of a rendered file, record them in the manifest and log the result"""
+        if result["outputs"] and result["status"] == "ok":
+            try:
+                if self.output_format != "png":
+                    # The pyramid tiles are written in the output format and the matrix is not an image
+                    images = [i for i, kind in enumerate(kinds) if kind not in ("matrix", "pyramid")]
+                    encoded, result["post_encode"] = reencode_outputs(
+                        [result["outputs"][i] for i in images], self.output_format,
+                        int(self.params.get("compress_level", 9)))
+                    for i, output_path in zip(images, encoded):
+                        result["outputs"][i] = output_path
+                    result["timings"]["post_encode"] = result["post_encode"]["seconds"]
+                    result["elapsed"] = round(result["elapsed"] + result["post_encode"]["seconds"], 3)
+
+                if self.cache:
+                    for kind, output_path in zip(kinds, result["outputs"]):
+                        self.cache.record(result["file"], stat, kind, self.hashes[kind], output_path)
+            except Exception as e:
+                logger.error(f"Error re-encoding {os.path.basename(result['file'])}: {e}")
+                result["status"] = "error"
+                result["error"] = str(e)
+
+        result["output_bytes"] = sum(os.path.getsize(path) for path in result["outputs"] if os.path.exists(path))
+
+        if self.job_log and "timings" in result:
+            self.job_log.write(dict(result, time=time.strftime("%Y-%m-%dT%H:%M:%S"), backend=self.backend.name))
+        return result
+
+    def run_batch(self, files, on_progress=None, interactive=False):
+        """Process files on a pool of parallel jobs, longest first
+
+        While the batch runs, enqueue() adds files, dequeue() removes
+        queued ones and self.scheduler reorders and holds them. When
+        interactive files are expected (the GUI), one more job is reserved
+        for them, so the bulk keeps all parallel jobs.
+        on_progress(done, total, result) is called as jobs complete.
+        Returns the results in the order the files were queued.
+        """
+        files = list(files)
+        with self.batch_lock:
+            if self.scheduler.finished:
+                # A new batch on the same engine
+                self.scheduler = JobScheduler()
+                self.positions = {}
+                self.weights = {}
+                self.results = []
+                self.stats = BatchStats(0)
+            # Results in list order, files enqueued before come first
+            for file_path in files:
+                if file_path not in self.positions:
+                    self.positions[file_path] = len(self.results)
+                    self.results.append(None)
+            if self.is_paused():
+                self.scheduler.pause()
+
+        self.prepare_output()
+        ordered, weights = self.schedule(files)
+        with self.batch_lock:
+            for file_path in ordered:
+                self.add_job(file_path, weights[file_path], BULK)
+
+        workers = self.params["workers"]
+        reserved = 1 if interactive else 0
+        completed = queue.Queue()
+        # Re-encoding runs on its own pool, so the generation jobs move on to the next file
+        encoder = ThreadPoolExecutor(max_workers=workers) if self.output_format != "png" else None
+        threads = [threading.Thread(target=self.run_jobs, args=(slot < reserved, completed, encoder), daemon=True)
+                   for slot in range(workers + reserved)]
+
+        def close():
+            # The last result is followed by None once every job and re-encode is done
+            for thread in threads:
+                thread.join()
+            if encoder:
+                encoder.shutdown(wait=True)
+            completed.put(None)
+
+        closer = threading.Thread(target=close, daemon=True)
+        for thread in threads:
+            thread.start()
+        closer.start()
+
+        try:
+            finished = (future.result() for future in iter(completed.get, None))
+            self.collect_results(finished, on_progress)
+        finally:
+            # Running jobs finish before the manifest is saved, also when collecting failed
+            self.scheduler.stop()
+            closer.join()
+            if self.cache:
+                self.cache.save()
+            if self.quarantine:
+                self.quarantine.save()
+            self.metadata.save()
+
+        # Files removed from the queue have no result
+        results = [result for result in self.results if result is not None]
+        self.write_error_report(results)
+        return results
+
+    def run_jobs(self, interactive_only, completed, encoder):
+        """Run files from the scheduler until the batch is finished (runs on a worker thread)
+
+        The outcome of every file is put in completed as a future, after
+        its re-encode on the encoder pool when there is one.
+        """
+        while True:
+            job = self.scheduler.next_job(interactive_only)
+            if job is None:
+                return
+
+            # The scheduler holds back bulk files while paused, interactive files start anyway
+            future = Future()
+            try:
+                if encoder is None:
+                    future.set_result(self.process_file(job.file_path, job.queued_at, wait=False))
+                else:
+                    future = encoder.submit(self.finish_file, *self.render_file(job.file_path, job.queued_at, wait=False))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                self.scheduler.job_done()
+            future.add_done_callback(completed.put)
+
+    def enqueue(self, files, interactive=False):
+        """Add files to the running batch, return the files that were new to it
+
+        Interactive files go before the rest of the queue and may use the
+        reserved job. Interactive files that are already queued are moved
+        up, files that already ran are not run again.
+        """
+        durations = {file_path: self.track_duration(file_path) for file_path in files}
+        average = self.stats.average_weight()
+        priority = INTERACTIVE if interactive else BULK
+
+        added = []
+        with self.batch_lock:
+            for file_path in files:
+                if self.add_job(file_path, durations[file_path] or average, priority):
+                    added.append(file_path)
+                elif interactive:
+                    self.scheduler.prioritize(file_path)
+        return added
+
+    def add_job(self, file_path, weight, priority):
+        """Queue a file of the batch with its weight, return False if it is already in it (batch_lock held)"""
+        if not self.scheduler.add(file_path, priority):
+            return False
+        if file_path not in self.positions:
+            self.positions[file_path] = len(self.results)
+            self.results.append(None)
+        self.weights[file_path] = weight
+        self.stats.add_files(1, weight)
+        return True
+
+    def dequeue(self, files):
+        """Remove files that have not started from the running batch, return the removed files"""
+        with self.batch_lock:
+            removed = [file_path for file_path in files if self.scheduler.remove(file_path)]
+            self.stats.add_files(-len(removed), -sum(self.weights[file_path] for file_path in removed))
+        return removed
+
+    def write_error_report(self, results):
+        """Write the failed and quarantined files of a batch to one report in the output folder
+
+        The report of an earlier batch is removed when nothing failed.
+        """
+        path = os.path.join(self.params["output_folder"], ERROR_REPORT_NAME)
+        self.error_report = None
+        try:
+            if write_error_report(results, path):
+                self.error_report = path
+            elif os.path.exists(path):
+                os.remove(path)
+        except OSError as e:
+            logger.warning(f"Could not write the error report {path}: {e}")
+
+    def collect_results(self, finished, on_progress):
+        """Store results in queue order as they finish, updating the statistics and reporting progress"""
+        for done, result in enumerate(finished, 1):
+            file_path = result["file"]
+            with self.batch_lock:
+                self.results[self.positions[file_path]] = result
+                self.stats.add(result, self.weights[file_path])
+            if on_progress:
+                on_progress(done, self.stats.total_files, result)
+
+    def prepare_output(self):
+        """Create the output folder and open the manifest, metadata cache and job log"""
+        self.open_cache()
+        self.open_quarantine()
+        self.open_job_log()
+        if self.metadata is None:
+            self.metadata = MetadataCache(self.params["output_folder"])
+
+    def open_job_log(self):
+        """Log every job to a JSON-lines file in the output folder when enabled"""
+        if self.params.get("job_log", True) and self.job_log is None:
+            self.job_log = JobLog(os.path.join(self.params["output_folder"], JOB_LOG_NAME))
+
+    def open_cache(self):
+        """Create the output folder and load its manifest when incremental generation is enabled"""
+        if not os.path.exists(self.params["output_folder"]):
+            os.makedirs(self.params["output_folder"])
+
+        if self.params.get("incremental", True) and self.cache is None:
+            self.cache = GenerationCache(self.params["output_folder"])
+
+    def open_quarantine(self):
+        """Load the failure counts of the output folder, also when unchanged files are not skipped"""
+        threshold = int(self.params.get("quarantine_after", 3))
+        if threshold and self.quarantine is None:
+            self.quarantine = Quarantine(self.params["output_folder"], threshold)
+
+    def cache_stats(self):
+        """Get the cache hits and misses of the last batch"""
+        if not self.cache:
+            return {"hits": 0, "misses": 0}
+        return {"hits": self.cache.hits, "misses": self.cache.misses}
@@ -0,0 +1,159 @@
+"""Read FLAC stream information without decoding audio
+
+The STREAMINFO block sits in the first 42 bytes of a FLAC file (after an
+optional ID3v2 tag), so reading it costs one small read per file. The
+MetadataCache remembers it by size and mtime in the output folder, so
+repeated batches over a large library only stat the files.
+"""
+import os
+import json
+import struct
+import logging
+import threading
+
+from .archives import ARCHIVE_ERRORS, open_source, source_stat
+
+logger = logging.getLogger(__name__)
+
+METADATA_CACHE_NAME = ".red-spectrogram-metadata.json"
+METADATA_CACHE_VERSION = 1
+
+# Save the cache after this many new entries
+SAVE_INTERVAL = 500
+
+
+class FlacFormatError(Exception):
+    """Raised when a file is not a valid FLAC file"""
+
+
+# Errors of a file or archive member whose header cannot be read
+READ_ERRORS = (FlacFormatError,) + ARCHIVE_ERRORS
+
+
+def id3_size(header):
+    """Get the size of an ID3v2 tag at the start of a file, 0 when there is none"""
+    if len(header) < 10 or header[:3] != b"ID3":
+        return 0
+    # Syncsafe integer: 7 bits per byte, plus a 10 byte footer when flagged
+    size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+    return 10 + size + (10 if header[5] & 0x10 else 0)
+
+
+def read_streaminfo(file_path):
+    """Read the STREAMINFO block of a FLAC file
+
+    Returns a dict with sample_rate, channels, bits_per_sample,
+    total_samples and duration (seconds, 0 when unknown).
+    """
+    with open_source(file_path) as f:
+        header = f.read(4 + 4 + 34)
+        # Some taggers put an ID3v2 tag in front of the FLAC stream
+        skip = id3_size(header)
+        if skip:
+            f.seek(skip)
+            header = f.read(4 + 4 + 34)
+
+    if len(header) < 42 or header[:4] != b"fLaC":
+        raise FlacFormatError(f"Not a FLAC file: {file_path}")
+
+    # The first metadata block must be STREAMINFO (type 0)
+    if header[4] & 0x7F != 0:
+        raise FlacFormatError(f"Missing STREAMINFO block: {file_path}")
+
+    info = header[8:42]
+    # Bytes 10-17: 20 bits sample rate, 3 bits channels-1, 5 bits bps-1, 36 bits total samples
+    packed, = struct.unpack(">Q", info[10:18])
+    sample_rate = packed >> 44
+    channels = ((packed >> 41) & 0x7) + 1
+    bits_per_sample = ((packed >> 36) & 0x1F) + 1
+    total_samples = packed & 0xFFFFFFFFF
+
+    if sample_rate == 0:
+        raise FlacFormatError(f"Invalid sample rate: {file_path}")
+
+    return {
+        "sample_rate": sample_rate,
+        "channels": channels,
+        "bits_per_sample": bits_per_sample,
+        "total_samples": total_samples,
+        "duration": total_samples / sample_rate
+    }
+
+
+def audio_duration(file_path):
+    """Get the duration of a FLAC file in seconds, or None if it cannot be read"""
+    try:
+        return read_streaminfo(file_path)["duration"]
+    except READ_ERRORS:
+        return None
+
+
+class MetadataCache:
+    """STREAMINFO of source files, keyed by path and checked against size and mtime"""
+
+    def __init__(self, folder):
+        self.path = os.path.join(folder, METADATA_CACHE_NAME)
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.unsaved = 0
+        self.load()
+
+    def load(self):
+        """Read the cache, starting empty if it is missing or unreadable"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == METADATA_CACHE_VERSION:
+                self.entries = data.get("files", {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable metadata cache {self.path}: {e}")
+
+    def save(self):
+        """Write the cache atomically"""
+        with self.lock:
+            if not self.unsaved:
+                return
+            data = {"version": METADATA_CACHE_VERSION, "files": self.entries}
+            temp_path = self.path + ".tmp"
+            try:
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f, separators=(",", ":"))
+                os.replace(temp_path, self.path)
+                self.unsaved = 0
+            except OSError as e:
+                logger.warning(f"Could not save metadata cache {self.path}: {e}")
+
+    def streaminfo(self, file_path):
+        """Get the STREAMINFO dict of a file, or None if it is not a readable FLAC file"""
+        key = os.path.normcase(os.path.abspath(file_path))
+        try:
+            stat = source_stat(file_path)
+        except OSError:
+            return None
+
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns:
+            return entry["info"]
+
+        # Invalid files are remembered too, so they are not read again
+        try:
+            info = read_streaminfo(file_path)
+        except READ_ERRORS:
+            info = None
+
+        with self.lock:
+            self.entries[key] = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "info": info}
+            self.unsaved += 1
+            save_now = self.unsaved >= SAVE_INTERVAL
+
+        if save_now:
+            self.save()
+        return info
+
+    def duration(self, file_path):
+        """Get the duration of a file in seconds, or None when it is unknown"""
+        info = self.streaminfo(file_path)
+        return (info["duration"] or None) if info else None
@@ -0,0 +1,182 @@
+"""Per-job timing instrumentation and structured job log
+
+Every processed file produces one record with its queue wait, process
+spawn time, decode/render wall times, output size, exit statuses and audio
+duration. Records are appended to a rotating JSON-lines file. The files
+that failed are also listed in one error report at the end of a batch.
+"""
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+JOB_LOG_NAME = "red-spectrogram-jobs.jsonl"
+
+# Failed and quarantined files of the last batch
+ERROR_REPORT_NAME = "red-spectrogram-errors.txt"
+
+# Rotate the job log at this size, keeping this many old files
+MAX_LOG_BYTES = 10 * 1024 * 1024
+LOG_BACKUPS = 5
+
+
+class StageTimer:
+    """Wall time per stage and exit statuses of the processes of one job"""
+
+    def __init__(self):
+        self.stages = {}
+        self.exit_statuses = []
+
+    def add(self, stage, seconds):
+        """Add time to a stage"""
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def measure(self, stage):
+        """Measure the wall time of a block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def as_dict(self):
+        """Get the stage timings rounded for the log"""
+        return {stage: round(seconds, 4) for stage, seconds in self.stages.items()}
+
+
+class JobLog:
+    """Thread-safe, size-rotated JSON-lines file"""
+
+    def __init__(self, path, max_bytes=MAX_LOG_BYTES, backups=LOG_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.lock = threading.Lock()
+
+    def rotate(self):
+        """Shift job.jsonl -> job.jsonl.1 -> ... and drop the oldest"""
+        for i in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{i}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def write(self, record):
+        """Append one record"""
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self.lock:
+            try:
+                if os.path.exists(self.path) and os.path.getsize(self.path) + len(line) > self.max_bytes:
+                    self.rotate()
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+            except OSError as e:
+                logger.warning(f"Could not write job log {self.path}: {e}")
+
+
+def percentile(values, fraction):
+    """Get a percentile of a list of numbers with linear interpolation"""
+    if not values:
+        return None
+    values = sorted(values)
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def summarize(results, slowest=5):
+    """Summarize the per-file latency of a batch
+
+    Only files that were actually processed count: cached and cancelled
+    files would make the latency look better than it is.
+    """
+    processed = [result for result in results if result["status"] in ("ok", "error")]
+    latencies = [result["elapsed"] for result in processed]
+
+    stage_totals = {}
+    for result in processed:
+        for stage, seconds in result.get("timings", {}).items():
+            stage_totals[stage] = stage_totals.get(stage, 0.0) + seconds
+
+    def rounded(value):
+        return round(value, 3) if value is not None else None
+
+    return {
+        "processed": len(processed),
+        "failed": sum(1 for result in processed if result["status"] == "error"),
+        "retried": sum(1 for result in processed if result.get("attempts", 1) > 1),
+        "quarantined": sum(1 for result in results if result["status"] == "quarantined"),
+        "p50": rounded(percentile(latencies, .50)),
+        "p95": rounded(percentile(latencies, .95)),
+        "max": rounded(max(latencies)) if latencies else None,
+        "mean_queue_wait": rounded(sum(result.get("queue_wait", 0.0) for result in processed) / len(processed)) if processed else None,
+        "stage_totals": {stage: round(seconds, 3) for stage, seconds in stage_totals.items()},
+        "bytes_saved": sum(result["post_encode"]["bytes_saved"] for result in processed if result.get("post_encode")),
+        "slowest": [
+            {"file": result["file"], "elapsed": result["elapsed"], "duration": result.get("duration")}
+            for result in sorted(processed, key=lambda result: result["elapsed"], reverse=True)[:slowest]
+        ]
+    }
+
+
+def format_summary(summary):
+    """Format a summary as text for the statistics panel"""
+    if not summary["processed"]:
+        if summary.get("quarantined"):
+            return f"No files were processed in the last batch, {summary['quarantined']} quarantined files were skipped."
+        return "No files were processed in the last batch."
+
+    lines = [
+        f"Processed files: {summary['processed']} ({summary['failed']} failed, {summary.get('retried', 0)} retried)",
+        f"Per-file latency: p50 {summary['p50']:.2f}s, p95 {summary['p95']:.2f}s, max {summary['max']:.2f}s",
+        f"Mean queue wait: {summary['mean_queue_wait']:.2f}s",
+    ]
+    if summary.get("quarantined"):
+        lines.append(f"Skipped quarantined files: {summary['quarantined']}")
+    if summary.get("bytes_saved"):
+        lines.append(f"Saved by re-encoding: {summary['bytes_saved'] / 1048576:.1f} MB")
+    lines += [
+        "",
+        "Time per stage (all files):"
+    ]
+    for stage, seconds in sorted(summary["stage_totals"].items()):
+        lines.append(f"  {stage}: {seconds:.2f}s")
+
+    lines += ["", "Slowest files:"]
+    for entry in summary["slowest"]:
+        duration = f", {entry['duration']:.0f}s of audio" if entry["duration"] else ""
+        lines.append(f"  {entry['elapsed']:.2f}s  {os.path.basename(entry['file'])}{duration}")
+
+    return "\n".join(lines)
+
+
+def failures(results):
+    """Get the results of the files that failed or were skipped as quarantined"""
+    return [result for result in results if result["status"] in ("error", "quarantined")]
+
+
+def format_error_report(results):
+    """Format the failed files of a batch as text, one file per line with its error"""
+    lines = []
+    for result in failures(results):
+        attempts = result.get("attempts", 1)
+        tried = f" after {attempts} attempts" if attempts > 1 else ""
+        lines.append(f"{result['status']}{tried}: {result['file']}: {result['error']}")
+    return "\n".join(lines)
+
+
+def write_error_report(results, path):
+    """Write the error report of a batch, return False when nothing failed"""
+    report = format_error_report(results)
+    if not report:
+        return False
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"{len(failures(results))} of {len(results)} files failed, {time.strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+        f.write(report + "\n")
+    return True
@@ -0,0 +1,319 @@
+"""Distributed batches over a shared job ledger
+
+The ledger is an SQLite database on a filesystem that every render node
+mounts. Batches are enqueued from the GUI or the command line, and worker
+processes on any node claim jobs from it:
+
+- a claimed job is leased to one worker for a limited time,
+- the worker renews the leases of its running jobs with a heartbeat,
+- when a worker dies its leases expire and the jobs are claimed again,
+  up to MAX_ATTEMPTS times,
+- progress is aggregated from the job states of a batch.
+
+No broker is needed, SQLite's file locking serializes the writers. The
+rollback journal is used instead of WAL, which does not work on network
+filesystems. Leases use wall-clock time, so node clocks must be in sync.
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Seconds a claimed job stays leased without a heartbeat
+LEASE_SECONDS = 60
+
+# Times a job is claimed before it is given up
+MAX_ATTEMPTS = 3
+
+# Seconds an idle worker waits before looking for new jobs
+POLL_INTERVAL = 2.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    id TEXT PRIMARY KEY,
+    params TEXT NOT NULL,
+    created REAL NOT NULL,
+    cancelled INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    batch TEXT NOT NULL REFERENCES batches(id),
+    file TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_until REAL,
+    result TEXT,
+    error TEXT,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, lease_until);
+CREATE INDEX IF NOT EXISTS jobs_batch ON jobs(batch, status);
+"""
+
+# Job states that will not change any more
+FINISHED_STATES = ("ok", "cached", "error", "cancelled")
+
+
+def worker_name():
+    """Get a worker id that is unique across nodes and processes"""
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+class JobLedger:
+    """Batches and jobs in a shared SQLite database"""
+
+    def __init__(self, path, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # sqlite3 connections must not be shared between threads
+        self.local = threading.local()
+        with self.transaction() as db:
+            for statement in SCHEMA.split(";"):
+                db.execute(statement)
+
+    def connection(self):
+        """Get the connection of the current thread"""
+        db = getattr(self.local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=DELETE")
+            self.local.db = db
+        return db
+
+    def transaction(self):
+        """Get a context manager for a write transaction that locks the ledger right away"""
+        return Transaction(self.connection())
+
+    def enqueue(self, files, params):
+        """Add a batch of files rendered with params, return the batch id"""
+        batch = uuid.uuid4().hex
+        now = time.time()
+        with self.transaction() as db:
+            db.execute("INSERT INTO batches (id, params, created) VALUES (?, ?, ?)", (batch, json.dumps(params), now))
+            db.executemany("INSERT INTO jobs (batch, file, updated) VALUES (?, ?, ?)",
+                           [(batch, os.path.abspath(file_path), now) for file_path in files])
+        return batch
+
+    def cancel(self, batch):
+        """Cancel the jobs of a batch that were not claimed yet"""
+        with self.transaction() as db:
+            db.execute("UPDATE batches SET cancelled = 1 WHERE id = ?", (batch,))
+            db.execute("UPDATE jobs SET status = 'cancelled', updated = ? WHERE batch = ? AND status = 'queued'",
+                       (time.time(), batch))
+
+    def claim(self, worker):
+        """Lease the next queued job, or a job whose worker stopped sending heartbeats
+
+        Returns (job id, batch id, file path, params) or None.
+        """
+        now = time.time()
+        with self.transaction() as db:
+            # Give up on jobs that keep losing their worker
+            db.execute("UPDATE jobs SET status = 'error', error = 'Worker lost too many times', updated = ? "
+                       "WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                       (now, now, self.max_attempts))
+
+            row = db.execute("SELECT jobs.id, jobs.batch, jobs.file, batches.params FROM jobs "
+                             "JOIN batches ON batches.id = jobs.batch "
+                             "WHERE jobs.status = 'queued' OR (jobs.status = 'running' AND jobs.lease_until < ?) "
+                             "ORDER BY jobs.id LIMIT 1", (now,)).fetchone()
+            if row is None:
+                return None
+
+            db.execute("UPDATE jobs SET status = 'running', worker = ?, lease_until = ?, attempts = attempts + 1, updated = ? "
+                       "WHERE id = ?", (worker, now + self.lease_seconds, now, row["id"]))
+
+        return row["id"], row["batch"], row["file"], json.loads(row["params"])
+
+    def heartbeat(self, worker):
+        """Renew the leases of every job a worker is running"""
+        now = time.time()
+        with self.transaction() as db:
+            db.execute("UPDATE jobs SET lease_until = ?, updated = ? WHERE worker = ? AND status = 'running'",
+                       (now + self.lease_seconds, now, worker))
+
+    def complete(self, job, worker, result):
+        """Store the result of a job, unless its lease was taken over by another worker
+
+        Returns False when the result was discarded.
+        """
+        with self.transaction() as db:
+            cursor = db.execute("UPDATE jobs SET status = ?, result = ?, error = ?, lease_until = NULL, updated = ? "
+                                "WHERE id = ? AND worker = ? AND status = 'running'",
+                                (result["status"], json.dumps(result), result.get("error"), time.time(), job, worker))
+            return cursor.rowcount == 1
+
+    def is_cancelled(self, batch):
+        """Check if a batch was cancelled"""
+        row = self.connection().execute("SELECT cancelled FROM batches WHERE id = ?", (batch,)).fetchone()
+        return bool(row and row["cancelled"])
+
+    def pending(self):
+        """Count the jobs that are queued or running on any worker"""
+        row = self.connection().execute("SELECT COUNT(*) AS count FROM jobs WHERE status IN ('queued', 'running')").fetchone()
+        return row["count"]
+
+    def progress(self, batch):
+        """Count the jobs of a batch by state, plus the running workers"""
+        db = self.connection()
+        counts = {"queued": 0, "running": 0, "ok": 0, "cached": 0, "error": 0, "cancelled": 0}
+        for row in db.execute("SELECT status, COUNT(*) AS count FROM jobs WHERE batch = ? GROUP BY status", (batch,)):
+            counts[row["status"]] = row["count"]
+
+        workers = [row["worker"] for row in db.execute(
+            "SELECT DISTINCT worker FROM jobs WHERE batch = ? AND status = 'running'", (batch,))]
+
+        total = sum(counts.values())
+        done = sum(counts[state] for state in FINISHED_STATES)
+        return dict(counts, total=total, done=done, finished=total > 0 and done == total, workers=workers)
+
+    def results(self, batch):
+        """Get the results of the finished jobs of a batch"""
+        rows = self.connection().execute("SELECT file, status, result, error FROM jobs WHERE batch = ? ORDER BY id", (batch,))
+        results = []
+        for row in rows:
+            if row["result"]:
+                results.append(json.loads(row["result"]))
+            else:
+                results.append({"file": row["file"], "status": row["status"], "outputs": [], "cached": [],
+                                "error": row["error"], "elapsed": 0.0})
+        return results
+
+    def batches(self):
+        """List the batches with their progress, newest first"""
+        rows = self.connection().execute("SELECT id, created FROM batches ORDER BY created DESC").fetchall()
+        return [dict(self.progress(row["id"]), batch=row["id"], created=row["created"]) for row in rows]
+
+
+class Transaction:
+    """BEGIN IMMEDIATE ... COMMIT, rolled back on errors"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.db.execute("COMMIT" if exc_type is None else "ROLLBACK")
+        return False
+
+
+class LedgerWorker:
+    """Claim jobs from a ledger and render them with the local engine
+
+    overrides replaces parameters of the enqueued batches that differ
+    between nodes, like the SoX path and the number of parallel jobs.
+    """
+
+    def __init__(self, ledger, overrides=None, worker=None, exit_when_idle=False, on_result=None):
+        self.ledger = ledger
+        self.overrides = overrides or {}
+        self.worker = worker or worker_name()
+        self.exit_when_idle = exit_when_idle
+        self.on_result = on_result
+        self.stop_event = threading.Event()
+        # Batch id -> engine rendering it
+        self.engines = {}
+        self.engines_lock = threading.Lock()
+
+    def stop(self):
+        """Finish the running jobs and stop claiming new ones"""
+        self.stop_event.set()
+
+    def engine(self, batch, params):
+        """Get the engine of a batch, created on first use"""
+        from .engine import SpectrogramEngine
+
+        with self.engines_lock:
+            if batch not in self.engines:
+                # The manifest, quarantine and job log are files that several nodes
+                # would overwrite, the ledger records every result instead
+                params = dict(params, **self.overrides)
+                params.update({"incremental": False, "job_log": False, "quarantine_after": "0"})
+                engine = SpectrogramEngine(params)
+                engine.prepare_output()
+                self.engines[batch] = engine
+            return self.engines[batch]
+
+    def send_heartbeats(self):
+        """Renew the leases until stopped"""
+        while not self.stop_event.wait(self.ledger.lease_seconds / 3):
+            try:
+                self.ledger.heartbeat(self.worker)
+            except sqlite3.Error as e:
+                logger.warning(f"Heartbeat failed: {e}")
+
+    def run_job(self, job, batch, file_path, params):
+        """Render one claimed job and store its result"""
+        if self.ledger.is_cancelled(batch):
+            result = {"file": file_path, "status": "cancelled", "outputs": [], "cached": [], "error": None, "elapsed": 0.0}
+        else:
+            try:
+                result = self.engine(batch, params).process_file(file_path, time.monotonic())
+            except Exception as e:
+                # An unusable backend or output folder on this node, the job must still finish or its lease never ends
+                logger.error(f"Error processing {file_path}: {e}")
+                result = {"file": file_path, "status": "error", "outputs": [], "cached": [], "error": str(e), "elapsed": 0.0}
+
+        result["worker"] = self.worker
+        if not self.ledger.complete(job, self.worker, result):
+            logger.warning(f"Lease of {file_path} expired, its result was discarded")
+        elif self.on_result:
+            self.on_result(result)
+
+    def run(self):
+        """Claim and render jobs until stopped, or until every job in the ledger is finished with exit_when_idle"""
+        workers = max(1, int(self.overrides.get("workers", 1)))
+        # Number of claimed jobs not finished yet, never more than workers
+        active = [0]
+        active_changed = threading.Condition()
+        heartbeat = threading.Thread(target=self.send_heartbeats, daemon=True)
+        heartbeat.start()
+        logger.info(f"Worker {self.worker} processing {self.ledger.path} with {workers} parallel jobs")
+
+        def job_done(future):
+            with active_changed:
+                active[0] -= 1
+                active_changed.notify_all()
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"Ledger job failed: {e}")
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            try:
+                while not self.stop_event.is_set():
+                    with active_changed:
+                        if active[0] >= workers:
+                            active_changed.wait(0.5)
+                            continue
+
+                    claimed = self.ledger.claim(self.worker)
+                    if claimed is None:
+                        # Idle only when no job is left anywhere, a lost worker's jobs come back when their lease expires
+                        with active_changed:
+                            if self.exit_when_idle and not active[0] and not self.ledger.pending():
+                                break
+                        self.stop_event.wait(POLL_INTERVAL)
+                        continue
+
+                    with active_changed:
+                        active[0] += 1
+                    executor.submit(self.run_job, *claimed).add_done_callback(job_done)
+            finally:
+                # Running jobs finish before the heartbeats stop, so their leases hold
+                executor.shutdown(wait=True)
+                self.stop_event.set()
+                heartbeat.join()
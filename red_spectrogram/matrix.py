@@ -0,0 +1,83 @@
+"""Raw spectrogram matrices for analysis tools
+
+The levels behind the full spectrogram are exported in dB instead of
+colors, as a NumPy .npy file that can be opened with mmap_mode, next to a
+JSON sidecar that describes its axes:
+
+    {file_name}_full.npy     float32, one row per frequency bin (lowest
+                             first) and one column per pixel column, in
+                             dBFS clipped to -z_range..0
+    {file_name}_full.json    source file, sample rate, window and the
+                             time and frequency of every row and column
+
+Analysis jobs can then memory-map thousands of spectrograms without
+decoding the FLAC files or computing an STFT again. NumPy is imported
+when a matrix is written or read, the SoX backend does not need it.
+"""
+import os
+import json
+
+MATRIX_SUFFIX = "_full.npy"
+MATRIX_VERSION = 1
+
+
+def sidecar_path(matrix_path):
+    """Get the path of the JSON sidecar of a matrix"""
+    return os.path.splitext(matrix_path)[0] + ".json"
+
+
+def matrix_info(shape, sample_rate, duration, z_range, window_type, pooling):
+    """Describe a matrix of levels of the given shape (bins, columns) and its axes"""
+    height, width = shape
+    dft_size = 2 * (height - 1)
+    return {
+        "version": MATRIX_VERSION,
+        "shape": [height, width],
+        "dtype": "float32",
+        "unit": "dBFS",
+        "floor_db": -float(z_range),
+        "sample_rate": sample_rate,
+        "duration": duration,
+        "window_type": window_type,
+        "dft_size": dft_size,
+        "pooling": pooling,
+        # Column i covers start + i * step to start + (i + 1) * step
+        "time": {"start": 0.0, "step": duration / width, "unit": "s"},
+        # Row i is the DFT bin at i * step, from 0 to the Nyquist frequency
+        "frequency": {"start": 0.0, "step": sample_rate / dft_size, "unit": "Hz"}
+    }
+
+
+def save_matrix(levels, path, info):
+    """Save levels between 0 and 1 as a dB matrix and write its sidecar, return the matrix path
+
+    levels are converted in place. Both files are written atomically, the
+    sidecar last, so a matrix with a sidecar is always complete.
+    """
+    import numpy as np
+
+    levels *= -info["floor_db"]
+    levels += info["floor_db"]
+
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        np.save(f, np.ascontiguousarray(levels, dtype=np.float32))
+    os.replace(temp_path, path)
+
+    json_path = sidecar_path(path)
+    temp_path = json_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(info, f, indent=1)
+    os.replace(temp_path, json_path)
+    return path
+
+
+def load_matrix(path, mmap_mode="r"):
+    """Open an exported matrix, memory-mapped by default, return (matrix, sidecar dict)"""
+    import numpy as np
+
+    with open(sidecar_path(path), "r", encoding="utf-8") as f:
+        info = json.load(f)
+    if info.get("version") != MATRIX_VERSION:
+        raise ValueError(f"Unsupported matrix version: {info.get('version')}")
+    return np.load(path, mmap_mode=mmap_mode), info
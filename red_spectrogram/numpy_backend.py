@@ -0,0 +1,548 @@
+"""In-process spectrogram backend
+
+Decodes FLAC with soundfile, computes a batched STFT with NumPy and renders
+the image with Pillow. It follows the SoX spectrogram semantics: -y sets
+the number of frequency bins (DFT size = 2 * (height - 1)), -x the number
+of columns over the analysed time span and -z the dynamic range in dB.
+
+Files whose decoded audio does not fit in the memory limit are rendered
+block by block with StreamingSpectrogram, so multi-hour recordings use the
+same memory as a single track.
+"""
+import math
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+from .backends import SpectrogramBackend, BackendUnavailable
+from .archives import open_soundfile
+from .zoom import format_time, nice_step
+from .pyramid import TILE_WIDTH
+from .matrix import matrix_info, save_matrix
+
+# Upper bound for the number of samples gathered into one STFT batch
+BATCH_SAMPLES = 4 * 1024 * 1024
+
+# Memory for decoded audio shared by the parallel jobs, in MB, when the settings do not give one
+DEFAULT_MEMORY_LIMIT = 1024
+
+# Bytes per DFT frame of a batch: frame samples, windowed copy, spectrum and power
+FRAME_BYTES_PER_SAMPLE = 12
+FRAME_BYTES_PER_BIN = 24
+
+# Margins around the spectrogram, in pixels (left, top, right, bottom)
+MARGINS = (58, 30, 20, 40)
+
+
+def make_palette():
+    """Build the SoX default colour palette as a 256 x 3 lookup table"""
+    x = np.linspace(0.0, 1.0, 256)
+    red = np.where(x < .13, 0, np.where(x < .73, np.sin((x - .13) / .60 * np.pi / 2), 1))
+    green = np.where(x < .60, 0, np.where(x < .91, np.sin((x - .60) / .31 * np.pi / 2), 1))
+    blue = np.where(x < .60, .5 * np.sin(x / .60 * np.pi), np.where(x < .78, 0, (x - .78) / .22))
+    return (np.stack([red, green, blue], axis=1) * 255 + .5).astype(np.uint8)
+
+
+PALETTE = make_palette()
+
+
+def kaiser_beta(attenuation):
+    """Get the Kaiser window beta for a stop-band attenuation in dB"""
+    if attenuation > 50:
+        return .1102 * (attenuation - 8.7)
+    if attenuation > 21:
+        return .5842 * (attenuation - 21) ** .4 + .07886 * (attenuation - 21)
+    return 0.0
+
+
+def make_window(window_type, size, z_range):
+    """Build the analysis window for one of the window types offered in the settings"""
+    window_type = window_type.lower()
+
+    if window_type == "kaiser":
+        # Like SoX, make the side lobes fall below the displayed dynamic range
+        return np.kaiser(size, kaiser_beta(float(z_range) + 20))
+    if window_type == "hamming":
+        return np.hamming(size)
+    if window_type == "hann":
+        return np.hanning(size)
+    if window_type == "bartlett":
+        return np.bartlett(size)
+    if window_type == "rectangular":
+        return np.ones(size)
+
+    raise ValueError(f"Unknown window type: {window_type}")
+
+
+def read_audio(file_path, start=0.0, duration=None):
+    """Decode the first channel of an audio file
+
+    Returns (samples, sample_rate, total_duration) where samples is a
+    float32 array covering start to start + duration (or the end of the file).
+    Archive members are decoded as they are read from the archive.
+    """
+    if soundfile is None:
+        raise BackendUnavailable("The numpy backend needs the soundfile package to decode FLAC files")
+
+    with open_soundfile(file_path) as f:
+        sample_rate = f.samplerate
+        total_frames = f.frames
+        first = min(int(round(start * sample_rate)), total_frames)
+        frames = -1 if duration is None else int(round(duration * sample_rate))
+
+        if first:
+            f.seek(first)
+        data = f.read(frames, dtype="float32", always_2d=True)
+    return np.ascontiguousarray(data[:, 0]), sample_rate, total_frames / sample_rate
+
+
+def spectrogram_levels(samples, sample_rate, width, height, z_range, window_type, duration=None, pooling="mean"):
+    """Compute the spectrogram as levels between 0 (-z_range dB or less) and 1 (0 dBFS)
+
+    The result has one row per frequency bin (lowest first) and one column
+    per output pixel. When a column covers more audio than one DFT, the
+    power of several evenly spaced DFTs is averaged, as SoX does, or the
+    loudest one is kept with max pooling.
+    """
+    width = int(width)
+    height = int(height)
+    z_range = float(z_range)
+    dft_size = 2 * (height - 1)
+    if dft_size < 2:
+        raise ValueError("Height must be at least 2 bins")
+
+    span = len(samples) if duration is None else duration * sample_rate
+    step = max(span, 1) / width
+    sub_frames = max(1, int(math.ceil(step / dft_size)))
+
+    window = make_window(window_type, dft_size, z_range).astype(np.float32)
+    # Scale so that a full-scale sine wave reaches 0 dB
+    scale = (2.0 / window.sum()) ** 2
+
+    # Pad so every frame (centred on its position) stays inside the buffer
+    half = dft_size // 2
+    pad_end = max(0, int(math.ceil(span)) - len(samples)) + dft_size
+    padded = np.pad(samples.astype(np.float32, copy=False), (half, pad_end))
+    offsets = np.arange(dft_size)
+
+    # Frame centres for every (column, sub-frame) pair
+    positions = (np.arange(width)[:, None] + (np.arange(sub_frames)[None, :] + .5) / sub_frames) * step
+    starts = np.clip(np.round(positions).astype(np.int64), 0, len(padded) - dft_size)
+
+    levels = np.empty((height, width), dtype=np.float32)
+    batch_columns = max(1, BATCH_SAMPLES // (sub_frames * dft_size))
+
+    for first in range(0, width, batch_columns):
+        last = min(width, first + batch_columns)
+        frames = padded[starts[first:last].reshape(-1)[:, None] + offsets] * window
+        power = np.abs(np.fft.rfft(frames, axis=1)) ** 2
+        power = power.reshape(last - first, sub_frames, height)
+        power = power.max(axis=1) if pooling == "max" else power.mean(axis=1)
+
+        db = 10 * np.log10(power * scale + 1e-30)
+        levels[:, first:last] = np.clip((db + z_range) / z_range, 0, 1).T
+
+    return levels
+
+
+class StreamingSpectrogram:
+    """Spectrogram levels computed block by block while the audio is decoded
+
+    Gives the columns of spectrogram_levels over the whole signal, but only
+    keeps the samples of the DFT frames not computed yet and one pooled
+    power row per column, so memory does not grow with the recording length.
+    """
+
+    def __init__(self, total_samples, width, height, z_range, window_type, pooling="mean", memory_limit=None):
+        self.width = int(width)
+        self.height = int(height)
+        self.z_range = float(z_range)
+        self.pooling = pooling
+        self.dft_size = 2 * (self.height - 1)
+        if self.dft_size < 2:
+            raise ValueError("Height must be at least 2 bins")
+
+        self.step = max(total_samples, 1) / self.width
+        self.sub_frames = max(1, int(math.ceil(self.step / self.dft_size)))
+        self.total_frames = self.width * self.sub_frames
+
+        self.window = make_window(window_type, self.dft_size, self.z_range).astype(np.float32)
+        self.scale = (2.0 / self.window.sum()) ** 2
+        self.offsets = np.arange(self.dft_size)
+
+        # The signal is padded like in spectrogram_levels, half a frame of
+        # silence before it and a frame after it
+        half = self.dft_size // 2
+        self.padded_length = half + total_samples + self.dft_size
+        self.buffer = np.zeros(half, dtype=np.float32)
+        # Position of the first buffered sample in the padded signal
+        self.buffer_start = 0
+        self.next_frame = 0
+        self.pooled = np.zeros((self.width, self.height), dtype=np.float32)
+
+        self.batch_frames = max(1, BATCH_SAMPLES // self.dft_size)
+        if memory_limit:
+            frame_bytes = FRAME_BYTES_PER_SAMPLE * self.dft_size + FRAME_BYTES_PER_BIN * self.height
+            self.batch_frames = max(1, min(self.batch_frames, int(memory_limit // frame_bytes)))
+
+    def frame_starts(self, first, last):
+        """Get the start positions in the padded signal and the columns of frames first to last"""
+        frames = np.arange(first, last)
+        columns, sub_frame = np.divmod(frames, self.sub_frames)
+        positions = (columns + (sub_frame + .5) / self.sub_frames) * self.step
+        starts = np.clip(np.round(positions).astype(np.int64), 0, self.padded_length - self.dft_size)
+        return starts, columns
+
+    def feed(self, samples):
+        """Add the next decoded mono samples and transform the frames they complete"""
+        self.buffer = np.concatenate((self.buffer, samples.astype(np.float32, copy=False)))
+        self.transform(final=False)
+
+    def transform(self, final):
+        """Transform the buffered frames in batches, all remaining frames when final"""
+        buffer_end = self.buffer_start + len(self.buffer)
+
+        while self.next_frame < self.total_frames:
+            last = min(self.total_frames, self.next_frame + self.batch_frames)
+            starts, columns = self.frame_starts(self.next_frame, last)
+            if not final:
+                # Only the frames whose samples were all decoded
+                count = int(np.searchsorted(starts + self.dft_size, buffer_end, side="right"))
+                if count == 0:
+                    break
+                starts, columns = starts[:count], columns[:count]
+
+            frames = self.buffer[(starts - self.buffer_start)[:, None] + self.offsets] * self.window
+            self.pool(columns, np.abs(np.fft.rfft(frames, axis=1)) ** 2)
+            self.next_frame += len(starts)
+
+            # Forget the samples before the next frame
+            if self.next_frame < self.total_frames:
+                next_start = int(self.frame_starts(self.next_frame, self.next_frame + 1)[0][0])
+                if next_start > self.buffer_start:
+                    self.buffer = self.buffer[next_start - self.buffer_start:]
+                    self.buffer_start = next_start
+
+    def pool(self, columns, power):
+        """Merge the power of frames, in column order, into their columns"""
+        # Index of the first frame of every column in the batch
+        first = np.concatenate(([0], np.flatnonzero(np.diff(columns)) + 1))
+        targets = columns[first]
+        if self.pooling == "max":
+            self.pooled[targets] = np.maximum(self.pooled[targets], np.maximum.reduceat(power, first, axis=0))
+        else:
+            self.pooled[targets] += np.add.reduceat(power, first, axis=0)
+
+    def finish(self):
+        """Transform the last frames and get the levels, shaped like spectrogram_levels"""
+        # Silence after the end, also when the file was shorter than its header said
+        missing = self.padded_length - (self.buffer_start + len(self.buffer))
+        if missing > 0:
+            self.buffer = np.concatenate((self.buffer, np.zeros(missing, dtype=np.float32)))
+        self.transform(final=True)
+
+        # In place, the pooled rows of a long recording or a pyramid are the largest array of the job
+        power, self.pooled = self.pooled, None
+        if self.pooling != "max":
+            power /= self.sub_frames
+        power *= self.scale
+        power += 1e-30
+        np.log10(power, out=power)
+        power *= 10
+        power += self.z_range
+        power /= self.z_range
+        np.clip(power, 0, 1, out=power)
+        return power.T.astype(np.float32)
+
+
+def render_image(levels, title, sample_rate, start, duration):
+    """Render spectrogram levels with a title and time/frequency axes"""
+    height, width = levels.shape
+    left, top, right, bottom = MARGINS
+
+    # Lowest frequency at the bottom
+    pixels = PALETTE[(levels[::-1] * 255).astype(np.uint8)]
+    spectrogram = Image.fromarray(pixels, "RGB")
+
+    image = Image.new("RGB", (left + width + right, top + height + bottom), "black")
+    image.paste(spectrogram, (left, top))
+
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default()
+    draw.text((left, 8), title, fill="white", font=font)
+    draw.rectangle((left - 1, top - 1, left + width, top + height), outline="gray")
+
+    # Frequency axis in kHz
+    nyquist = sample_rate / 2000.0
+    khz_step = nice_step(nyquist, max(2, height // 40))
+    khz = 0.0
+    while khz <= nyquist + 1e-9:
+        y = top + height - 1 - int(round(khz / nyquist * (height - 1)))
+        draw.line((left - 5, y, left - 1, y), fill="white")
+        draw.text((4, y - 6), f"{khz:g}k", fill="white", font=font)
+        khz += khz_step
+
+    # Time axis
+    time_step = nice_step(duration, max(2, width // 80)) if duration > 0 else 1
+    seconds = 0.0
+    while seconds <= duration + 1e-9:
+        x = left + int(round(seconds / duration * (width - 1))) if duration > 0 else left
+        draw.line((x, top + height, x, top + height + 4), fill="white")
+        draw.text((x - 12, top + height + 8), format_time(start + seconds), fill="white", font=font)
+        seconds += time_step
+
+    return image
+
+
+class NumpyBackend(SpectrogramBackend):
+    """Render spectrograms in-process with NumPy and Pillow"""
+
+    name = "numpy"
+
+    @classmethod
+    def missing_dependencies(cls, params):
+        """Get a description of what is missing to use this backend, or None"""
+        if soundfile is None:
+            return "The numpy backend needs the soundfile package to decode FLAC files"
+        return None
+
+    def memory_budget(self):
+        """Get the bytes of audio one job may hold, the memory limit is shared by the parallel jobs"""
+        try:
+            limit = float(self.params.get("memory_limit") or DEFAULT_MEMORY_LIMIT)
+        except ValueError:
+            limit = DEFAULT_MEMORY_LIMIT
+        return limit * 1024 * 1024 / max(1, int(self.params.get("workers") or 1))
+
+    def pyramid_width(self, duration):
+        """Get the number of columns of the finest pyramid level, narrower when its levels do not fit in the memory budget"""
+        # The pooled rows and the levels computed from them, 4 bytes per bin each
+        limit = int(self.memory_budget() // (8 * int(self.params["height"])))
+        return max(TILE_WIDTH, min(super().pyramid_width(duration), limit))
+
+    def fits_in_memory(self, file_path, duration=None):
+        """Check if a whole file, or duration seconds of it, can be decoded within the memory budget"""
+        with open_soundfile(file_path) as f:
+            frames = f.frames if duration is None else min(f.frames, int(duration * f.samplerate))
+            # All decoded channels, the first channel and its padded copy
+            needed = frames * (f.channels * 4 + 8)
+        return needed <= self.memory_budget()
+
+    def render_full(self, samples, sample_rate, file_path, file_name, full=True, matrix=False):
+        """Render and save the full spectrogram and/or its dB matrix from decoded samples"""
+        params = self.params
+        with self.timer.measure("render"):
+            levels = spectrogram_levels(samples, sample_rate, params["width"], params["height"],
+                                        params["z_range"], params["window_type"], pooling=params.get("pooling", "mean"))
+        return self.save_levels(levels, sample_rate, len(samples) / sample_rate, file_path, file_name, full, matrix)
+
+    def save_levels(self, levels, sample_rate, duration, file_path, file_name, full=True, matrix=False):
+        """Save the full spectrogram and/or the dB matrix of the same levels, in that order"""
+        output_paths = self.save_full(levels, sample_rate, duration, file_name) if full else []
+        if matrix:
+            output_paths += self.save_matrix(levels, sample_rate, duration, file_path, file_name)
+        return output_paths
+
+    def save_full(self, levels, sample_rate, duration, file_name):
+        """Draw and save the full spectrogram from its levels"""
+        with self.timer.measure("render"):
+            image = render_image(levels, self.full_title(file_name), sample_rate, 0.0, duration)
+
+        output_path = self.full_output_path(file_name)
+        with self.timer.measure("save"):
+            image.save(output_path)
+        return [output_path]
+
+    def save_matrix(self, levels, sample_rate, duration, file_path, file_name):
+        """Save the levels of the full spectrogram as a dB matrix with its JSON sidecar, levels are converted in place"""
+        params = self.params
+        info = matrix_info(levels.shape, sample_rate, duration, params["z_range"], params["window_type"],
+                           params.get("pooling", "mean"))
+        info["file"] = file_path
+        output_path = self.matrix_output_path(file_name)
+        with self.timer.measure("save"):
+            save_matrix(levels, output_path, info)
+        return [output_path]
+
+    def render_zoom(self, samples, sample_rate, window):
+        """Render and save a zoomed spectrogram from the samples of its window"""
+        params = self.params
+        with self.timer.measure("render"):
+            levels = spectrogram_levels(samples, sample_rate, params["zoom_width"], params["zoom_height"],
+                                        params["zoom_z_range"], params["zoom_window_type"], window["duration"],
+                                        params.get("pooling", "mean"))
+            image = render_image(levels, window["title"], sample_rate, window["start"], window["duration"])
+
+        with self.timer.measure("save"):
+            image.save(window["path"])
+        return [window["path"]]
+
+    def render_windows(self, samples, sample_rate, offset, windows):
+        """Render the zoom windows from decoded samples that start at offset seconds"""
+        output_paths = []
+        for window in windows:
+            first = int(round((window["start"] - offset) * sample_rate))
+            length = int(round(window["duration"] * sample_rate))
+            output_paths += self.render_zoom(samples[max(0, first):max(0, first + length)], sample_rate, window)
+        return output_paths
+
+    def generate_pyramid(self, file_path, file_name):
+        """Generate the tile pyramid, computing the finest level block by block like stream_full"""
+        params = self.params
+        budget = self.memory_budget()
+
+        with open_soundfile(file_path) as f:
+            sample_rate = f.samplerate
+            total = f.frames
+            spectrogram = StreamingSpectrogram(total, self.pyramid_width(total / sample_rate), params["height"],
+                                               params["z_range"], params["window_type"], params.get("pooling", "mean"), budget / 2)
+            block_frames = max(spectrogram.dft_size, int(budget / 4 / (f.channels * 4 + 4)))
+
+            while True:
+                self.check_cancelled()
+                with self.timer.measure("decode"):
+                    block = f.read(block_frames, dtype="float32", always_2d=True)
+                if not len(block):
+                    break
+                with self.timer.measure("render"):
+                    spectrogram.feed(np.ascontiguousarray(block[:, 0]))
+
+        with self.timer.measure("render"):
+            levels = spectrogram.finish()
+            # Lowest frequency at the bottom, like render_image, a few tiles at a time
+            pixels = np.empty(levels.shape + (3,), dtype=np.uint8)
+            for first in range(0, levels.shape[1], TILE_WIDTH * 8):
+                columns = slice(first, first + TILE_WIDTH * 8)
+                pixels[:, columns] = PALETTE[(levels[::-1, columns] * 255).astype(np.uint8)]
+            del levels
+            image = Image.fromarray(pixels, "RGB")
+        return self.write_pyramid(image, file_path, file_name, sample_rate, total / sample_rate)
+
+    def stream_full(self, file_path, file_name, windows, full=True, matrix=False):
+        """Render the full spectrogram and/or its dB matrix block by block, and the zoom windows from the same decode
+
+        Only the samples of the zoom windows are kept, so memory stays
+        within the budget whatever the length of the file.
+        """
+        params = self.params
+        budget = self.memory_budget()
+
+        with open_soundfile(file_path) as f:
+            sample_rate = f.samplerate
+            total = f.frames
+            # Half of the budget for the DFT batches, a quarter for the decoded blocks
+            spectrogram = StreamingSpectrogram(total, params["width"], params["height"], params["z_range"],
+                                               params["window_type"], params.get("pooling", "mean"), budget / 2)
+            block_frames = max(spectrogram.dft_size, int(budget / 4 / (f.channels * 4 + 4)))
+
+            # First sample and samples of every zoom window, cut like in render_windows
+            spans = []
+            for window in windows:
+                first = int(round(window["start"] * sample_rate))
+                last = min(total, max(0, first + int(round(window["duration"] * sample_rate))))
+                first = max(0, first)
+                spans.append((first, np.zeros(max(0, last - first), dtype=np.float32)))
+
+            position = 0
+            while True:
+                self.check_cancelled()
+                with self.timer.measure("decode"):
+                    block = f.read(block_frames, dtype="float32", always_2d=True)
+                if not len(block):
+                    break
+                samples = np.ascontiguousarray(block[:, 0])
+
+                for first, window_samples in spans:
+                    low = max(first, position)
+                    high = min(first + len(window_samples), position + len(samples))
+                    if low < high:
+                        window_samples[low - first:high - first] = samples[low - position:high - position]
+
+                with self.timer.measure("render"):
+                    spectrogram.feed(samples)
+                position += len(samples)
+
+        with self.timer.measure("render"):
+            levels = spectrogram.finish()
+
+        output_paths = self.save_levels(levels, sample_rate, total / sample_rate, file_path, file_name, full, matrix)
+        for (_, window_samples), window in zip(spans, windows):
+            output_paths += self.render_zoom(window_samples, sample_rate, window)
+        return output_paths
+
+    def track_duration(self, file_path):
+        """Get the duration of a track in seconds, also for formats other than FLAC"""
+        duration = super().track_duration(file_path)
+        if duration is None and soundfile is not None:
+            try:
+                with open_soundfile(file_path) as f:
+                    duration = f.frames / f.samplerate
+            except (RuntimeError, OSError, KeyError):
+                duration = None
+        return duration
+
+    def generate_normal_spectrogram(self, file_path, file_name):
+        """Generate a normal spectrogram"""
+        if not self.fits_in_memory(file_path):
+            return self.stream_full(file_path, file_name, [])
+
+        with self.timer.measure("decode"):
+            samples, sample_rate, _ = read_audio(file_path)
+        self.check_cancelled()
+        return self.render_full(samples, sample_rate, file_path, file_name)
+
+    def generate_zoomed_spectrogram(self, file_path, file_name, specs=None):
+        """Generate the zoomed spectrograms, decoding the span that covers all windows when it fits in memory"""
+        windows = self.zoom_windows(file_path, file_name, specs)
+        start = min(window["start"] for window in windows)
+        end = max(window["start"] + window["duration"] for window in windows)
+
+        if self.fits_in_memory(file_path, end - start):
+            with self.timer.measure("decode"):
+                samples, sample_rate, _ = read_audio(file_path, start, end - start)
+            self.check_cancelled()
+            return self.render_windows(samples, sample_rate, start, windows)
+
+        # Windows far apart in a long file, decode each one instead of everything between them
+        output_paths = []
+        for window in windows:
+            self.check_cancelled()
+            with self.timer.measure("decode"):
+                samples, sample_rate, _ = read_audio(file_path, window["start"], window["duration"])
+            output_paths += self.render_zoom(samples, sample_rate, window)
+        return output_paths
+
+    def generate_combined_spectrograms(self, file_path, file_name, specs=None):
+        """Generate the full and zoomed spectrograms from a single decode of the file"""
+        windows = self.zoom_windows(file_path, file_name, specs)
+        if not self.fits_in_memory(file_path):
+            return self.stream_full(file_path, file_name, windows)
+
+        with self.timer.measure("decode"):
+            samples, sample_rate, _ = read_audio(file_path)
+        self.check_cancelled()
+
+        return (self.render_full(samples, sample_rate, file_path, file_name)
+                + self.render_windows(samples, sample_rate, 0.0, windows))
+
+    def generate_matrix(self, file_path, file_name, full=False, specs=None):
+        """Export the dB matrix of the full spectrogram, from the same decode as the full and zoomed spectrograms
+
+        Returns the full spectrogram when full, then the matrix, then the
+        zoom windows of specs.
+        """
+        windows = self.zoom_windows(file_path, file_name, specs) if specs else []
+        if not self.fits_in_memory(file_path):
+            return self.stream_full(file_path, file_name, windows, full, matrix=True)
+
+        with self.timer.measure("decode"):
+            samples, sample_rate, _ = read_audio(file_path)
+        self.check_cancelled()
+
+        return (self.render_full(samples, sample_rate, file_path, file_name, full, matrix=True)
+                + self.render_windows(samples, sample_rate, 0.0, windows))
@@ -0,0 +1,103 @@
+"""Incremental index of the spectrograms in the output folder
+
+Listing an output folder with hundreds of thousands of spectrograms is
+slow, so the index only rescans when the folder modification time changed
+and returns what was added and removed since the last refresh. Tile
+pyramids are listed by the index file in their folder.
+"""
+import os
+import time
+import bisect
+import threading
+
+from .pyramid import PYRAMID_SUFFIX, INDEX_NAME
+
+# Folder mtimes closer than this to the scan may hide a later change on
+# filesystems with a coarse timestamp resolution (FAT has 2 seconds)
+MTIME_RESOLUTION = 2.0
+
+
+class OutputIndex:
+    """Sorted names of the images in one folder, refreshed incrementally"""
+
+    def __init__(self, folder, extensions=(".png", ".webp")):
+        self.folder = folder
+        self.extensions = extensions
+        self.names = []
+        self.name_set = set()
+        self.folder_mtime = None
+        self.lock = threading.Lock()
+
+    def folder_changed(self):
+        """Check if files may have been added or removed since the last scan"""
+        try:
+            stat = os.stat(self.folder)
+        except OSError:
+            return bool(self.names)
+
+        return self.folder_mtime is None or stat.st_mtime_ns != self.folder_mtime
+
+    def scan(self):
+        """List the image names in the folder"""
+        names = set()
+        try:
+            with os.scandir(self.folder) as entries:
+                for entry in entries:
+                    if entry.name.lower().endswith(self.extensions):
+                        names.add(entry.name)
+                    elif entry.name.endswith(PYRAMID_SUFFIX) and entry.is_dir():
+                        names.add(f"{entry.name}/{INDEX_NAME}")
+        except OSError:
+            pass
+        return names
+
+    def refresh(self):
+        """Rescan the folder if it changed and return the (added, removed) names
+
+        Safe to call from a background thread: the names list is replaced,
+        never modified, so readers always see a consistent list.
+        """
+        if not self.folder_changed():
+            return [], []
+
+        try:
+            stat = os.stat(self.folder)
+        except OSError:
+            stat = None
+
+        names = self.scan()
+
+        with self.lock:
+            added = sorted(names - self.name_set)
+            removed = sorted(self.name_set - names)
+
+            if len(added) + len(removed) > len(self.names) // 4:
+                # Many changes, sorting once is cheaper than inserting one by one
+                sorted_names = sorted(names)
+            else:
+                sorted_names = list(self.names)
+                for name in removed:
+                    del sorted_names[bisect.bisect_left(sorted_names, name)]
+                for name in added:
+                    bisect.insort(sorted_names, name)
+
+            self.names = sorted_names
+            self.name_set = names
+            # Rescan next time when the folder changed too recently to rely on its mtime
+            if stat and time.time() - stat.st_mtime > MTIME_RESOLUTION:
+                self.folder_mtime = stat.st_mtime_ns
+            else:
+                self.folder_mtime = None
+
+        return added, removed
+
+    def filter(self, text):
+        """Get the names containing every word of text, case-insensitive"""
+        words = text.lower().split()
+        names = self.names
+        if not words:
+            return names
+        return [name for name in names if all(word in name.lower() for word in words)]
+
+    def __len__(self):
+        return len(self.names)
@@ -0,0 +1,98 @@
+"""Re-encode generated spectrograms into a more compact format
+
+SoX and the numpy backend write plain PNG files. After a file is rendered,
+its images can be re-encoded to:
+
+- "png-optimized": the same pixels with the strongest PNG compression,
+- "png-palette": quantized to a 256-color palette, spectrograms use far
+  fewer colors than that so the loss is hard to see,
+- "webp": lossless WebP, usually the smallest, with a .webp extension.
+
+Pillow encodes without holding the GIL, so the engine runs this stage on
+its own thread pool next to the generation jobs.
+"""
+import os
+import time
+
+OUTPUT_FORMATS = ["png", "png-optimized", "png-palette", "webp"]
+
+# zlib level of the optimized and palette PNG files (0-9)
+DEFAULT_COMPRESS_LEVEL = 9
+
+
+def encoded_path(path, output_format):
+    """Get the path of an image once it is re-encoded"""
+    if output_format == "webp":
+        return os.path.splitext(path)[0] + ".webp"
+    return path
+
+
+def save_image(image, path, output_format, compress_level=DEFAULT_COMPRESS_LEVEL):
+    """Save an image in one of the output formats"""
+    from PIL import Image
+
+    if output_format == "webp":
+        image.save(path, "WEBP", lossless=True, quality=100, method=4)
+    elif output_format == "png-palette":
+        if image.mode != "P":
+            # Pillow before 9.1 has the method constants on Image
+            image = image.convert("RGB").quantize(colors=256, method=getattr(Image, "Quantize", Image).FASTOCTREE)
+        image.save(path, "PNG", optimize=True, compress_level=compress_level)
+    elif output_format == "png-optimized":
+        image.save(path, "PNG", optimize=True, compress_level=compress_level)
+    elif output_format == "png":
+        image.save(path, "PNG")
+    else:
+        raise ValueError(f"Unknown output format: {output_format}")
+
+
+def reencode(path, output_format, compress_level=DEFAULT_COMPRESS_LEVEL):
+    """Re-encode one image in place, return (new path, bytes before, bytes after)
+
+    PNG files are only replaced when the new encoding is smaller. WebP files
+    always replace the PNG, so the output names stay predictable.
+    """
+    from PIL import Image
+
+    before = os.path.getsize(path)
+    target = encoded_path(path, output_format)
+    temp_path = target + ".tmp"
+
+    if output_format not in OUTPUT_FORMATS[1:]:
+        raise ValueError(f"Unknown output format: {output_format}")
+
+    with Image.open(path) as image:
+        image.load()
+        save_image(image, temp_path, output_format, compress_level)
+
+    after = os.path.getsize(temp_path)
+    if target == path and after >= before:
+        os.remove(temp_path)
+        return path, before, before
+
+    os.replace(temp_path, target)
+    if target != path:
+        os.remove(path)
+    return target, before, after
+
+
+def reencode_outputs(paths, output_format, compress_level=DEFAULT_COMPRESS_LEVEL):
+    """Re-encode the images of one file, return (new paths, stats dict)"""
+    start = time.monotonic()
+    new_paths = []
+    total_before = 0
+    total_after = 0
+
+    for path in paths:
+        new_path, before, after = reencode(path, output_format, compress_level)
+        new_paths.append(new_path)
+        total_before += before
+        total_after += after
+
+    return new_paths, {
+        "format": output_format,
+        "bytes_before": total_before,
+        "bytes_after": total_after,
+        "bytes_saved": total_before - total_after,
+        "seconds": round(time.monotonic() - start, 3)
+    }
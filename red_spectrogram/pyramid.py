@@ -0,0 +1,150 @@
+"""Deep-zoom tile pyramid of a spectrogram
+
+The spectrogram of a whole track is rendered once at the finest time
+resolution, without axes, then halved in width level after level. Every
+level is cut into tiles of TILE_WIDTH columns, so a viewer can show any
+part of the timeline at any zoom by loading only the visible tiles:
+
+    {file_name}_pyramid/index.json
+    {file_name}_pyramid/{level}/{tile}.png
+
+Level 0 shows the whole track in a single tile and every next level has
+twice as many columns. index.json describes the track and the levels.
+"""
+import os
+import json
+import math
+import shutil
+import bisect
+
+from .postencode import encoded_path, save_image
+
+PYRAMID_SUFFIX = "_pyramid"
+INDEX_NAME = "index.json"
+PYRAMID_VERSION = 1
+
+# Columns of one tile
+TILE_WIDTH = 512
+
+# Time resolution of the finest level, 10 ms per column
+MAX_COLUMNS_PER_SECOND = 100
+
+# Columns of the finest level of long tracks, when the settings do not give a limit
+DEFAULT_MAX_WIDTH = 32768
+
+# Pixels of the finest level, below the decompression bomb limit of Pillow
+MAX_PIXELS = 64 * 1024 * 1024
+
+
+def is_pyramid_index(path):
+    """Check if a path names the index of a tile pyramid"""
+    return os.path.basename(path) == INDEX_NAME and os.path.dirname(path).endswith(PYRAMID_SUFFIX)
+
+
+def pyramid_width(duration, height, max_width=None):
+    """Get the number of columns of the finest level of a track"""
+    columns = int(math.ceil((duration or 0) * MAX_COLUMNS_PER_SECOND))
+    limit = min(int(max_width or DEFAULT_MAX_WIDTH), MAX_PIXELS // max(1, int(height)))
+    return max(TILE_WIDTH, min(columns, limit))
+
+
+def level_widths(width):
+    """Get the width of every level, from a single tile to the finest level"""
+    widths = [width]
+    while widths[-1] > TILE_WIDTH:
+        widths.append((widths[-1] + 1) // 2)
+    return widths[::-1]
+
+
+def build_pyramid(image, folder, info, output_format="png", compress_level=9, check=None):
+    """Cut an image of the finest level into the tiles of every level and write the index
+
+    image is the spectrogram without axes, one column per time step and the
+    lowest frequency at the bottom. info is stored in the index (file,
+    duration, sample rate...). check() is called between tiles, so a
+    cancelled job stops early. Returns the path of the index.
+    """
+    from PIL import Image
+
+    # Tiles of an earlier render may belong to levels that no longer exist
+    if os.path.exists(os.path.join(folder, INDEX_NAME)):
+        shutil.rmtree(folder)
+    os.makedirs(folder, exist_ok=True)
+
+    widths = level_widths(image.width)
+    extension = os.path.splitext(encoded_path("tile.png", output_format))[1]
+    levels = [None] * len(widths)
+
+    # Finest level first, every coarser level is the previous one halved
+    for level in reversed(range(len(widths))):
+        if image.width != widths[level]:
+            image = image.resize((widths[level], image.height), Image.BOX)
+
+        level_folder = os.path.join(folder, str(level))
+        os.makedirs(level_folder, exist_ok=True)
+        tiles = int(math.ceil(image.width / TILE_WIDTH))
+        for tile in range(tiles):
+            if check:
+                check()
+            left = tile * TILE_WIDTH
+            tile_image = image.crop((left, 0, min(image.width, left + TILE_WIDTH), image.height))
+            save_image(tile_image, os.path.join(level_folder, f"{tile}{extension}"), output_format, compress_level)
+
+        levels[level] = {"width": image.width, "tiles": tiles}
+
+    index = dict(info, version=PYRAMID_VERSION, tile_width=TILE_WIDTH, height=image.height,
+                 extension=extension, levels=levels)
+    index_path = os.path.join(folder, INDEX_NAME)
+    temp_path = index_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=1)
+    os.replace(temp_path, index_path)
+    return index_path
+
+
+class TilePyramid:
+    """Tile pyramid written by build_pyramid, read from its index"""
+
+    def __init__(self, index_path):
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("version") != PYRAMID_VERSION:
+            raise ValueError(f"Unsupported tile pyramid version: {index.get('version')}")
+
+        self.folder = os.path.dirname(index_path)
+        self.index = index
+        self.duration = float(index["duration"]) or 1.0
+        self.height = index["height"]
+        self.tile_width = index["tile_width"]
+        self.levels = index["levels"]
+        self.widths = [level["width"] for level in self.levels]
+
+    def tile_path(self, level, tile):
+        """Get the path of a tile"""
+        return os.path.join(self.folder, str(level), f"{tile}{self.index['extension']}")
+
+    def overview_path(self):
+        """Get the path of the single tile of the coarsest level"""
+        return self.tile_path(0, 0)
+
+    def columns_per_second(self, level):
+        """Get the time resolution of a level"""
+        return self.widths[level] / self.duration
+
+    def level_for(self, pixels_per_second):
+        """Get the coarsest level with at least one column per screen pixel, or the finest level"""
+        needed = pixels_per_second * self.duration
+        return min(bisect.bisect_left(self.widths, needed), len(self.widths) - 1)
+
+    def visible_tiles(self, level, start, end):
+        """Get (tile, first second, last second) of the tiles of a level that cover start to end seconds"""
+        seconds_per_column = self.duration / self.widths[level]
+        first = max(0, int(start / seconds_per_column) // self.tile_width)
+        last = min(self.levels[level]["tiles"] - 1, int(end / seconds_per_column) // self.tile_width)
+
+        tiles = []
+        for tile in range(first, last + 1):
+            left = tile * self.tile_width
+            right = min(self.widths[level], left + self.tile_width)
+            tiles.append((tile, left * seconds_per_column, right * seconds_per_column))
+        return tiles
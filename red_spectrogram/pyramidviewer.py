@@ -0,0 +1,194 @@
+"""Deep-zoom viewer of tile pyramids
+
+Imported by red-spectrogram.py when a tile pyramid is opened, so Pillow
+is not loaded at startup.
+"""
+import os
+import math
+import tkinter as tk
+from tkinter import ttk
+from collections import OrderedDict
+
+from PIL import Image, ImageTk
+
+from .pyramid import TilePyramid
+from .zoom import format_time, nice_step
+
+# Decoded tiles kept in memory, a few screens at the levels around the current zoom
+TILE_CACHE_SIZE = 96
+
+# Height of the time axis under the spectrogram
+AXIS_HEIGHT = 24
+
+# Zoom factor of one mouse wheel step or key press
+ZOOM_STEP = 1.25
+
+# Screen pixels per column of the finest level at the deepest zoom
+MAX_PIXELS_PER_COLUMN = 8
+
+
+class PyramidViewer(tk.Toplevel):
+    """Pan and zoom across the timeline of a track, loading only the visible tiles
+
+    The mouse wheel (or + and -) zooms around the pointer, dragging or the
+    arrow keys pan and Home shows the whole track again. Every redraw uses
+    the coarsest level with at least one column per screen pixel, so any
+    zoom shows at once from the tiles already written.
+    """
+
+    def __init__(self, parent, index_path):
+        super().__init__(parent)
+        self.pyramid = TilePyramid(index_path)
+        self.title(self.pyramid.index.get("title") or os.path.basename(os.path.dirname(index_path)))
+        self.geometry("1000x600")
+
+        # (level, tile) -> decoded tile, least recently used first
+        self.tiles = OrderedDict()
+        # PhotoImages on the canvas, Tk drops images that are not referenced
+        self.photos = []
+        # Seconds at the left edge and zoom, fitted to the window on the first redraw
+        self.start = 0.0
+        self.pixels_per_second = None
+        self.drag_x = None
+        self.redraw_pending = False
+
+        self.canvas = tk.Canvas(self, background="black", highlightthickness=0)
+        self.canvas.pack(fill="both", expand=True)
+        self.scrollbar = ttk.Scrollbar(self, orient="horizontal", command=self.scroll)
+        self.scrollbar.pack(fill="x")
+        self.status_var = tk.StringVar(value="")
+        ttk.Label(self, textvariable=self.status_var, foreground="gray").pack(fill="x", padx=5)
+
+        self.canvas.bind("<Configure>", lambda event: self.set_view(self.start, self.pixels_per_second))
+        self.canvas.bind("<MouseWheel>", lambda event: self.zoom(ZOOM_STEP if event.delta > 0 else 1 / ZOOM_STEP, event.x))
+        self.canvas.bind("<Button-4>", lambda event: self.zoom(ZOOM_STEP, event.x))
+        self.canvas.bind("<Button-5>", lambda event: self.zoom(1 / ZOOM_STEP, event.x))
+        self.canvas.bind("<ButtonPress-1>", self.press)
+        self.canvas.bind("<B1-Motion>", self.drag)
+        self.bind("<plus>", lambda event: self.zoom(ZOOM_STEP, self.view_width() / 2))
+        self.bind("<KP_Add>", lambda event: self.zoom(ZOOM_STEP, self.view_width() / 2))
+        self.bind("<minus>", lambda event: self.zoom(1 / ZOOM_STEP, self.view_width() / 2))
+        self.bind("<KP_Subtract>", lambda event: self.zoom(1 / ZOOM_STEP, self.view_width() / 2))
+        self.bind("<Left>", lambda event: self.scroll("scroll", -1, "units"))
+        self.bind("<Right>", lambda event: self.scroll("scroll", 1, "units"))
+        self.bind("<Home>", lambda event: self.set_view(0.0, None))
+        self.focus_set()
+
+    def view_width(self):
+        """Get the width of the canvas in pixels"""
+        return max(1, self.canvas.winfo_width())
+
+    def visible_seconds(self):
+        """Get the length of the visible part of the track"""
+        return self.view_width() / self.pixels_per_second
+
+    def set_view(self, start, pixels_per_second):
+        """Show the track from start seconds at a zoom, None fits the whole track in the window"""
+        fit = self.view_width() / self.pyramid.duration
+        deepest = self.pyramid.columns_per_second(len(self.pyramid.widths) - 1) * MAX_PIXELS_PER_COLUMN
+        self.pixels_per_second = min(max(pixels_per_second or fit, fit), max(fit, deepest))
+        self.start = min(max(0.0, start), max(0.0, self.pyramid.duration - self.visible_seconds()))
+        self.schedule_redraw()
+
+    def zoom(self, factor, x):
+        """Zoom in (factor > 1) or out, keeping the time under x in place"""
+        if self.pixels_per_second is None:
+            return
+        anchor = self.start + x / self.pixels_per_second
+        pixels_per_second = self.pixels_per_second * factor
+        self.set_view(anchor - x / pixels_per_second, pixels_per_second)
+
+    def press(self, event):
+        """Start panning"""
+        self.drag_x = event.x
+
+    def drag(self, event):
+        """Pan with the mouse"""
+        if self.drag_x is None or self.pixels_per_second is None:
+            return
+        self.set_view(self.start - (event.x - self.drag_x) / self.pixels_per_second, self.pixels_per_second)
+        self.drag_x = event.x
+
+    def scroll(self, *args):
+        """Pan with the scrollbar, by a tenth of the view per unit and a view per page"""
+        if self.pixels_per_second is None:
+            return
+        if args[0] == "moveto":
+            start = float(args[1]) * self.pyramid.duration
+        else:
+            step = self.visible_seconds() * (1.0 if args[2] == "pages" else 0.1)
+            start = self.start + int(args[1]) * step
+        self.set_view(start, self.pixels_per_second)
+
+    def schedule_redraw(self):
+        """Redraw once after a burst of zoom, drag or resize events"""
+        if not self.redraw_pending:
+            self.redraw_pending = True
+            self.after_idle(self.redraw)
+
+    def tile(self, level, tile):
+        """Get a decoded tile, from the cache or from disk, None when it cannot be read"""
+        key = (level, tile)
+        image = self.tiles.get(key)
+        if image is not None:
+            self.tiles.move_to_end(key)
+            return image
+
+        try:
+            with Image.open(self.pyramid.tile_path(level, tile)) as f:
+                image = f.convert("RGB")
+        except OSError:
+            return None
+
+        self.tiles[key] = image
+        while len(self.tiles) > TILE_CACHE_SIZE:
+            self.tiles.popitem(last=False)
+        return image
+
+    def redraw(self):
+        """Draw the visible part of the visible tiles and the time axis"""
+        self.redraw_pending = False
+        self.canvas.delete("all")
+        if self.pixels_per_second is None:
+            return
+
+        width = self.view_width()
+        height = max(1, self.canvas.winfo_height() - AXIS_HEIGHT)
+        end = self.start + self.visible_seconds()
+        level = self.pyramid.level_for(self.pixels_per_second)
+        seconds_per_column = self.pyramid.duration / self.pyramid.widths[level]
+
+        photos = []
+        for tile, first, _ in self.pyramid.visible_tiles(level, self.start, end):
+            image = self.tile(level, tile)
+            if image is None:
+                continue
+
+            # Scale only the columns in view, a deep zoom shows a small part of a tile
+            left = max(0, int((self.start - first) / seconds_per_column))
+            right = min(image.width, int(math.ceil((end - first) / seconds_per_column)))
+            if right <= left:
+                continue
+            x0 = int(round((first + left * seconds_per_column - self.start) * self.pixels_per_second))
+            x1 = int(round((first + right * seconds_per_column - self.start) * self.pixels_per_second))
+            # Sharp columns when zoomed past the finest level
+            resample = Image.NEAREST if x1 - x0 > right - left else Image.BILINEAR
+            photo = ImageTk.PhotoImage(image.crop((left, 0, right, image.height)).resize((max(1, x1 - x0), height), resample))
+            photos.append(photo)
+            self.canvas.create_image(x0, 0, image=photo, anchor="nw")
+        self.photos = photos
+
+        # Time axis
+        step = nice_step(end - self.start, max(2, width // 100))
+        tick = math.ceil(self.start / step)
+        while tick * step <= end:
+            seconds = round(tick * step, 3)
+            x = int(round((seconds - self.start) * self.pixels_per_second))
+            self.canvas.create_line(x, height, x, height + 4, fill="white")
+            self.canvas.create_text(x + 2, height + 6, text=format_time(seconds), fill="white", anchor="nw")
+            tick += 1
+
+        self.scrollbar.set(self.start / self.pyramid.duration, end / self.pyramid.duration)
+        self.status_var.set(f"{format_time(round(self.start, 2))} to {format_time(round(end, 2))}, "
+                            f"level {level + 1} of {len(self.pyramid.widths)}, "
+                            f"{1000 * seconds_per_column:.1f} ms per column")
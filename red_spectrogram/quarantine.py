@@ -0,0 +1,93 @@
+"""Quarantine of files that keep failing
+
+A JSON file in the output folder counts the failed attempts of every
+source file. Once a file has failed too often it is skipped by the next
+batches instead of costing another round of timeouts and retries, until
+its size or mtime changes or it is generated with --force.
+"""
+import os
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+QUARANTINE_NAME = ".red-spectrogram-quarantine.json"
+QUARANTINE_VERSION = 1
+
+
+class Quarantine:
+    """Failed attempts per source file, keyed by source path"""
+
+    def __init__(self, output_folder, threshold):
+        self.path = os.path.join(output_folder, QUARANTINE_NAME)
+        # Failed attempts before a file is quarantined, 0 never quarantines
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.unsaved = False
+        self.load()
+
+    def load(self):
+        """Read the quarantine file, starting empty if it is missing or unreadable"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == QUARANTINE_VERSION:
+                self.entries = data.get("files", {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable quarantine file {self.path}: {e}")
+
+    def save(self):
+        """Write the quarantine file atomically"""
+        with self.lock:
+            if not self.unsaved:
+                return
+            data = {"version": QUARANTINE_VERSION, "files": self.entries}
+            temp_path = self.path + ".tmp"
+            try:
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f, indent=1)
+                os.replace(temp_path, self.path)
+                self.unsaved = False
+            except OSError as e:
+                logger.warning(f"Could not save quarantine file {self.path}: {e}")
+
+    def source_key(self, file_path):
+        """Get the key of a source file"""
+        return os.path.normcase(os.path.abspath(file_path))
+
+    def entry(self, file_path, stat):
+        """Get the entry of a file, or None when there is none for its current size and mtime"""
+        entry = self.entries.get(self.source_key(file_path))
+        if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns:
+            return entry
+        return None
+
+    def reason(self, file_path, stat):
+        """Describe why a file is quarantined, or None when it is not"""
+        with self.lock:
+            entry = self.entry(file_path, stat)
+            if not self.threshold or not entry or entry["failures"] < self.threshold:
+                return None
+            return f"Quarantined after {entry['failures']} failed attempts: {entry['error']}"
+
+    def failed(self, file_path, stat, attempts, error):
+        """Count failed attempts of a file, return True when it is quarantined now"""
+        with self.lock:
+            entry = self.entry(file_path, stat)
+            if entry is None:
+                entry = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "failures": 0}
+                self.entries[self.source_key(file_path)] = entry
+            entry["failures"] += attempts
+            entry["error"] = error
+            self.unsaved = True
+            return bool(self.threshold) and entry["failures"] >= self.threshold
+
+    def succeeded(self, file_path):
+        """Forget the failures of a file that was generated"""
+        with self.lock:
+            if self.entries.pop(self.source_key(file_path), None) is not None:
+                self.unsaved = True
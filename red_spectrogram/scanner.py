@@ -0,0 +1,130 @@
+"""Streaming folder scanner for large libraries
+
+Walks folder trees with os.scandir without building the full listing in
+memory, and deduplicates paths with a hashed index.
+"""
+import os
+import logging
+
+from .archives import is_archive, iter_archive_members
+
+logger = logging.getLogger(__name__)
+
+AUDIO_EXTENSIONS = (".flac",)
+
+
+def iter_audio_files(folder, recursive=True, cancel_event=None, stats=None, extensions=AUDIO_EXTENSIONS, archives=False):
+    """Yield the audio files below folder, in sorted order within each folder
+
+    Stops early when cancel_event is set. stats, if given, is a dict whose
+    "folders" and "files" counters are updated while scanning. With
+    archives, the audio files inside zip and tar archives are listed too.
+    """
+    pending = [folder]
+
+    while pending:
+        if cancel_event is not None and cancel_event.is_set():
+            return
+
+        current = pending.pop()
+        try:
+            with os.scandir(current) as entries:
+                files = []
+                subfolders = []
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subfolders.append(entry.path)
+                        elif entry.name.lower().endswith(extensions) and entry.is_file():
+                            files.append(entry.path)
+                        elif archives and is_archive(entry.name) and entry.is_file():
+                            files.extend(iter_archive_members(entry.path, extensions))
+                    except OSError:
+                        continue
+        except OSError as e:
+            logger.warning(f"Cannot read folder {current}: {e}")
+            continue
+
+        if stats is not None:
+            stats["folders"] = stats.get("folders", 0) + 1
+            stats["files"] = stats.get("files", 0) + len(files)
+
+        for path in sorted(files):
+            yield path
+
+        if recursive:
+            # Reversed so that the stack visits subfolders in sorted order
+            pending.extend(sorted(subfolders, reverse=True))
+
+
+def iter_batches(paths, batch_size):
+    """Group an iterable of paths into lists of at most batch_size items"""
+    batch = []
+    for path in paths:
+        batch.append(path)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class PathIndex:
+    """Ordered list of paths with O(1) membership checks"""
+
+    def __init__(self, paths=()):
+        self.paths = []
+        self.keys = set()
+        # Key -> position, built on the first lookup and dropped when paths are removed
+        self.positions = None
+        self.extend(paths)
+
+    def key(self, path):
+        """Get the dedupe key of a path"""
+        return os.path.normcase(os.path.abspath(path))
+
+    def add(self, path):
+        """Add a path, return False if it was already present"""
+        key = self.key(path)
+        if key in self.keys:
+            return False
+        self.keys.add(key)
+        if self.positions is not None:
+            self.positions[key] = len(self.paths)
+        self.paths.append(path)
+        return True
+
+    def extend(self, paths):
+        """Add several paths, return the ones that were new"""
+        return [path for path in paths if self.add(path)]
+
+    def remove_indices(self, indices):
+        """Remove the paths at the given positions"""
+        for i in sorted(indices, reverse=True):
+            self.keys.discard(self.key(self.paths[i]))
+            del self.paths[i]
+        self.positions = None
+
+    def clear(self):
+        """Remove all paths"""
+        self.paths = []
+        self.keys = set()
+        self.positions = None
+
+    def index(self, path):
+        """Get the position of a path, or None when it is not in the list"""
+        if self.positions is None:
+            self.positions = {self.key(p): i for i, p in enumerate(self.paths)}
+        return self.positions.get(self.key(path))
+
+    def __contains__(self, path):
+        return self.key(path) in self.keys
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, index):
+        return self.paths[index]
@@ -0,0 +1,180 @@
+"""Priority queue of the files of a running batch
+
+Files asked for while a batch runs (picked in the file dialog or
+double-clicked in the list) are interactive and start before the bulk of
+the batch. Queued files can be moved to the front or the end of the
+queue, held back and released, and the bulk can be paused while
+interactive files still start. The engine reserves one of its parallel
+jobs for interactive files, so they start at once even when every other
+job is busy with a long track.
+"""
+import time
+import threading
+from collections import deque
+
+# Job priorities, interactive files are always taken first
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+
+class QueuedJob:
+    """A file waiting in the scheduler"""
+
+    def __init__(self, file_path, priority):
+        self.file_path = file_path
+        self.priority = priority
+        self.held = False
+        # time.monotonic() when the file was queued, for the queue wait of its result
+        self.queued_at = time.monotonic()
+
+
+class JobScheduler:
+    """Queue of the files of one batch, by priority then in queue order
+
+    Worker threads call next_job() until it returns None and job_done()
+    after every job. The batch is finished once nothing is queued or
+    running, held files included, and a finished scheduler refuses new
+    files.
+    """
+
+    def __init__(self, files=()):
+        self.condition = threading.Condition()
+        self.queues = {INTERACTIVE: deque(), BULK: deque()}
+        # File path -> QueuedJob of the files not taken by a worker yet
+        self.jobs = {}
+        # Files taken by a worker, running or done
+        self.started = set()
+        self.running = 0
+        self.paused = False
+        self.finished = False
+        for file_path in files:
+            self.add(file_path)
+
+    def add(self, file_path, priority=BULK):
+        """Queue a file at the end of its priority, return False if it is already in the batch"""
+        with self.condition:
+            if self.finished or file_path in self.jobs or file_path in self.started:
+                return False
+            job = QueuedJob(file_path, priority)
+            self.jobs[file_path] = job
+            self.queues[priority].append(job)
+            self.condition.notify_all()
+            return True
+
+    def prioritize(self, file_path):
+        """Make a queued file interactive and release it, return False if it is not queued"""
+        with self.condition:
+            job = self.jobs.get(file_path)
+            if job is None:
+                return False
+            self.queues[job.priority].remove(job)
+            job.priority = INTERACTIVE
+            job.held = False
+            self.queues[INTERACTIVE].append(job)
+            self.condition.notify_all()
+            return True
+
+    def move(self, file_path, front=True):
+        """Move a queued file to the front or the end of its priority, return False if it is not queued"""
+        with self.condition:
+            job = self.jobs.get(file_path)
+            if job is None:
+                return False
+            queue = self.queues[job.priority]
+            queue.remove(job)
+            if front:
+                queue.appendleft(job)
+            else:
+                queue.append(job)
+            return True
+
+    def hold(self, file_path, held=True):
+        """Hold a queued file back or release it, return False if it is not queued"""
+        with self.condition:
+            job = self.jobs.get(file_path)
+            if job is None:
+                return False
+            job.held = held
+            self.condition.notify_all()
+            return True
+
+    def remove(self, file_path):
+        """Drop a queued file from the batch, return False if it is not queued"""
+        with self.condition:
+            job = self.jobs.pop(file_path, None)
+            if job is None:
+                return False
+            self.queues[job.priority].remove(job)
+            self.condition.notify_all()
+            return True
+
+    def pause(self):
+        """Stop handing out bulk files, interactive files still start"""
+        with self.condition:
+            self.paused = True
+
+    def resume(self):
+        """Hand out bulk files again"""
+        with self.condition:
+            self.paused = False
+            self.condition.notify_all()
+
+    def release_all(self):
+        """Resume and release every held file, so a cancelled batch can run out"""
+        with self.condition:
+            self.paused = False
+            for job in self.jobs.values():
+                job.held = False
+            self.condition.notify_all()
+
+    def stop(self):
+        """Drop every queued file, the running jobs finish the batch"""
+        with self.condition:
+            self.jobs.clear()
+            for queue in self.queues.values():
+                queue.clear()
+            self.condition.notify_all()
+
+    def take(self, priority):
+        """Remove and return the first queued file of a priority that is not held, or None"""
+        queue = self.queues[priority]
+        for job in queue:
+            if not job.held:
+                queue.remove(job)
+                return job
+        return None
+
+    def next_job(self, interactive_only=False):
+        """Wait for the next file to run, None once the batch is finished
+
+        Workers of the reserved slot pass interactive_only and never take
+        bulk files.
+        """
+        with self.condition:
+            while True:
+                job = self.take(INTERACTIVE)
+                if job is None and not interactive_only and not self.paused:
+                    job = self.take(BULK)
+                if job is not None:
+                    del self.jobs[job.file_path]
+                    self.started.add(job.file_path)
+                    self.running += 1
+                    return job
+
+                if not self.jobs and not self.running:
+                    self.finished = True
+                    self.condition.notify_all()
+                    return None
+                self.condition.wait()
+
+    def job_done(self):
+        """Count a job taken with next_job as finished"""
+        with self.condition:
+            self.running -= 1
+            self.condition.notify_all()
+
+    def counts(self):
+        """Get the number of queued, held and running files"""
+        with self.condition:
+            held = sum(1 for job in self.jobs.values() if job.held)
+            return {"queued": len(self.jobs) - held, "held": held, "running": self.running}
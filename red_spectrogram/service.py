@@ -0,0 +1,274 @@
+"""Local HTTP spectrogram service
+
+Other tools get spectrograms on demand from a running service:
+
+    GET  /spectrogram?file=PATH&type=full|zoom&width=2000&zoom_start=1:00
+    POST /spectrogram  {"file": PATH, "type": "zoom", "zoom_start": "50%"}
+    GET  /status
+
+The settings of a request use the parameter names of the command line
+(width, height, z_range, window_type, zoom_width, ... zoom_duration), the
+others come from the DEFAULT and ZOOM sections of the configuration. The
+response is the image itself. Renders run on a bounded pool of threads:
+
+- identical requests that arrive while one is rendering share its result,
+- the most recent images are kept in a cache folder and served from there,
+- when queue_size renders are waiting or running, new work is refused
+  with 503 and Retry-After instead of queueing without limit.
+"""
+import os
+import json
+import shutil
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from .archives import source_stat, split_member_path
+from .cache import parameters_hash, FULL_PARAMETERS, ZOOM_PARAMETERS, ENCODE_PARAMETERS
+from .engine import SpectrogramEngine, validate_parameters
+from .zoom import split_zoom_starts
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8650
+
+# Settings a request may override
+REQUEST_SETTINGS = ["backend", "width", "height", "z_range", "window_type", "pooling",
+                    "zoom_width", "zoom_height", "zoom_z_range", "zoom_window_type", "zoom_start", "zoom_duration",
+                    "output_format", "compress_level"]
+
+# Images kept in the result cache
+DEFAULT_CACHE_SIZE = 256
+
+# Largest accepted POST body, a job is a handful of fields
+MAX_BODY_BYTES = 64 * 1024
+
+CONTENT_TYPES = {".png": "image/png", ".webp": "image/webp"}
+
+
+class ServiceError(Exception):
+    """Raised to answer a request with an HTTP error status"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class SpectrogramService:
+    """Render queue with request coalescing, a result cache and admission control"""
+
+    def __init__(self, params, workers, queue_size=None, cache_size=DEFAULT_CACHE_SIZE, cache_folder=None):
+        self.params = params
+        self.workers = workers
+        self.queue_size = queue_size or workers * 4
+        self.cache_size = cache_size
+        self.cache_folder = cache_folder or tempfile.mkdtemp(prefix="red-spectrogram-service-")
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.Lock()
+        # Render key -> future of the render in progress
+        self.inflight = {}
+        # Render key -> image path, least recently used first
+        self.results = OrderedDict()
+        # Renders queued or running
+        self.pending = 0
+        self.counters = {"requests": 0, "rendered": 0, "cache_hits": 0, "coalesced": 0, "rejected": 0, "failed": 0}
+
+    def job(self, fields):
+        """Check the fields of a request, return (file path, type, parameters)"""
+        file_path = fields.get("file")
+        if not file_path:
+            raise ServiceError(400, "Missing file")
+        file_path = os.path.abspath(file_path)
+        archive = split_member_path(file_path)
+        if not os.path.isfile(archive[0] if archive else file_path):
+            raise ServiceError(404, f"No such file: {file_path}")
+
+        kind = fields.get("type", "full")
+        if kind not in ("full", "zoom"):
+            raise ServiceError(400, "type must be full or zoom")
+
+        unknown = sorted(set(fields) - set(REQUEST_SETTINGS) - {"file", "type"})
+        if unknown:
+            raise ServiceError(400, f"Unknown settings: {', '.join(unknown)}")
+
+        params = dict(self.params, normal=kind == "full", zoom=kind == "zoom", pyramid=False, matrix=False, incremental=False, job_log=False)
+        params.update({key: str(fields[key]) for key in REQUEST_SETTINGS if key in fields})
+
+        errors, _ = validate_parameters(params)
+        if kind == "zoom" and len(split_zoom_starts(params["zoom_start"])) != 1:
+            errors.append("A request renders one zoom window, give a single zoom_start")
+        if errors:
+            raise ServiceError(400, errors[0].replace("\n", " "))
+
+        return file_path, kind, params
+
+    def render_key(self, file_path, kind, params):
+        """Hash everything the image depends on, including the state of the source file"""
+        stat = source_stat(file_path)
+        keys = (FULL_PARAMETERS if kind == "full" else ZOOM_PARAMETERS) + ENCODE_PARAMETERS + ["pooling"]
+        source = {"file": os.path.normcase(file_path), "size": stat.st_size, "mtime": stat.st_mtime_ns, "type": kind}
+        return parameters_hash(dict(params, **source), keys + list(source))
+
+    def get(self, fields):
+        """Get the path of the image for a request, rendering it unless it is cached or already rendering"""
+        file_path, kind, params = self.job(fields)
+        key = self.render_key(file_path, kind, params)
+
+        submitted = False
+        with self.lock:
+            self.counters["requests"] += 1
+            path = self.results.get(key)
+            if path and os.path.exists(path):
+                self.results.move_to_end(key)
+                self.counters["cache_hits"] += 1
+                return path
+
+            future = self.inflight.get(key)
+            if future is not None:
+                self.counters["coalesced"] += 1
+            else:
+                if self.pending >= self.queue_size:
+                    self.counters["rejected"] += 1
+                    raise ServiceError(503, f"Render queue is full ({self.pending} renders)")
+                self.pending += 1
+                future = self.executor.submit(self.render, key, file_path, params)
+                self.inflight[key] = future
+                submitted = True
+
+        # Outside the lock, a render that is already done runs render_done on this thread
+        if submitted:
+            future.add_done_callback(lambda done, key=key: self.render_done(key, done))
+        return future.result()
+
+    def render(self, key, file_path, params):
+        """Render one image into its own folder of the cache, return its path"""
+        output_folder = os.path.join(self.cache_folder, key)
+        engine = SpectrogramEngine(dict(params, output_folder=output_folder))
+        if params["zoom"]:
+            error = engine.zoom_window_error(engine.track_duration(file_path))
+            if error:
+                raise ServiceError(422, error)
+
+        engine.open_cache()
+        result = engine.process_file(file_path)
+        if result["status"] != "ok" or not result["outputs"]:
+            shutil.rmtree(output_folder, ignore_errors=True)
+            raise ServiceError(500, result["error"] or f"Could not render {file_path}")
+        return result["outputs"][0]
+
+    def render_done(self, key, future):
+        """Move a finished render from the queue to the result cache"""
+        evicted = []
+        with self.lock:
+            self.pending -= 1
+            self.inflight.pop(key, None)
+            if future.exception() is not None:
+                self.counters["failed"] += 1
+                return
+
+            self.counters["rendered"] += 1
+            self.results[key] = future.result()
+            while len(self.results) > self.cache_size:
+                evicted.append(self.results.popitem(last=False)[0])
+
+        for old_key in evicted:
+            shutil.rmtree(os.path.join(self.cache_folder, old_key), ignore_errors=True)
+
+    def status(self):
+        """Describe the queue and the cache"""
+        with self.lock:
+            return dict(self.counters, workers=self.workers, queue_size=self.queue_size, pending=self.pending,
+                        cached=len(self.results), cache_size=self.cache_size)
+
+    def close(self):
+        """Wait for the running renders and remove the cache folder"""
+        self.executor.shutdown(wait=True)
+        shutil.rmtree(self.cache_folder, ignore_errors=True)
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """HTTP front end of a SpectrogramService"""
+
+    server_version = "red-spectrogram"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == "/status":
+            self.send_json(200, self.server.service.status())
+        elif url.path == "/spectrogram":
+            fields = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            self.answer(fields)
+        else:
+            self.send_json(404, {"error": f"Unknown path: {url.path}"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/spectrogram":
+            self.send_json(404, {"error": f"Unknown path: {url.path}"})
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            self.send_json(413, {"error": "Request body is too large"})
+            return
+        try:
+            fields = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(fields, dict):
+                raise ValueError("expected a JSON object")
+        except ValueError as e:
+            self.send_json(400, {"error": f"Invalid JSON: {e}"})
+            return
+        self.answer(fields)
+
+    def answer(self, fields):
+        """Render or look up the image of a request and send it"""
+        try:
+            path = self.server.service.get(fields)
+        except ServiceError as e:
+            self.send_json(e.status, {"error": str(e)})
+            return
+        except Exception as e:
+            logger.exception("Render failed")
+            self.send_json(500, {"error": str(e)})
+            return
+
+        try:
+            f = open(path, "rb")
+        except OSError:
+            # Evicted from the cache in the meantime
+            self.send_json(503, {"error": "The image was evicted from the cache, try again"})
+            return
+
+        with f:
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPES.get(os.path.splitext(path)[1], "application/octet-stream"))
+            self.send_header("Content-Length", str(os.fstat(f.fileno()).st_size))
+            self.send_header("Content-Disposition", f'inline; filename="{os.path.basename(path)}"')
+            self.end_headers()
+            shutil.copyfileobj(f, self.wfile, 64 * 1024)
+
+    def send_json(self, status, data):
+        """Send a JSON response"""
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 503:
+            self.send_header("Retry-After", "1")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.info(f"{self.address_string()} {format % args}")
+
+
+def create_server(service, host="127.0.0.1", port=DEFAULT_PORT):
+    """Create the HTTP server of a service, call serve_forever() to run it"""
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
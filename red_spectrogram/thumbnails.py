@@ -0,0 +1,183 @@
+"""Spectrogram thumbnails for the in-app browser
+
+Thumbnails are downscaled with Pillow on background threads, stored in a
+thumbnail folder inside the output folder and kept in a memory-bounded
+LRU, so scrolling through thousands of spectrograms never loads the
+full-size images twice.
+"""
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+from .pyramid import TilePyramid, is_pyramid_index
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_FOLDER_NAME = ".red-spectrogram-thumbnails"
+
+# Bounding box of a thumbnail, spectrograms are much wider than tall
+THUMBNAIL_SIZE = (300, 100)
+
+# Upper bound for the decoded thumbnails kept in memory
+MEMORY_LIMIT = 64 * 1024 * 1024
+
+
+class ThumbnailCache:
+    """Downscaled images on disk and in a memory-bounded LRU"""
+
+    def __init__(self, cache_folder, memory_limit=MEMORY_LIMIT):
+        self.cache_folder = cache_folder
+        self.memory_limit = memory_limit
+        # (path, mtime_ns, size) -> PIL image, least recently used first
+        self.images = OrderedDict()
+        self.memory_used = 0
+        self.lock = threading.Lock()
+
+    def key(self, path, size):
+        """Get the cache key of an image at its current modification time"""
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        return (path, mtime, tuple(size))
+
+    def disk_path(self, key):
+        """Get the path of the thumbnail file for a cache key"""
+        path, mtime, (width, height) = key
+        digest = hashlib.sha1(f"{os.path.abspath(path)}|{mtime}|{width}x{height}".encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_folder, digest[:2], digest + ".png")
+
+    def get(self, path, size=THUMBNAIL_SIZE):
+        """Get a thumbnail from memory, or None when it has not been loaded yet"""
+        key = self.key(path, size)
+        with self.lock:
+            image = self.images.get(key)
+            if image is not None:
+                self.images.move_to_end(key)
+            return image
+
+    def put(self, key, image):
+        """Keep an image in memory, evicting the least recently used ones over the limit"""
+        with self.lock:
+            if key in self.images:
+                return
+            self.images[key] = image
+            self.memory_used += image_bytes(image)
+            while self.memory_used > self.memory_limit and len(self.images) > 1:
+                _, evicted = self.images.popitem(last=False)
+                self.memory_used -= image_bytes(evicted)
+
+    def load(self, path, size=THUMBNAIL_SIZE, persist=True):
+        """Get a thumbnail from memory, disk or by downscaling the image (slow, call off the UI thread)"""
+        key = self.key(path, size)
+        if key is None:
+            return None
+
+        with self.lock:
+            image = self.images.get(key)
+            if image is not None:
+                self.images.move_to_end(key)
+                return image
+
+        disk_path = self.disk_path(key)
+        image = None
+        if persist and os.path.exists(disk_path):
+            try:
+                with Image.open(disk_path) as cached:
+                    image = cached.convert("RGB")
+            except OSError:
+                image = None
+
+        if image is None:
+            image = make_thumbnail(path, size)
+            if image is None:
+                return None
+            if persist:
+                self.save_to_disk(disk_path, image)
+
+        self.put(key, image)
+        return image
+
+    def save_to_disk(self, disk_path, image):
+        """Write a thumbnail atomically, so a crash never leaves a truncated file"""
+        try:
+            os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+            temp_path = f"{disk_path}.{threading.get_ident()}.tmp"
+            image.save(temp_path, "PNG")
+            os.replace(temp_path, disk_path)
+        except OSError as e:
+            logger.warning(f"Could not save thumbnail {disk_path}: {e}")
+
+
+def image_bytes(image):
+    """Get the memory used by the pixels of an image"""
+    return image.width * image.height * len(image.getbands())
+
+
+def make_thumbnail(path, size):
+    """Downscale an image to fit in size, or None when it cannot be read
+
+    A tile pyramid is shown by the tile of its coarsest level.
+    """
+    try:
+        if is_pyramid_index(path):
+            path = TilePyramid(path).overview_path()
+        with Image.open(path) as image:
+            image = image.convert("RGB")
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Could not read {path}: {e}")
+        return None
+
+    # reducing_gap makes Pillow shrink by an integer factor first, much faster on wide images
+    image.thumbnail(size, Image.LANCZOS, reducing_gap=2.0)
+    return image
+
+
+class ThumbnailLoader:
+    """Load thumbnails on background threads, most recently requested first
+
+    want() replaces the pending requests, so only the thumbnails that are
+    currently visible get loaded while the user scrolls. Loaded paths are
+    passed to on_loaded(path, size) on the loader thread.
+    """
+
+    def __init__(self, cache, on_loaded, workers=2):
+        self.cache = cache
+        self.on_loaded = on_loaded
+        self.pending = []
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.threads = [threading.Thread(target=self.run, daemon=True) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def want(self, requests):
+        """Replace the pending requests with (path, size, persist) tuples"""
+        with self.condition:
+            # Pop from the end, so keep the first request last
+            self.pending = list(reversed(requests))
+            self.condition.notify_all()
+
+    def stop(self):
+        """Stop the loader threads"""
+        with self.condition:
+            self.stopped = True
+            self.pending = []
+            self.condition.notify_all()
+
+    def run(self):
+        """Load the pending thumbnails until stopped"""
+        while True:
+            with self.condition:
+                while not self.pending and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                path, size, persist = self.pending.pop()
+
+            if self.cache.load(path, size, persist) is not None:
+                self.on_loaded(path, size)
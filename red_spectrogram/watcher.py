@@ -0,0 +1,296 @@
+"""Watch folders and generate spectrograms for new FLAC files
+
+Uses inotify on Linux and falls back to polling elsewhere. A file is only
+queued once its size and mtime have stopped changing for a while, so files
+that are still being copied are not picked up half-written.
+"""
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import logging
+import threading
+import ctypes
+import ctypes.util
+from concurrent.futures import ThreadPoolExecutor
+
+from .scanner import AUDIO_EXTENSIONS, iter_audio_files
+
+logger = logging.getLogger(__name__)
+
+# inotify event flags (see inotify(7))
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF | IN_MOVE_SELF
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def is_audio_file(path):
+    """Check if a path has one of the supported audio extensions"""
+    return path.lower().endswith(AUDIO_EXTENSIONS)
+
+
+class PollingWatcher:
+    """Detect new and changed files by rescanning the folders periodically"""
+
+    def __init__(self, folders, interval=10.0):
+        self.folders = folders
+        self.interval = interval
+        self.next_scan = 0.0
+        # path -> (size, mtime) of every file seen in the watched folders
+        self.known = {}
+
+    def poll(self, timeout):
+        """Wait up to timeout seconds and return the paths that appeared or changed"""
+        now = time.monotonic()
+        if now < self.next_scan:
+            time.sleep(min(timeout, self.next_scan - now))
+            return []
+
+        self.next_scan = time.monotonic() + self.interval
+        return self.rescan()
+
+    def rescan(self):
+        """Scan all folders and return the paths that appeared or changed"""
+        changed = []
+        seen = {}
+        for folder in self.folders:
+            for path in iter_audio_files(folder, recursive=True):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                seen[path] = (stat.st_size, stat.st_mtime_ns)
+                if self.known.get(path) != seen[path]:
+                    changed.append(path)
+
+        # Forget deleted files so memory follows the folder contents
+        self.known = seen
+        return changed
+
+    def close(self):
+        """Nothing to release for polling"""
+
+
+class InotifyWatcher:
+    """Detect new and changed files with Linux inotify, watching folders recursively"""
+
+    def __init__(self, folders):
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self.folders = folders
+        # watch descriptor -> folder path
+        self.watches = {}
+        self.pending = []
+        for folder in folders:
+            self.add_tree(folder)
+
+    def add_watch(self, folder):
+        """Watch one folder"""
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(folder), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error == errno.ENOSPC:
+                logger.warning("inotify watch limit reached, raise fs.inotify.max_user_watches")
+            logger.warning(f"Cannot watch {folder}: {os.strerror(error)}")
+            return
+        self.watches[wd] = folder
+
+    def add_tree(self, folder):
+        """Watch a folder and all its subfolders, reporting the audio files already there"""
+        self.add_watch(folder)
+        for current, subfolders, names in os.walk(folder):
+            for name in subfolders:
+                self.add_watch(os.path.join(current, name))
+            for name in names:
+                if is_audio_file(name):
+                    self.pending.append(os.path.join(current, name))
+
+    def rescan(self):
+        """Report every audio file again, used after the event queue overflowed"""
+        changed = []
+        for folder in self.folders:
+            changed.extend(iter_audio_files(folder, recursive=True))
+        return changed
+
+    def poll(self, timeout):
+        """Wait up to timeout seconds and return the paths that appeared or changed"""
+        changed, self.pending = self.pending, []
+        if changed:
+            return changed
+
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+            offset += EVENT_HEADER.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                logger.warning("inotify event queue overflowed, rescanning watched folders")
+                changed.extend(self.rescan())
+                continue
+
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+
+            folder = self.watches.get(wd)
+            if folder is None or not name:
+                continue
+
+            path = os.path.join(folder, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # New album folder: watch it and pick up what was copied before the watch existed
+                    self.add_tree(path)
+                    changed.extend(self.pending)
+                    self.pending = []
+            elif is_audio_file(path):
+                changed.append(path)
+
+        return changed
+
+    def close(self):
+        """Release the inotify descriptor"""
+        os.close(self.fd)
+
+
+def create_watcher(folders, use_inotify=True, poll_interval=10.0):
+    """Create an inotify watcher on Linux, or a polling watcher"""
+    if use_inotify and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(folders)
+        except (OSError, AttributeError) as e:
+            logger.warning(f"inotify is not available ({e}), falling back to polling")
+    return PollingWatcher(folders, poll_interval)
+
+
+class Debouncer:
+    """Track files until their size and mtime stay unchanged for settle seconds"""
+
+    def __init__(self, settle=5.0):
+        self.settle = settle
+        # path -> (size, mtime, time of the last change)
+        self.pending = {}
+
+    def touch(self, path):
+        """Note that a file appeared or changed"""
+        self.pending.setdefault(path, (None, None, time.monotonic()))
+
+    def ready(self):
+        """Return the files that stopped changing and forget them"""
+        now = time.monotonic()
+        ready = []
+
+        for path, (size, mtime, changed_at) in list(self.pending.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # Deleted or renamed before it settled
+                del self.pending[path]
+                continue
+
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime):
+                self.pending[path] = (stat.st_size, stat.st_mtime_ns, now)
+            elif now - changed_at >= self.settle:
+                del self.pending[path]
+                ready.append(path)
+
+        return ready
+
+    def __len__(self):
+        return len(self.pending)
+
+
+class WatchService:
+    """Feed settled files from watched folders into the spectrogram engine"""
+
+    def __init__(self, engine, folders, settle=5.0, use_inotify=True, poll_interval=10.0, on_result=None):
+        self.engine = engine
+        self.folders = [os.path.abspath(folder) for folder in folders]
+        self.debouncer = Debouncer(settle)
+        self.watcher = create_watcher(self.folders, use_inotify, poll_interval)
+        self.on_result = on_result
+        self.stop_event = threading.Event()
+
+        # Bound the number of submitted jobs, the rest waits in the debouncer
+        self.slots = threading.Semaphore(engine.params["workers"] * 2)
+        # Files that are settled but wait for a free slot
+        self.ready = []
+
+    def stop(self):
+        """Ask the service to stop"""
+        self.stop_event.set()
+
+    def job_done(self, future):
+        """Report a finished job and free its slot"""
+        self.slots.release()
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.error(f"Watch job failed: {e}")
+            return
+        if self.on_result:
+            self.on_result(result)
+
+    def save_state(self):
+        """Save the manifest, the failure counts of the quarantine and the metadata cache"""
+        if self.engine.cache:
+            self.engine.cache.save()
+        if self.engine.quarantine:
+            self.engine.quarantine.save()
+        if self.engine.metadata:
+            self.engine.metadata.save()
+
+    def run(self):
+        """Watch until stop() is called"""
+        engine = self.engine
+        engine.prepare_output()
+        last_save = time.monotonic()
+        logger.info(f"Watching {', '.join(self.folders)} with {type(self.watcher).__name__}")
+
+        with ThreadPoolExecutor(max_workers=engine.params["workers"]) as executor:
+            try:
+                while not self.stop_event.is_set():
+                    for path in self.watcher.poll(0.5):
+                        self.debouncer.touch(path)
+
+                    self.ready.extend(self.debouncer.ready())
+                    while self.ready and self.slots.acquire(blocking=False):
+                        future = executor.submit(engine.process_file, self.ready.pop(0), time.monotonic())
+                        future.add_done_callback(self.job_done)
+
+                    # Persist the manifest, the quarantine and the metadata regularly, the service may run for weeks
+                    if time.monotonic() - last_save > 60:
+                        self.save_state()
+                        last_save = time.monotonic()
+            finally:
+                self.watcher.close()
+                # The jobs still running count in what is saved
+                executor.shutdown(wait=True)
+                self.save_state()
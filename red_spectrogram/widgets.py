@@ -0,0 +1,100 @@
+"""Tk widgets of the graphical interface
+
+Only red-spectrogram.py imports this module, the command-line mode and the
+engine never load Tk. The thumbnail browser, which needs Pillow, is in
+browser.py so it is only imported when its tab is first shown.
+"""
+import tkinter as tk
+import tkinter.font as tkfont
+from tkinter import ttk
+
+
+class VirtualList(ttk.Frame):
+    """Listbox that only holds the rows in view
+
+    Tk listboxes get slow with hundreds of thousands of items, so the items
+    stay in a Python list and the listbox is refilled with the visible
+    slice whenever it scrolls or the items change.
+    """
+
+    def __init__(self, parent, on_activate=None, height=6, width=70):
+        super().__init__(parent)
+        self.on_activate = on_activate
+        self.items = []
+        self.top = 0
+        self.selected = None
+
+        self.listbox = tk.Listbox(self, height=height, width=width, exportselection=False, activestyle="none")
+        self.listbox.pack(side=tk.LEFT, fill="both", expand=True, padx=5, pady=5)
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill="y")
+
+        self.listbox.bind("<Configure>", lambda event: self.render())
+        self.listbox.bind("<<ListboxSelect>>", self.select)
+        self.listbox.bind("<Double-1>", self.activate)
+        self.listbox.bind("<MouseWheel>", lambda event: self.scroll(-1 if event.delta > 0 else 1, 3))
+        self.listbox.bind("<Button-4>", lambda event: self.scroll(-1, 3))
+        self.listbox.bind("<Button-5>", lambda event: self.scroll(1, 3))
+
+    def set_items(self, items):
+        """Show a new list of items, keeping the selected item when it is still there"""
+        self.items = items
+        if self.selected is not None and self.selected not in items:
+            self.selected = None
+        self.render()
+
+    def selected_item(self):
+        """Get the selected item, or None"""
+        return self.selected
+
+    def visible_rows(self):
+        """Get the number of rows that fit in the listbox"""
+        # Tk draws each line with the font line spacing, one pixel and the selection border
+        line_height = tkfont.Font(font=self.listbox.cget("font")).metrics("linespace") + 1 + 2 * int(self.listbox.cget("selectborderwidth"))
+        border = 2 * (int(self.listbox.cget("borderwidth")) + int(self.listbox.cget("highlightthickness")))
+        return max(1, (self.listbox.winfo_height() - border) // line_height)
+
+    def render(self):
+        """Fill the listbox with the items in view"""
+        rows = self.visible_rows()
+        self.top = max(0, min(self.top, len(self.items) - rows))
+        visible = self.items[self.top:self.top + rows]
+
+        self.listbox.delete(0, tk.END)
+        if visible:
+            self.listbox.insert(tk.END, *visible)
+        if self.selected in visible:
+            self.listbox.selection_set(visible.index(self.selected))
+
+        if self.items:
+            self.scrollbar.set(self.top / len(self.items), min(1.0, (self.top + rows) / len(self.items)))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def scroll(self, direction, count):
+        """Scroll by count rows up (-1) or down (1)"""
+        self.top += direction * count
+        self.render()
+
+    def yview(self, *args):
+        """Scroll from the scrollbar"""
+        if args[0] == "moveto":
+            self.top = int(float(args[1]) * len(self.items))
+        elif args[0] == "scroll":
+            count = int(args[1])
+            if args[2] == "pages":
+                count *= self.visible_rows()
+            self.top += count
+        self.render()
+
+    def select(self, event=None):
+        """Remember the selected item, the listbox forgets it when it scrolls"""
+        selection = self.listbox.curselection()
+        if selection:
+            self.selected = self.items[self.top + selection[0]]
+
+    def activate(self, event=None):
+        """Open the double-clicked item"""
+        self.select()
+        if self.selected is not None and self.on_activate:
+            self.on_activate(self.selected)
@@ -0,0 +1,144 @@
+"""Zoom window positions
+
+The zoom start setting is a comma-separated list of positions:
+
+- "1:30": an absolute time (M:SS)
+- "50%": a fraction of the track
+- "end-0:10": a time before the end of the track
+- "every 2:00": a window every two minutes from the start
+
+All windows share the zoom duration. A single window keeps the original
+"{file_name}_zoom.png" output name, several windows are named after their
+position, e.g. "{file_name}_zoom_50pct.png".
+"""
+import re
+import math
+
+TIME_PATTERN = r"\d+:\d{2}"
+PERCENT_PATTERN = re.compile(r"^(\d+(?:\.\d+)?)%$")
+END_PATTERN = re.compile(rf"^end-({TIME_PATTERN})$")
+EVERY_PATTERN = re.compile(rf"^every ({TIME_PATTERN})$")
+
+# Upper bound for the windows of one file, protects against tiny "every" steps on long files
+MAX_WINDOWS = 100
+
+
+def validate_time_format(time_str):
+    """Validate the time format (M:SS)"""
+    pattern = r"^\d+:\d{2}$"
+    return bool(re.match(pattern, time_str))
+
+
+def parse_time(time_str):
+    """Convert a time in M:SS (or plain seconds) to seconds"""
+    if ":" in time_str:
+        minutes, seconds = time_str.split(":", 1)
+        return int(minutes) * 60 + float(seconds)
+    return float(time_str)
+
+
+def format_time(seconds):
+    """Format seconds as M:SS, with decimals for short spans"""
+    minutes = int(seconds // 60)
+    rest = seconds - minutes * 60
+    if abs(rest - round(rest)) < 1e-6:
+        return f"{minutes}:{int(round(rest)):02d}"
+    return f"{minutes}:{rest:05.2f}"
+
+
+def nice_step(span, max_ticks):
+    """Get a round tick spacing so that span is divided into at most max_ticks parts"""
+    raw = span / max(max_ticks, 1)
+    magnitude = 10 ** math.floor(math.log10(raw)) if raw > 0 else 1
+    for factor in (1, 2, 5, 10):
+        if raw <= factor * magnitude:
+            return factor * magnitude
+    return 10 * magnitude
+
+
+def split_zoom_starts(value):
+    """Split the zoom start setting into its positions, without duplicates"""
+    specs = []
+    for spec in value.split(","):
+        spec = " ".join(spec.strip().lower().split())
+        if spec and spec not in specs:
+            specs.append(spec)
+    return specs
+
+
+def validate_zoom_start(spec):
+    """Check that a zoom position uses one of the supported forms"""
+    if validate_time_format(spec) or END_PATTERN.match(spec):
+        return True
+    every = EVERY_PATTERN.match(spec)
+    if every:
+        return parse_time(every.group(1)) > 0
+    percent = PERCENT_PATTERN.match(spec)
+    return bool(percent) and float(percent.group(1)) <= 100
+
+
+def is_absolute(spec):
+    """Check if a zoom position does not depend on the track duration"""
+    return validate_time_format(spec)
+
+
+def has_multiple_windows(specs):
+    """Check if the positions can produce more than one window per file"""
+    return len(specs) > 1 or any(EVERY_PATTERN.match(spec) for spec in specs)
+
+
+def expand_zoom_starts(specs, total_duration):
+    """Replace the "every" positions with the absolute positions they cover in a track"""
+    expanded = []
+    for spec in specs:
+        every = EVERY_PATTERN.match(spec)
+        if not every:
+            if spec not in expanded:
+                expanded.append(spec)
+            continue
+
+        if not total_duration:
+            raise ValueError(f"Cannot place the zoom windows '{spec}': unknown track duration")
+        step = parse_time(every.group(1))
+        position = 0.0
+        while position < total_duration and len(expanded) < MAX_WINDOWS:
+            absolute = format_time(position)
+            if absolute not in expanded:
+                expanded.append(absolute)
+            position += step
+
+    return expanded
+
+
+def resolve_zoom_start(spec, total_duration, duration):
+    """Get the start in seconds of a zoom position in a track
+
+    Relative windows are moved back so they end at the end of the track,
+    "100%" shows the last seconds rather than nothing.
+    """
+    if is_absolute(spec):
+        return parse_time(spec)
+
+    if not total_duration:
+        raise ValueError(f"Cannot place the zoom window '{spec}': unknown track duration")
+
+    percent = PERCENT_PATTERN.match(spec)
+    end = END_PATTERN.match(spec)
+    if percent:
+        start = total_duration * float(percent.group(1)) / 100
+    elif end:
+        start = total_duration - parse_time(end.group(1))
+    else:
+        raise ValueError(f"Invalid zoom position: {spec}")
+
+    return max(0.0, min(start, total_duration - duration))
+
+
+def zoom_label(spec):
+    """Get the part of the output name that identifies a zoom position"""
+    return spec.replace(":", "-").replace("%", "pct").replace(" ", "_")
+
+
+def zoom_kind(spec, multiple):
+    """Get the cache kind of a zoom window, "zoom" when there is only one"""
+    return f"zoom_{zoom_label(spec)}" if multiple else "zoom"